@@ -0,0 +1,335 @@
+# async_api.py
+# Written by Joel Peckham | joelskyler@gmail.com
+# Last Updated : Oct 17, 2026
+# asyncio versions of the BrickLink, Brick Owl and Shippo wrappers.
+# They have the same methods as the threaded wrappers (as coroutines), so one
+# event loop can keep hundreds of order requests in flight without a thread for
+# each. Every client holds one aiohttp session, which is one keep-alive
+# connection pool for its host. Rate limiting, retries, the response cache and
+# metrics are the same objects the threaded wrappers use, so a threaded and an
+# async client can share one host's budget by sharing a RateLimiter.
+# Needs aiohttp (and oauthlib, which requests_oauthlib already pulls in).
+
+import asyncio
+import logging
+import time
+from datetime import timezone
+from urllib.parse import urlencode
+import aiohttp
+from oauthlib.oauth1 import Client as OAuth1Client
+from yarl import URL
+from order import Order
+from marketplaces import BRICKLINK, BRICKOWL
+from jsonstream import iterJsonArray
+from ratelimit import RateLimiter, QuotaExceeded, sendWithRetryAsync
+from http_cache import CachedResponse, ResponseCache
+from metrics import DEFAULT_METRICS, parseRetryAfter
+from bricklink_api import BRICKLINK_URL, BRICKLINK_REQUESTS_PER_SECOND, BRICKLINK_DAILY_LIMIT, BRICKLINK_CACHE_TTLS
+from brickowl_api import BRICKOWL_URL, BRICKOWL_REQUESTS_PER_SECOND, BRICKOWL_CACHE_TTLS, BRICKOWL_STATUS_IDS
+from shippo_api import ShippoAPI, ShippoListingFailed, SHIPPO_URL, SHIPPO_REQUESTS_PER_SECOND, SHIPPO_PAGE_SIZE, SHIPPO_CACHE_TTLS, shippoOrderData
+
+ASYNC_CONNECTIONS = 16      # Open sockets per host. The rate limiter, not this, decides how fast we go.
+ASYNC_REQUEST_TIMEOUT = 60  # Seconds for a whole request, body included.
+
+class _AsyncClient:
+    service = None
+
+    def __init__(self, baseUrl, limiter, cache, metrics, connections) -> None:
+        self.baseUrl = baseUrl
+        self.limiter = limiter
+        self.cache = cache
+        self.metrics = metrics or DEFAULT_METRICS
+        self.connections = connections
+        self.headers = {}
+        self._session = None
+
+    def session(self):
+        # Made on first use, because aiohttp wants to be inside a running event loop.
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.connections, limit_per_host=self.connections)
+            self._session = aiohttp.ClientSession(connector=connector, headers=self.headers, timeout=aiohttp.ClientTimeout(total=ASYNC_REQUEST_TIMEOUT))
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return self
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _sign(self, method, url, headers):
+        return url, headers
+
+    async def _send(self, method, url, params=None, headers=None, json=None, data=None):
+        # One attempt. The body is read in full and handed back as a requests.Response, so the cache,
+        # the retry rules and the parsing code all work the same as they do for the threaded wrappers.
+        if params:
+            url = url + '?' + urlencode(params, doseq=True)
+        signedUrl, headers = self._sign(method, url, dict(headers or {}))
+        started = time.perf_counter()
+        try:
+            # encoded=True stops aiohttp re-quoting the URL, which would break BrickLink's signature.
+            async with self.session().request(method, URL(signedUrl, encoded=True), headers=headers, json=json, data=data) as resp:
+                content = await resp.read()
+                res = CachedResponse(str(resp.url), resp.status, dict(resp.headers), content).toResponse()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            # sendWithRetryAsync retries OSErrors, like requests' ConnectionError.
+            raise ConnectionError(f"{method} {url} failed: {e!r}") from e
+        self.metrics.observeRequest(self.service, method, url, res.status_code, time.perf_counter() - started, len(content), parseRetryAfter(res.headers.get('Retry-After')))
+        return res
+
+class AsyncBrickLinkAPI(_AsyncClient):
+    service = 'bricklink'
+
+    def __init__(self, consumer_key, consumer_secret, token, token_secret, baseUrl=BRICKLINK_URL, limiter=None, cache=None, metrics=None, connections=ASYNC_CONNECTIONS) -> None:
+        super().__init__(baseUrl,
+                         limiter or RateLimiter(BRICKLINK_REQUESTS_PER_SECOND, burst=BRICKLINK_REQUESTS_PER_SECOND, dailyLimit=BRICKLINK_DAILY_LIMIT),
+                         cache or ResponseCache(BRICKLINK_CACHE_TTLS), metrics, connections)
+        self.oauth = OAuth1Client(consumer_key, client_secret=consumer_secret, resource_owner_key=token, resource_owner_secret=token_secret)
+
+    def _sign(self, method, url, headers):
+        # A fresh nonce and timestamp for every attempt. JSON bodies aren't part of an OAuth1 signature.
+        signedUrl, headers, _ = self.oauth.sign(url, http_method=method, headers=headers)
+        return signedUrl, headers
+
+    async def _get(self, url, params=None):
+        async def send(headers):
+            return await sendWithRetryAsync(lambda: self._send('GET', url, params, headers), self.limiter)
+        return await self.cache.getAsync(url, params, send)
+
+    async def _put(self, url, body=None):
+        return await sendWithRetryAsync(lambda: self._send('PUT', url, json=body), self.limiter)
+
+    async def getAllOrders(self, statuses=None):
+        # The listing comes back whole, but it's turned into stubs one order at a time, so we never hold
+        # the parsed listing as well as the body.
+        params = {'status': ','.join(statuses)} if statuses else None
+        res = await sendWithRetryAsync(lambda: self._send('GET', f'{self.baseUrl}/orders', params), self.limiter)
+        if res.status_code != 200:
+            logging.warning("BrickLink order listing failed: %s %s", res.status_code, res.text)
+            return []
+        return list(BRICKLINK.listingStubs(iterJsonArray([res.content], key='data')))
+
+    async def _getOrderData(self, order_id):
+        res = await self._get(f'{self.baseUrl}/orders/{order_id}')
+        if res.status_code == 200:
+            return res.json()['data']
+        else:
+            return None
+
+    async def getOrderDetails(self, order_id):
+        orderData, items = await asyncio.gather(self._getOrderData(order_id), self._getItemData(order_id))
+        if orderData is not None:
+            return BRICKLINK.normalizeOrders([orderData], [items])[0]
+        else:
+            return None
+
+    async def getOrderDetailsBatch(self, order_ids):
+        # Every order at once; the connection pool and the rate limiter keep it polite.
+        # The orders are normalized together once everything has arrived.
+        # Once the daily quota is used up, the rest are left out, and a later run picks them up.
+        fetched = await asyncio.gather(*(self._getOrderAndItems(i) for i in order_ids))
+        if None in fetched:
+            logging.warning("BrickLink's daily quota is used up; %d orders are left for a later run.", fetched.count(None))
+        fetched = [(orderData, items) for orderData, items in filter(None, fetched) if orderData is not None]
+        return BRICKLINK.normalizeOrders([orderData for orderData, _ in fetched], [items for _, items in fetched])
+
+    async def _getOrderAndItems(self, order_id):
+        # The raw order and items, or None once the daily quota is used up.
+        try:
+            return await asyncio.gather(self._getOrderData(order_id), self._getItemData(order_id))
+        except QuotaExceeded:
+            return None
+
+    async def _getItemData(self, order_id):
+        res = await self._get(f'{self.baseUrl}/orders/{order_id}/items')
+        if res.status_code == 200:
+            return res.json()['data'][0]
+        else:
+            return []
+
+    async def getOrderItems(self, order_id):
+        return BRICKLINK.normalizeItems([await self._getItemData(order_id)])[0]
+
+    async def shipped(self, order_id):
+        res = await self._put(f'{self.baseUrl}/orders/{order_id}/status', body={"field": "status", "value": "SHIPPED"})
+        self.cache.invalidate(f'{self.baseUrl}/orders/{order_id}')
+        return res.status_code == 200
+
+    async def trackPackage(self, order_id, tracking_number):
+        res = await self._put(f'{self.baseUrl}/orders/{order_id}', body={"shipping": {"tracking_no": tracking_number}})
+        self.cache.invalidate(f'{self.baseUrl}/orders/{order_id}')
+        return res.status_code == 200
+
+class AsyncBrickOwlAPI(_AsyncClient):
+    service = 'brickowl'
+
+    def __init__(self, api_key, baseUrl=BRICKOWL_URL, limiter=None, cache=None, metrics=None, connections=ASYNC_CONNECTIONS) -> None:
+        super().__init__(baseUrl,
+                         limiter or RateLimiter(BRICKOWL_REQUESTS_PER_SECOND, burst=BRICKOWL_REQUESTS_PER_SECOND),
+                         cache or ResponseCache(BRICKOWL_CACHE_TTLS), metrics, connections)
+        self.keyParam = {
+            'key': api_key
+        }
+
+    async def _get(self, url, params=None):
+        async def send(headers):
+            keyedParams = dict(params or {})
+            keyedParams.update(self.keyParam)
+            return await sendWithRetryAsync(lambda: self._send('GET', url, keyedParams, headers), self.limiter)
+        # The cache key leaves out the API key.
+        return await self.cache.getAsync(url, params, send)
+
+    async def _post(self, url, data=None):
+        bodyData = dict(data or {})
+        bodyData.update(self.keyParam)
+        return await sendWithRetryAsync(lambda: self._send('POST', url, data=bodyData), self.limiter)
+
+    async def getAllOrders(self, statuses=None):
+        # Brick Owl only takes one status per request, so the statuses are listed side by side.
+        url = f"{self.baseUrl}/order/list"
+        baseParams = {'limit': 1000000, 'list_type': 'store'}
+        if not statuses:
+            return await self._getOrders(url, baseParams)
+        listings = await asyncio.gather(*(self._getOrders(url, dict(baseParams, status=BRICKOWL_STATUS_IDS[s])) for s in statuses))
+        return [stub for listing in listings for stub in listing]
+
+    async def _getOrders(self, url, params):
+        keyedParams = dict(params, **self.keyParam)
+        res = await sendWithRetryAsync(lambda: self._send('GET', url, keyedParams), self.limiter)
+        if res.status_code != 200:
+            logging.warning("Brick Owl order listing failed: %s %s", res.status_code, res.text)
+            return []
+        return list(BRICKOWL.listingStubs(iterJsonArray([res.content])))
+
+    async def _getOrderData(self, order_id):
+        response = await self._get(f"{self.baseUrl}/order/view", params={'order_id': order_id})
+        if response.status_code == 200:
+            return response.json()
+        else:
+            return None
+
+    async def getOrderDetails(self, order_id):
+        orderData, items = await asyncio.gather(self._getOrderData(order_id), self._getItemData(order_id))
+        if orderData is not None:
+            return BRICKOWL.normalizeOrders([orderData], [items])[0]
+        else:
+            return None
+
+    async def getOrderDetailsBatch(self, order_ids):
+        fetched = await asyncio.gather(*(asyncio.gather(self._getOrderData(i), self._getItemData(i)) for i in order_ids))
+        fetched = [(orderData, items) for orderData, items in fetched if orderData is not None]
+        return BRICKOWL.normalizeOrders([orderData for orderData, _ in fetched], [items for _, items in fetched])
+
+    async def _getItemData(self, order_id):
+        response = await self._get(f"{self.baseUrl}/order/items", params={'order_id': order_id})
+        if response.status_code == 200:
+            return response.json()
+        else:
+            return []
+
+    async def getOrderItems(self, order_id):
+        return BRICKOWL.normalizeItems([await self._getItemData(order_id)])[0]
+
+    async def shipped(self, order_id):
+        response = await self._post(f"{self.baseUrl}/order/set_status", data={'order_id': order_id, 'status_id': '5'})
+        self.cache.invalidate(f"{self.baseUrl}/order/view", {'order_id': order_id})
+        if response.status_code == 200:
+            return True
+        raise Exception(f"Failed to mark order {order_id} as shipped. Status: {response.status_code} {response.text} {response.url}")
+
+    async def trackPackage(self, order_id, tracking_number):
+        response = await self._post(f"{self.baseUrl}/order/tracking", data={'order_id': order_id, 'tracking_id': tracking_number})
+        self.cache.invalidate(f"{self.baseUrl}/order/view", {'order_id': order_id})
+        if response.status_code == 200:
+            return True
+        raise Exception(f"Failed to add tracking to order {order_id}. Status: {response.status_code} {response.text} {response.url}")
+
+class AsyncShippoAPI(_AsyncClient):
+    service = 'shippo'
+
+    # Parsing doesn't touch the network, so it's shared with the threaded wrapper as is.
+    parseSource = ShippoAPI.parseSource
+    parseTrackingNumber = ShippoAPI.parseTrackingNumber
+    _parseOrders = ShippoAPI._parseOrders
+
+    def __init__(self, api_key, baseUrl=SHIPPO_URL, limiter=None, cache=None, metrics=None, connections=ASYNC_CONNECTIONS) -> None:
+        super().__init__(baseUrl,
+                         limiter or RateLimiter(SHIPPO_REQUESTS_PER_SECOND, burst=SHIPPO_REQUESTS_PER_SECOND),
+                         cache or ResponseCache(SHIPPO_CACHE_TTLS), metrics, connections)
+        self.headers = {
+            "Authorization": f"ShippoToken {api_key}"
+        }
+
+    async def _get(self, url, params=None, fresh=False):
+        async def send(headers):
+            return await sendWithRetryAsync(lambda: self._send('GET', url, params, headers), self.limiter)
+        return await send(None) if fresh else await self.cache.getAsync(url, params, send)
+
+    async def _post(self, url, params=None, body=None):
+        # Creating an order isn't idempotent, so only a 429 is retried.
+        return await sendWithRetryAsync(lambda: self._send('POST', url, params, json=body), self.limiter, idempotent=False)
+
+    async def _getPage(self, url, params=None):
+        res = await self._get(url, params=params)
+        if res.status_code == 200:
+            return res.json()
+        else:
+            logging.warning("Shippo order listing failed: %s %s", res.status_code, res.text)
+            return None
+
+    async def getAllOrders(self, startDate=None, endDate=None, statuses=None, results=SHIPPO_PAGE_SIZE):
+        # Like ShippoAPI.iterOrders: once the first page gives us the count, every other page is requested at once.
+        url = f"{self.baseUrl}/orders/"
+        params = {'results': results}
+        if startDate:
+            params['start_date'] = startDate.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        if endDate:
+            params['end_date'] = endDate.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        if statuses:
+            params['order_status[]'] = list(statuses)
+
+        data = await self._getPage(url, dict(params, page=1))
+        if data is None:
+            raise ShippoListingFailed("Shippo order listing failed on page 1")
+        stubs = list(self._parseOrders(data))
+        if not data.get('next'):
+            return stubs
+        if data.get('count') is not None and data['results']:
+            pageCount = -(-data['count'] // len(data['results']))
+            pages = await asyncio.gather(*(self._getPage(url, dict(params, page=n)) for n in range(2, pageCount + 1)))
+            for page, data in enumerate(pages, 2):
+                if data is None:
+                    raise ShippoListingFailed(f"Shippo order listing failed on page {page}")
+                stubs.extend(self._parseOrders(data))
+        else:
+            # No count, so follow the 'next' links one at a time.
+            while data.get('next'):
+                data = await self._getPage(data['next'])
+                if data is None:
+                    raise ShippoListingFailed("Shippo order listing failed partway through")
+                stubs.extend(self._parseOrders(data))
+        return stubs
+
+    async def getOrder(self, objectId):
+        res = await self._get(f"{self.baseUrl}/orders/{objectId}")
+        return res.json()
+
+    async def getTrackingNumbers(self, objectIds):
+        async def fetch(objectId):
+            res = await self._get(f"{self.baseUrl}/orders/{objectId}", fresh=True)
+            return self.parseTrackingNumber(res.json()) if res.status_code == 200 else None
+        objectIds = list(objectIds)
+        trackingNumbers = await asyncio.gather(*(fetch(i) for i in objectIds))
+        return {objectId: number for objectId, number in zip(objectIds, trackingNumbers) if number}
+
+    async def addOrder(self, order: Order):
+        res = await self._post(f"{self.baseUrl}/orders", body=shippoOrderData(order))
+        if res.status_code == 201:
+            return True
+        else:
+            logging.warning("Failed to add order %s to Shippo: %s %s", order.id, res.status_code, res.text)
+            return False
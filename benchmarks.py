@@ -0,0 +1,288 @@
+# benchmarks.py
+# Written by Joel Peckham | joelskyler@gmail.com
+# Last Updated : Oct 17, 2026
+# Benchmarks for the sync pipeline. None of these touch the live APIs.
+# Usage: python benchmarks.py [name ...]   (runs everything when no name is given)
+
+import json
+import os
+import sys
+import time
+import random
+import tracemalloc
+from order import OrderStub
+from reconcile import reconcile
+from jsonstream import iterJsonArray, CHUNK_SIZE
+from ratelimit import RateLimiter
+from http_cache import ResponseCache
+import fake_servers
+
+def syntheticStubs(count, seed=0):
+    # Build matching marketplace and Shippo listings. Most orders are old and complete,
+    # a few are open, and some of the open ones have already been shipped in Shippo.
+    rng = random.Random(seed)
+    shippo, marketplace = [], []
+    for n in range(count):
+        if n % 2:
+            source, orderId = 'bricklink', str(10000000 + n)
+            openStatus, addStatus, doneStatus = 'PAID', 'PACKED', 'COMPLETED'
+        else:
+            source, orderId = 'brickowl', str(1000000 + n)
+            openStatus, addStatus, doneStatus = 'Payment Received', 'Processed', 'Shipped'
+        roll = rng.random()
+        if roll < 0.01:
+            marketplace.append(OrderStub(source, orderId, addStatus))
+        elif roll < 0.02:
+            marketplace.append(OrderStub(source, orderId, openStatus))
+            shippo.append(OrderStub(source, orderId, 'SHIPPED', f'obj{n}'))
+        else:
+            marketplace.append(OrderStub(source, orderId, doneStatus))
+            shippo.append(OrderStub(source, orderId, 'SHIPPED', f'obj{n}'))
+    return shippo, marketplace
+
+def benchReconcile(sizes=(1000, 10000, 100000, 1000000)):
+    print("reconcile: stubs per marketplace listing vs. wall time")
+    for size in sizes:
+        shippo, marketplace = syntheticStubs(size)
+        start = time.perf_counter()
+        plan = reconcile(shippo, marketplace)
+        elapsed = time.perf_counter() - start
+        print(f"  {size:>9,} stubs  {elapsed * 1000:10.1f} ms  {elapsed / size * 1e9:8.1f} ns/stub  {plan}")
+
+def benchOrderDetails(count=40, latency=0.05, max_workers=8):
+    # Serial getOrderDetails vs. getOrderDetailsBatch against local servers that sleep on every request.
+    # The APIs get a cache that caches nothing, or the batch pass would just read back what the serial one fetched.
+    from brickowl_api import BrickOwlAPI
+    from bricklink_api import BrickLinkAPI
+    os.environ.setdefault('OAUTHLIB_INSECURE_TRANSPORT', '1')   # The fake servers speak plain http.
+    print(f"order details: {count} orders, {latency * 1000:.0f} ms per request")
+    brickOwlOrders = [fake_servers.syntheticBrickOwlOrder(n) for n in range(count)]
+    brickLinkOrders = [fake_servers.syntheticBrickLinkOrder(n) for n in range(count)]
+    with fake_servers.FakeBrickOwlServer(brickOwlOrders, latency) as owl, fake_servers.FakeBrickLinkServer(brickLinkOrders, latency) as link:
+        apis = {
+            'brickowl': (BrickOwlAPI('key', baseUrl=owl.url, limiter=RateLimiter(1000, burst=100), cache=ResponseCache([])), [str(o['order_id']) for o, _ in brickOwlOrders]),
+            'bricklink': (BrickLinkAPI('ck', 'cs', 't', 'ts', baseUrl=link.url, limiter=RateLimiter(1000, burst=100), cache=ResponseCache([])), [str(o['order_id']) for o, _ in brickLinkOrders]),
+        }
+        for name, (api, ids) in apis.items():
+            start = time.perf_counter()
+            serial = [api.getOrderDetails(i) for i in ids]
+            serialTime = time.perf_counter() - start
+            start = time.perf_counter()
+            batch = api.getOrderDetailsBatch(ids, max_workers=max_workers)
+            batchTime = time.perf_counter() - start
+            assert [o.id for o in serial] == [o.id for o in batch]
+            print(f"  {name:<10} serial {serialTime:6.2f} s  batch({max_workers} workers) {batchTime:6.2f} s  speedup {serialTime / batchTime:5.1f}x")
+
+def benchShippoListing(count=5000, latency=0.05):
+    # Page throughput of ShippoAPI.iterOrders against a local fake Shippo, one page at a time vs. concurrently.
+    from shippo_api import ShippoAPI
+    print(f"shippo listing: {count} orders, {latency * 1000:.0f} ms per request")
+    orders = [fake_servers.syntheticShippoOrder(n) for n in range(count)]
+    with fake_servers.FakeShippoServer(orders, latency) as server:
+        api = ShippoAPI('token', baseUrl=server.url, limiter=RateLimiter(1000, burst=100))
+        for results, workers in ((25, 1), (100, 1), (100, 4), (100, 8)):
+            server.requestCount = 0
+            start = time.perf_counter()
+            stubs = sum(1 for _ in api.iterOrders(results=results, max_workers=workers))
+            elapsed = time.perf_counter() - start
+            print(f"  page size {results:>3}, {workers} workers: {server.requestCount:>4} pages in {elapsed:6.2f} s  ({server.requestCount / elapsed:6.1f} pages/s, {stubs} stubs)")
+
+def benchThrottledDetails(count=100, quota=20, max_workers=8):
+    # getOrderDetailsBatch against a fake Brick Owl that answers anything over `quota` requests/s with 429.
+    # A limiter set a little under the quota should never be throttled; one set too high should
+    # back off after the first 429s and still get every order.
+    from brickowl_api import BrickOwlAPI
+    print(f"throttled details: {count} orders, server allows {quota} requests/s")
+    orders = [fake_servers.syntheticBrickOwlOrder(n) for n in range(count)]
+    ids = [str(o['order_id']) for o, _ in orders]
+    for rate in (quota * 0.9, quota * 2, quota * 4):
+        with fake_servers.FakeBrickOwlServer(orders, throttle=quota) as server:
+            api = BrickOwlAPI('key', baseUrl=server.url, limiter=RateLimiter(rate, burst=quota * 0.9))
+            start = time.perf_counter()
+            fetched = api.getOrderDetailsBatch(ids, max_workers=max_workers)
+            elapsed = time.perf_counter() - start
+            served = server.requestCount - server.throttledCount
+            print(f"  limiter {rate:5.1f}/s: {len(fetched):>4}/{count} orders in {elapsed:6.2f} s  ({served / elapsed:5.1f} requests/s served, {server.throttledCount} throttled)")
+
+def benchAsyncDetails(count=500, latency=0.1, max_workers=8):
+    # Threaded getOrderDetailsBatch vs. the asyncio client, with far more orders in flight than threads.
+    # Both get a rate limit high enough that only the latency and the concurrency matter.
+    # The fake server runs in its own process, so the thread counts and memory peaks are only the clients'.
+    import asyncio
+    import threading
+    import replay
+    from brickowl_api import BrickOwlAPI
+    try:
+        from async_api import AsyncBrickOwlAPI
+    except ImportError as e:
+        print(f"async details: skipped, the asyncio clients need aiohttp ({e})")
+        return
+    print(f"async details: {count} orders, {latency * 1000:.0f} ms per request")
+    orders = [fake_servers.syntheticBrickOwlOrder(n) for n in range(count)]
+    ids = [str(o['order_id']) for o, _ in orders]
+
+    async def fetchAll(url, connections):
+        async with AsyncBrickOwlAPI('key', baseUrl=url, limiter=RateLimiter(100000, burst=1000), cache=ResponseCache([]), connections=connections) as api:
+            return await api.getOrderDetailsBatch(ids), threading.active_count()
+
+    with replay.FakeApis(replay.Corpus([], orders, [], name='async details'), latency) as fakes:
+        url = fakes.urls['brickowl']
+        api = BrickOwlAPI('key', baseUrl=url, limiter=RateLimiter(100000, burst=1000), cache=ResponseCache([]))
+        tracemalloc.start()
+        start = time.perf_counter()
+        fetched = api.getOrderDetailsBatch(ids, max_workers=max_workers)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"  threads({max_workers:>3})      {elapsed:6.2f} s  peak {peak / 2**20:6.1f} MiB  ({len(fetched)} orders)")
+        for connections in (max_workers, 64, 256):
+            tracemalloc.start()
+            start = time.perf_counter()
+            fetched, threads = asyncio.run(fetchAll(url, connections))
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"  asyncio({connections:>3} sockets) {elapsed:6.2f} s  peak {peak / 2**20:6.1f} MiB  ({len(fetched)} orders, {threads} threads)")
+
+def benchBulkAdd(count=200, latency=0.05, max_workers=8):
+    # Adding a backlog to a fake Shippo one order at a time vs. with addOrders.
+    from marketplaces import BRICKLINK
+    from shippo_api import ShippoAPI
+    print(f"bulk add: {count} orders, {latency * 1000:.0f} ms per request")
+    raw = [fake_servers.syntheticBrickLinkOrder(n) for n in range(count)]
+    orders = BRICKLINK.normalizeOrders([data for data, _ in raw], [items for _, items in raw])
+    with fake_servers.FakeShippoServer([], latency) as server:
+        api = ShippoAPI('token', baseUrl=server.url, limiter=RateLimiter(1000, burst=100))
+        start = time.perf_counter()
+        added = sum(api.addOrder(o) for o in orders)
+        serialTime = time.perf_counter() - start
+    with fake_servers.FakeShippoServer([], latency) as server:
+        api = ShippoAPI('token', baseUrl=server.url, limiter=RateLimiter(1000, burst=100))
+        start = time.perf_counter()
+        # Every order twice, the way a retried backlog might list it; each must only be created once.
+        results = api.addOrders(orders + orders, max_workers=max_workers)
+        batchTime = time.perf_counter() - start
+        created = len(server.orders)
+    print(f"  serial            {serialTime:6.2f} s  ({added} added)")
+    print(f"  addOrders({max_workers} workers) {batchTime:6.2f} s  ({sum(r.ok for r in results)} ok results, {created} created)  speedup {serialTime / batchTime:5.1f}x")
+
+def benchNormalize(count=100000):
+    # Building Orders from raw marketplace JSON one call per order vs. a whole batch at once.
+    from marketplaces import BRICKLINK, BRICKOWL
+    print(f"normalize: {count:,} orders per marketplace")
+    for adapter, synthetic in ((BRICKLINK, fake_servers.syntheticBrickLinkOrder), (BRICKOWL, fake_servers.syntheticBrickOwlOrder)):
+        raw = [synthetic(n) for n in range(count)]
+        start = time.perf_counter()
+        single = [adapter.normalizeOrders([data], [items])[0] for data, items in raw]
+        singleTime = time.perf_counter() - start
+        start = time.perf_counter()
+        batch = adapter.normalizeOrders([data for data, _ in raw], [items for _, items in raw])
+        batchTime = time.perf_counter() - start
+        assert [(o.id, o.weight, o.created, o.items) for o in single] == [(o.id, o.weight, o.created, o.items) for o in batch]
+        print(f"  {adapter.name:<10} one at a time {singleTime:6.2f} s  batch {batchTime:6.2f} s  ({count / batchTime:,.0f} orders/s)")
+
+class _DictOrderStub:
+    # OrderStub as it used to be (a plain __dict__ object), for comparison.
+    def __init__(self, source, order_id, status, shippoObjectId = None):
+        self.source = source
+        self.id = order_id
+        self.status = status
+        self.shippoObjectId = shippoObjectId
+
+def benchStubMemory(count=1000000):
+    # Build a listing's worth of stubs the way the API wrappers do (fresh strings from parsed JSON).
+    print(f"order stubs: {count:,} stubs")
+    statuses = ['COMPLETED', 'SHIPPED', 'PAID', 'PACKED', 'RECEIVED']
+    build = lambda cls: [cls(''.join(['brick', 'link']), str(10000000 + n), ''.join(statuses[n % 5])) for n in range(count)]
+    for name, cls in (('dict-backed', _DictOrderStub), ('OrderStub', OrderStub)):
+        # Time it first, then build again under tracemalloc (which slows everything down) for the memory.
+        start = time.perf_counter()
+        stubs = build(cls)
+        elapsed = time.perf_counter() - start
+        del stubs
+        tracemalloc.start()
+        stubs = build(cls)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del stubs
+        print(f"  {name:<12} {elapsed:6.2f} s  {count / elapsed / 1e6:5.2f} M stubs/s  {current / 2**20:8.1f} MiB held  {current / count:6.1f} bytes/stub")
+
+def syntheticListingChunks(sizeMb, chunkSize=CHUNK_SIZE):
+    # A BrickLink-style {"meta": ..., "data": [...]} listing of about sizeMb megabytes, produced a chunk
+    # at a time so the benchmark itself never holds the whole thing.
+    template = ('{"order_id": %d, "date_ordered": "2022-01-17T12:00:00.000Z", "date_status_changed": "2022-01-18T12:00:00.000Z", '
+                '"seller_name": "bigBoxOBricks", "store_name": "Big Box O Bricks", "buyer_name": "buyer%d", "buyer_email": "buyer%d@example.com", '
+                '"require_insurance": false, "status": "%s", "is_invoiced": true, "remarks": "", "total_count": 42, "unique_count": 7, '
+                '"total_weight": "120.50", "payment": {"method": "PayPal", "currency_code": "USD", "date_paid": "2022-01-17T12:05:00.000Z", "status": "Completed"}, '
+                '"cost": {"currency_code": "USD", "subtotal": "12.3400", "grand_total": "16.2100", "etc1": "0.0000", "etc2": "0.0000", "insurance": "0.0000", "shipping": "3.8700"}}')
+    statuses = ['COMPLETED'] * 98 + ['PAID', 'PACKED']
+    target = sizeMb * 1000000
+    written = 0
+    n = 0
+    parts = ['{"meta": {"description": "OK", "message": "OK", "code": 200}, "data": [']
+    while written < target:
+        piece = ('' if n == 0 else ', ') + template % (10000000 + n, n, n, statuses[n % 100])
+        parts.append(piece)
+        written += len(piece)
+        n += 1
+        if sum(len(p) for p in parts) >= chunkSize:
+            yield ''.join(parts).encode()
+            parts = []
+    parts.append(']}')
+    yield ''.join(parts).encode()
+
+def benchStreamingListing(sizeMb=300):
+    # Peak memory of parsing a big listing all at once (response.json()) vs. streaming it with iterJsonArray.
+    print(f"listing parse: ~{sizeMb} MB BrickLink-style listing")
+    tracemalloc.start()
+    start = time.perf_counter()
+    firstStub = None
+    count = 0
+    openOrders = []
+    for o in iterJsonArray(syntheticListingChunks(sizeMb), key='data'):
+        if firstStub is None:
+            firstStub = time.perf_counter() - start
+        count += 1
+        if o['status'] in ('PAID', 'PACKED'):
+            openOrders.append(OrderStub('bricklink', str(o['order_id']), o['status']))
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"  streamed     {elapsed:6.2f} s  first stub after {firstStub * 1000:6.1f} ms  peak {peak / 2**20:8.1f} MiB  ({count:,} orders, {len(openOrders):,} open)")
+    del openOrders
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    body = b''.join(syntheticListingChunks(sizeMb))
+    data = json.loads(body)['data']
+    firstStub = time.perf_counter() - start
+    openOrders = [OrderStub('bricklink', str(o['order_id']), o['status']) for o in data if o['status'] in ('PAID', 'PACKED')]
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"  all at once  {elapsed:6.2f} s  first stub after {firstStub * 1000:6.1f} ms  peak {peak / 2**20:8.1f} MiB  ({len(data):,} orders, {len(openOrders):,} open)")
+
+def benchEndToEnd(sizes=(1000, 100000, 1000000), latency=0.0):
+    # The whole sync (a full run, then an incremental one) against fake servers holding stores of each size.
+    import replay
+    for size in sizes:
+        corpus = replay.Corpus.synthetic(size)
+        replay.printResults(corpus, replay.replaySync(corpus, runs=2, latency=latency))
+
+BENCHMARKS = {
+    'reconcile': benchReconcile,
+    'details': benchOrderDetails,
+    'shippo': benchShippoListing,
+    'stubs': benchStubMemory,
+    'listing': benchStreamingListing,
+    'throttle': benchThrottledDetails,
+    'async': benchAsyncDetails,
+    'bulk': benchBulkAdd,
+    'normalize': benchNormalize,
+    'e2e': benchEndToEnd,
+}
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
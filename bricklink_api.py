@@ -1,51 +1,117 @@
 # bricklink_api.py
 # Written by Joel Peckham | joelskyler@gmail.com
-# Last Updated : Jan 17, 2022
+# Last Updated : Oct 17, 2026
 # This class is a wrapper for the BrickLink API.
 import requests, json
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from requests_oauthlib import OAuth1Session
-from order import Order, OrderStub
+from marketplaces import BRICKLINK
+from jsonstream import iterJsonArray, CHUNK_SIZE
+from ratelimit import RateLimiter, QuotaExceeded, sendWithRetry
+from http_cache import ResponseCache
+from metrics import DEFAULT_METRICS
+import logging
+
+BRICKLINK_URL = 'https://api.bricklink.com/api/store/v1'
+# BrickLink allows 5,000 calls a day. Keep bursts short so a big batch doesn't look like abuse.
+BRICKLINK_REQUESTS_PER_SECOND = 5
+BRICKLINK_DAILY_LIMIT = 5000
+BRICKLINK_MAX_WORKERS = 4
+BRICKLINK_CACHE_TTLS = [
+    (r'/orders/\d+/items$', 30 * 24 * 60 * 60),     # Items never change once an order is paid for.
+    (r'/orders/\d+$', 10 * 60),                     # Details only change when we (or the buyer) update the order.
+]
 
 class BrickLinkAPI:
-    def __init__(self, consumer_key, consumer_secret, token, token_secret) -> None:
+    def __init__(self, consumer_key, consumer_secret, token, token_secret, baseUrl=BRICKLINK_URL, limiter=None, cache=None, metrics=None) -> None:
         self.session = OAuth1Session(client_key = consumer_key, client_secret=consumer_secret, resource_owner_key=token, resource_owner_secret=token_secret)
+        # One pooled connection per worker thread so batch calls don't fight over a single socket.
+        self.session.mount('https://', HTTPAdapter(pool_maxsize=BRICKLINK_MAX_WORKERS * 2))
+        self.session.mount('http://', HTTPAdapter(pool_maxsize=BRICKLINK_MAX_WORKERS * 2))
+        self.baseUrl = baseUrl
+        self.maxWorkers = BRICKLINK_MAX_WORKERS   # How many requests we let run against this host at once.
+        self.limiter = limiter or RateLimiter(BRICKLINK_REQUESTS_PER_SECOND, burst=BRICKLINK_REQUESTS_PER_SECOND, dailyLimit=BRICKLINK_DAILY_LIMIT)
+        self.cache = cache or ResponseCache(BRICKLINK_CACHE_TTLS)
+        self.metrics = metrics or DEFAULT_METRICS
         
-    def _get(self, url, params=None) -> requests.Response:
-        return self.session.get(url, params=params)
+    def _get(self, url, params=None, stream=False) -> requests.Response:
+        def send(headers):
+            return sendWithRetry(lambda: self.metrics.timeRequest('bricklink', 'GET', url, lambda: self.session.get(url, params=params, headers=headers, stream=stream), stream), self.limiter)
+        if stream:
+            return send(None)
+        return self.cache.get(url, params, send)
     
     def _post(self, url, params=None) -> requests.Response:
-        return self.session.post(url, params=params)
+        return sendWithRetry(lambda: self.metrics.timeRequest('bricklink', 'POST', url, lambda: self.session.post(url, params=params)), self.limiter)
+
+    def _put(self, url, body=None) -> requests.Response:
+        return sendWithRetry(lambda: self.metrics.timeRequest('bricklink', 'PUT', url, lambda: self.session.put(url, json=body)), self.limiter)
 
-    def getAllOrders(self):
-        res = self._get('https://api.bricklink.com/api/store/v1/orders')
+    def iterAllOrders(self, statuses=None):
+        # statuses narrows the listing on BrickLink's side, e.g. ['PAID', 'PACKED'] for just the open orders.
+        # The body is parsed as it downloads, so stubs come out before the listing has finished.
+        params = {'status': ','.join(statuses)} if statuses else None
+        with self._get(f'{self.baseUrl}/orders', params=params, stream=True) as res:
+            if res.status_code == 200:
+                yield from BRICKLINK.listingStubs(iterJsonArray(res.iter_content(CHUNK_SIZE), key='data'))
+            else:
+                logging.warning("BrickLink order listing failed: %s %s", res.status_code, res.text)
+
+    def getAllOrders(self, statuses=None):
+        return list(self.iterAllOrders(statuses))
+    
+    def _getOrderData(self, order_id):
+        res = self._get(f'{self.baseUrl}/orders/{order_id}')
         if res.status_code == 200:
-            # print(json.dumps(res.json())[:100])
-            return [OrderStub('bricklink', str(o['order_id']), o['status']) for o in res.json()['data']]
+            return res.json()['data']
         else:
-            print(res.status_code, res.text)
-    
+            return None
+
     def getOrderDetails(self, order_id):
-        res = self._get(f'https://api.bricklink.com/api/store/v1/orders/{order_id}')
-        if res.status_code == 200:
-            return Order('bricklink', res.json()['data'], self.getOrderItems(order_id))
+        orderData = self._getOrderData(order_id)
+        if orderData is not None:
+            return BRICKLINK.normalizeOrders([orderData], [self._getItemData(order_id)])[0]
         else:
             return None
-    
-    def getOrderItems(self, order_id):
-        res =  self._get(f'https://api.bricklink.com/api/store/v1/orders/{order_id}/items')
+
+    def getOrderDetailsBatch(self, order_ids, max_workers=BRICKLINK_MAX_WORKERS):
+        # Same as calling getOrderDetails for each id, but the order and item requests all run
+        # on a thread pool, and the orders are normalized together at the end.
+        # Orders come back in the same order as order_ids; failures are left out.
+        # Once the daily quota is used up, the rest are left out too, and a later run picks them up.
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = [(pool.submit(self._getOrderData, i), pool.submit(self._getItemData, i)) for i in order_ids]
+            fetched = []
+            deferred = 0
+            for orderFuture, itemFuture in futures:
+                try:
+                    fetched.append((orderFuture.result(), itemFuture.result()))
+                except QuotaExceeded:
+                    deferred += 1
+        if deferred:
+            logging.warning("BrickLink's daily quota is used up; %d orders are left for a later run.", deferred)
+        fetched = [(orderData, items) for orderData, items in fetched if orderData is not None]
+        return BRICKLINK.normalizeOrders([orderData for orderData, _ in fetched], [items for _, items in fetched])
+
+    def _getItemData(self, order_id):
+        # The raw items; BrickLink nests them in a list of batches, and we only ever see one.
+        res =  self._get(f'{self.baseUrl}/orders/{order_id}/items')
         if res.status_code == 200:
-            itemList = res.json()['data'][0]
-            gramsToOz = 0.035274
-            return [{'title': i['item']['name'], 'quantity': i['quantity'], 'sku':i['item']['no'],"weight": f'{(float(i["weight"]) * gramsToOz):.3f}' ,"weight_unit": "oz"} for i in itemList]
+            return res.json()['data'][0]
         else:
             return []
-    
+
+    def getOrderItems(self, order_id):
+        return BRICKLINK.normalizeItems([self._getItemData(order_id)])[0]
+
     def shipped(self, order_id):
         data = {
             "field" : "status",
             "value" : "SHIPPED" 
         }
-        res = self.session.put(f'https://api.bricklink.com/api/store/v1/orders/{order_id}/status', json=data)
+        res = self._put(f'{self.baseUrl}/orders/{order_id}/status', body=data)
+        self.cache.invalidate(f'{self.baseUrl}/orders/{order_id}')
         if res.status_code == 200:
             return True
         else:
@@ -57,8 +123,8 @@ class BrickLinkAPI:
                 "tracking_no": tracking_number
             }
         }
-        res = self.session.put(f'https://api.bricklink.com/api/store/v1/orders/{order_id}', json=data)
-        # print (res.status_code, res.text)
+        res = self._put(f'{self.baseUrl}/orders/{order_id}', body=data)
+        self.cache.invalidate(f'{self.baseUrl}/orders/{order_id}')
         if res.status_code == 200:
             return True
         else:
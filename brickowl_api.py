@@ -1,53 +1,132 @@
 # brickowl_api.py
 # Written by Joel Peckham | joelskyler@gmail.com
-# Last Updated : Jan 17, 2022
+# Last Updated : Oct 17, 2026
 # This class is a wrapper for the Brick Owl API.
 from urllib.request import OpenerDirector
 import requests, json
-from order import Order, OrderStub
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from marketplaces import BRICKOWL
+from jsonstream import iterJsonArray, CHUNK_SIZE
 from pprint import pprint
+from ratelimit import RateLimiter, sendWithRetry
+from http_cache import ResponseCache
+from metrics import DEFAULT_METRICS
+import logging
+
+BRICKOWL_URL = 'https://api.brickowl.com/v1'
+BRICKOWL_REQUESTS_PER_SECOND = 10
+BRICKOWL_MAX_WORKERS = 8
+BRICKOWL_CACHE_TTLS = [
+    (r'/order/items$', 30 * 24 * 60 * 60),  # Items never change once an order is paid for.
+    (r'/order/view$', 10 * 60),             # Details only change when we (or the buyer) update the order.
+]
+
+# Brick Owl filters the order list by numeric status id.
+BRICKOWL_STATUS_IDS = {
+    'Pending': 0,
+    'Payment Submitted': 1,
+    'Payment Received': 2,
+    'Processing': 3,
+    'Processed': 4,
+    'Shipped': 5,
+    'Received': 6,
+    'On Hold': 7,
+    'Cancelled': 8,
+}
 
 class BrickOwlAPI:
-    def __init__(self, api_key) -> None:
+    def __init__(self, api_key, baseUrl=BRICKOWL_URL, limiter=None, cache=None, metrics=None) -> None:
         self.session = requests.Session()
+        # One pooled connection per worker thread so batch calls don't fight over a single socket.
+        self.session.mount('https://', HTTPAdapter(pool_maxsize=BRICKOWL_MAX_WORKERS * 2))
+        self.session.mount('http://', HTTPAdapter(pool_maxsize=BRICKOWL_MAX_WORKERS * 2))
         self.keyParam = {
             'key': api_key
         }
+        self.baseUrl = baseUrl
+        self.maxWorkers = BRICKOWL_MAX_WORKERS   # How many requests we let run against this host at once.
+        self.limiter = limiter or RateLimiter(BRICKOWL_REQUESTS_PER_SECOND, burst=BRICKOWL_REQUESTS_PER_SECOND)
+        self.cache = cache or ResponseCache(BRICKOWL_CACHE_TTLS)
+        self.metrics = metrics or DEFAULT_METRICS
         
-    def _get(self, url, params={}) -> requests.Response:
-        params.update(self.keyParam)
-        return self.session.get(url, params=params)
+    def _get(self, url, params=None, stream=False) -> requests.Response:
+        def send(headers):
+            # Copy the params so we never add the key to a dict the caller (or another thread) is holding.
+            keyedParams = dict(params or {})
+            keyedParams.update(self.keyParam)
+            return sendWithRetry(lambda: self.metrics.timeRequest('brickowl', 'GET', url, lambda: self.session.get(url, params=keyedParams, headers=headers, stream=stream), stream), self.limiter)
+        if stream:
+            return send(None)
+        # The cache key leaves out the API key.
+        return self.cache.get(url, params, send)
+
+    def _post(self, url, data=None) -> requests.Response:
+        bodyData = dict(data or {})
+        bodyData.update(self.keyParam)
+        return sendWithRetry(lambda: self.metrics.timeRequest('brickowl', 'POST', url, lambda: self.session.post(url, data=bodyData)), self.limiter)
     
-    def getAllOrders(self):
-        url = "https://api.brickowl.com/v1/order/list"
-        response = self._get(url, params={'limit': 1000000, 'list_type': 'store'})
-        if response.status_code == 200:
-            return [OrderStub('brickowl', str(o['order_id']), o['status']) for o in response.json()]
-        else:
-            return []
+    def iterAllOrders(self, statuses=None):
+        # statuses narrows the listing on Brick Owl's side, e.g. ['Processed'].
+        # Brick Owl only takes one status per request, so we make one request per status.
+        url = f"{self.baseUrl}/order/list"
+        if not statuses:
+            yield from self._iterOrders(url, {'limit': 1000000, 'list_type': 'store'})
+            return
+        for status in statuses:
+            yield from self._iterOrders(url, {'limit': 1000000, 'list_type': 'store', 'status': BRICKOWL_STATUS_IDS[status]})
+
+    def getAllOrders(self, statuses=None):
+        return list(self.iterAllOrders(statuses))
+
+    def _iterOrders(self, url, params):
+        # The body is parsed as it downloads, so stubs come out before the listing has finished.
+        with self._get(url, params=params, stream=True) as response:
+            if response.status_code == 200:
+                yield from BRICKOWL.listingStubs(iterJsonArray(response.iter_content(CHUNK_SIZE)))
+            else:
+                logging.warning("Brick Owl order listing failed: %s %s", response.status_code, response.text)
     
-    def getOrderDetails(self, order_id):
-        url = "https://api.brickowl.com/v1/order/view"
+    def _getOrderData(self, order_id):
+        url = f"{self.baseUrl}/order/view"
         response = self._get(url, params={'order_id': order_id})
         if response.status_code == 200:
-            return Order('brickowl', response.json(), self.getOrderItems(order_id))
+            return response.json()
         else:
             return None
-    
-    def getOrderItems(self, order_id):
-        url = "https://api.brickowl.com/v1/order/items"
+
+    def getOrderDetails(self, order_id):
+        orderData = self._getOrderData(order_id)
+        if orderData is not None:
+            return BRICKOWL.normalizeOrders([orderData], [self._getItemData(order_id)])[0]
+        else:
+            return None
+
+    def getOrderDetailsBatch(self, order_ids, max_workers=BRICKOWL_MAX_WORKERS):
+        # Same as calling getOrderDetails for each id, but the order and item requests all run
+        # on a thread pool, and the orders are normalized together at the end.
+        # Orders come back in the same order as order_ids; failures are left out.
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = [(pool.submit(self._getOrderData, i), pool.submit(self._getItemData, i)) for i in order_ids]
+            fetched = [(orderFuture.result(), itemFuture.result()) for orderFuture, itemFuture in futures]
+        fetched = [(orderData, items) for orderData, items in fetched if orderData is not None]
+        return BRICKOWL.normalizeOrders([orderData for orderData, _ in fetched], [items for _, items in fetched])
+
+    def _getItemData(self, order_id):
+        url = f"{self.baseUrl}/order/items"
         response = self._get(url, params={'order_id': order_id})
         if response.status_code == 200:
-            res = response.json()
-            return [{'title': i['name'], 'quantity': i['ordered_quantity'], 'sku':i['lot_id'],"weight": i["weight"],"weight_unit": "oz"} for i in res]
+            return response.json()
         else:
             return []
-    
+
+    def getOrderItems(self, order_id):
+        return BRICKOWL.normalizeItems([self._getItemData(order_id)])[0]
+
     def shipped(self, order_id):
-        url = "https://api.brickowl.com/v1/order/set_status"
-        bodyData = {'order_id': order_id, 'status_id': '5'}
-        bodyData.update(self.keyParam)
-        response = self.session.post(url, data=bodyData)
+        url = f"{self.baseUrl}/order/set_status"
+        response = self._post(url, data={'order_id': order_id, 'status_id': '5'})
+        self.cache.invalidate(f"{self.baseUrl}/order/view", {'order_id': order_id})
         if response.status_code == 200:
             return True
         else:
@@ -55,10 +134,9 @@ class BrickOwlAPI:
             return False
     def trackPackage(self, order_id, tracking_number):
         # POST https://api.brickowl.com/v1/order/tracking
-        url = "https://api.brickowl.com/v1/order/tracking"
-        bodyData = {'order_id': order_id, 'tracking_id': tracking_number}
-        bodyData.update(self.keyParam)
-        response = self.session.post(url, data=bodyData)
+        url = f"{self.baseUrl}/order/tracking"
+        response = self._post(url, data={'order_id': order_id, 'tracking_id': tracking_number})
+        self.cache.invalidate(f"{self.baseUrl}/order/view", {'order_id': order_id})
         if response.status_code == 200:
             return True
         else:
@@ -0,0 +1,4 @@
+# conftest.py
+# Written by Joel Peckham | joelskyler@gmail.com
+# Last Updated : Oct 17, 2026
+# Lets the tests in tests/ import the modules in this directory (python -m pytest).
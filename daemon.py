@@ -0,0 +1,137 @@
+# daemon.py
+# Written by Joel Peckham | joelskyler@gmail.com
+# Last Updated : Oct 17, 2026
+# Runs sync.py's sync in a loop instead of relaunching it from cron.
+# The API objects (and their open connections) and the state store are kept
+# between runs, so a run costs only the requests it actually makes.
+#   SIGTERM / SIGINT : finish the current run, then exit.
+#   SIGHUP           : re-read api_keys.json and rebuild the API objects before the next run.
+# When a run fails (say an upstream is down), we back off exponentially with jitter.
+
+import argparse
+import logging
+import random
+import signal
+import time
+from collections import deque
+import sync
+from state_store import StateStore
+from journal import Journal
+
+# How often the wait between runs checks whether a signal asked us to stop or reload.
+WAKE_CHECK_INTERVAL = 0.5
+
+class SyncDaemon:
+    def __init__(self, keysPath=sync.API_KEYS_PATH, statePath=sync.STATE_PATH, interval=60, maxBackoff=900, metricsPath=None, journalPath=sync.JOURNAL_PATH) -> None:
+        self.keysPath = keysPath
+        self.statePath = statePath
+        self.journalPath = journalPath
+        self.interval = interval        # Seconds between the start of one run and the next.
+        self.maxBackoff = maxBackoff    # Longest we'll wait after repeated failures.
+        self.metricsPath = metricsPath  # Where to write Prometheus metrics after each run, if anywhere.
+        self.failures = 0
+        self.stopping = False
+        self.reloadRequested = False
+        self.signals = deque()          # Signals handled but not logged yet.
+        self.apis = None
+
+    def handleSignal(self, signum, frame):
+        # Only sets flags. The handler runs in the middle of whatever the main thread was doing, and if
+        # that held a lock (logging's, or a threading.Event's), taking it again here would wait forever.
+        self.signals.append(signum)
+        if signum == signal.SIGHUP:
+            self.reloadRequested = True
+        else:
+            self.stopping = True
+
+    def sleep(self, seconds):
+        # Waits up to `seconds` between runs, in short slices, so a signal's flags are seen within one.
+        deadline = time.monotonic() + seconds
+        while not (self.stopping or self.reloadRequested):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(min(remaining, WAKE_CHECK_INTERVAL))
+
+    def logSignals(self):
+        # Logs the signals handled since the last call, from the run loop rather than the handler.
+        while self.signals:
+            signum = self.signals.popleft()
+            if signum == signal.SIGHUP:
+                logging.info("Got SIGHUP, reloading config before the next run.")
+            else:
+                logging.info("Got signal %d, stopping after the current run.", signum)
+
+    def installSignalHandlers(self):
+        signal.signal(signal.SIGTERM, self.handleSignal)
+        signal.signal(signal.SIGINT, self.handleSignal)
+        signal.signal(signal.SIGHUP, self.handleSignal)
+
+    def reload(self):
+        self.apis = sync.buildApis(sync.loadApiKeys(self.keysPath))
+        self.reloadRequested = False
+        logging.info("Loaded API keys.")
+
+    def nextDelay(self):
+        if self.failures == 0:
+            # A little jitter so we don't hit the APIs at exactly the same second every minute.
+            return self.interval * random.uniform(0.9, 1.1)
+        # Full jitter: anywhere up to the exponential backoff, so retries spread out.
+        return random.uniform(self.interval, min(self.maxBackoff, self.interval * 2 ** self.failures))
+
+    def runOnce(self, store, journal):
+        started = time.monotonic()
+        try:
+            # A bad api_keys.json counts as a failed run, so we keep going and try again later.
+            if self.apis is None or self.reloadRequested:
+                self.reload()
+            # A run that fails partway leaves its unfinished work in the journal, and the next one picks it up.
+            sync.runSync(*self.apis, store, journal=journal)
+            self.failures = 0
+            logging.info("Sync finished in %.1f s.", time.monotonic() - started)
+        except Exception as e:
+            self.failures += 1
+            logging.error('Error: %s (%d failures in a row)', e, self.failures)
+        self.writeMetrics()
+        return time.monotonic() - started
+
+    def writeMetrics(self):
+        # Counters keep adding up for the life of the daemon, the way Prometheus expects.
+        # The JSON summary is for people, so its phases are just the last run's.
+        try:
+            sync.DEFAULT_METRICS.writeJson(sync.METRICS_PATH)
+            if self.metricsPath:
+                sync.DEFAULT_METRICS.writePrometheus(self.metricsPath)
+        except OSError as e:
+            logging.error('Failed to write metrics: %s', e)
+
+    def run(self):
+        # The log pipeline rolls the log over at midnight by itself.
+        with StateStore(self.statePath) as store, Journal(self.journalPath) as journal:
+            while not self.stopping:
+                elapsed = self.runOnce(store, journal)
+                self.logSignals()
+                if self.stopping:
+                    break
+                self.sleep(max(0, self.nextDelay() - elapsed))
+                self.logSignals()
+        logging.info("Sync daemon stopped.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep Shippo, BrickLink and Brick Owl in sync.")
+    parser.add_argument('--interval', type=float, default=60, help="seconds between runs (default 60)")
+    parser.add_argument('--max-backoff', type=float, default=900, help="longest wait after repeated failures (default 900)")
+    parser.add_argument('--keys', default=sync.API_KEYS_PATH, help="path to api_keys.json")
+    parser.add_argument('--state', default=sync.STATE_PATH, help="path to the sync state database")
+    parser.add_argument('--journal', default=sync.JOURNAL_PATH, help="path to the sync journal")
+    parser.add_argument('--metrics', default=None, help="write Prometheus metrics here after every run (e.g. for node_exporter's textfile collector)")
+    args = parser.parse_args()
+
+    sync.configureLogging()
+    logging.info("Starting sync daemon.")
+    daemon = SyncDaemon(args.keys, args.state, args.interval, args.max_backoff, args.metrics, args.journal)
+    daemon.installSignalHandlers()
+    daemon.run()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,457 @@
+# fake_servers.py
+# Written by Joel Peckham | joelskyler@gmail.com
+# Last Updated : Oct 17, 2026
+# Local stand-ins for the Shippo and marketplace APIs, used by benchmarks.py and replay.py.
+# Each server runs on 127.0.0.1 in a background thread and can add a fixed
+# latency to every request so we can see how the sync behaves over a real network.
+# Given a throttle (requests per second), a server answers anything over that
+# rate with 429 and a Retry-After, the way the real hosts do when we push too hard.
+# Given a failure rate, it answers that share of requests with a 503.
+# The servers hold either real (recorded) orders or a synthetic store, which
+# builds each order only when it's asked for, so a million-order store fits in memory.
+# Marking an order shipped changes its status, so a second sync sees the first one's work.
+# Given the OAuth1 secrets, the fake BrickLink checks every request's signature, and
+# turns away a nonce it has already seen, the way BrickLink turns away a replayed one.
+
+import json
+import random
+import re
+import threading
+import time
+from array import array
+from collections.abc import Mapping
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, urlencode
+from ratelimit import RateLimiter
+from order import STATUS_CODES
+
+SYNTHETIC_ORDER_DATE = '2022-01-17T12:00:00.000Z'
+SYNTHETIC_STATUS_DATE = '2022-01-18T12:00:00.000Z'
+SYNTHETIC_ORDER_TIME = str(int(datetime(2022, 1, 17).timestamp()))
+BRICKLINK_ID_BASE = 10000000
+BRICKOWL_ID_BASE = 1000000
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'   # Keep-alive, like the real APIs.
+
+    def _handle(self, method):
+        fake = self.server.fake
+        parts = urlsplit(self.path)
+        query = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        fake.countRequest()
+        if fake.latency:
+            time.sleep(fake.latency)
+        headers = {}
+        denied = fake.authorize(method, fake.url + self.path, self.headers)
+        if denied is not None:
+            status, payload = denied
+        elif fake.throttle is not None and not fake.throttle.tryAcquire():
+            fake.countThrottled()
+            status, payload = 429, {'error': 'rate limit exceeded'}
+            headers['Retry-After'] = str(fake.retryAfter)
+        elif fake.shouldFail():
+            status, payload = 503, {'error': 'injected failure'}
+        else:
+            status, payload = fake.route(method, parts.path, query, body)
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._handle('GET')
+    def do_POST(self):
+        self._handle('POST')
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def log_message(self, format, *args):
+        pass
+
+class FakeServer:
+    def __init__(self, latency=0.0, throttle=None, retryAfter=1, failureRate=0.0, seed=0) -> None:
+        self.latency = latency
+        self.throttle = RateLimiter(throttle, burst=throttle) if throttle else None
+        self.retryAfter = retryAfter    # Seconds we tell a throttled client to wait.
+        self.failureRate = failureRate  # Share of requests answered with a 503.
+        self.random = random.Random(seed)
+        self.requestCount = 0
+        self.throttledCount = 0
+        self.failedCount = 0
+        self.countLock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.fake = self
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address
+        return f'http://{host}:{port}'
+
+    def countRequest(self):
+        with self.countLock:
+            self.requestCount += 1
+
+    def countThrottled(self):
+        with self.countLock:
+            self.throttledCount += 1
+
+    def shouldFail(self):
+        if not self.failureRate:
+            return False
+        with self.countLock:
+            if self.random.random() < self.failureRate:
+                self.failedCount += 1
+                return True
+        return False
+
+    def counts(self):
+        with self.countLock:
+            return {'requests': self.requestCount, 'throttled': self.throttledCount, 'failed': self.failedCount}
+
+    def authorize(self, method, url, headers):
+        # Returns (status, payload) to turn the request away, or None to let it through.
+        return None
+
+    def route(self, method, path, query, body):
+        return 404, {'error': 'not found'}
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+    def __exit__(self, *exc):
+        self.stop()
+
+def syntheticBrickLinkOrder(n, status='PACKED'):
+    orderId = BRICKLINK_ID_BASE + n
+    order = {
+        'order_id': orderId,
+        'date_ordered': SYNTHETIC_ORDER_DATE,
+        'date_status_changed': SYNTHETIC_STATUS_DATE,
+        'status': status,
+        'total_weight': '120.5',
+        'shipping': {'address': {
+            'name': {'first': 'Test', 'last': f'Buyer{n}'},
+            'country_code': 'US', 'postal_code': '12345',
+            'address1': f'{n} Brick St', 'address2': '',
+            'city': 'Springfield', 'state': 'IL',
+        }},
+    }
+    items = [{'item': {'name': f'Brick {n}-{i}', 'no': f'300{i}'}, 'quantity': i + 1, 'weight': '2.32'} for i in range(3)]
+    return order, items
+
+def syntheticBrickOwlOrder(n, status='Processed'):
+    orderId = BRICKOWL_ID_BASE + n
+    order = {
+        'order_id': str(orderId),
+        'order_time': SYNTHETIC_ORDER_TIME,
+        'status': status,
+        'status_id': str(STATUS_CODES[status]),
+        'weight': '4.25',
+        'ship_first_name': 'Test', 'ship_last_name': f'Buyer{n}',
+        'ship_country_code': 'US', 'ship_post_code': '12345',
+        'ship_street_1': f'{n} Owl Ave', 'ship_street_2': '',
+        'ship_city': 'Springfield', 'ship_region': 'IL',
+    }
+    items = [{'name': f'Brick {n}-{i}', 'ordered_quantity': str(i + 1), 'lot_id': str(5000 + i), 'weight': '0.08'} for i in range(3)]
+    return order, items
+
+def syntheticBrickLinkSummary(n, status):
+    # What the listing says about synthetic order n, without building the whole order.
+    return {'order_id': BRICKLINK_ID_BASE + n, 'status': status, 'date_ordered': SYNTHETIC_ORDER_DATE, 'date_status_changed': SYNTHETIC_STATUS_DATE}
+
+def syntheticBrickOwlSummary(n, status):
+    return {'order_id': str(BRICKOWL_ID_BASE + n), 'status': status, 'order_time': SYNTHETIC_ORDER_TIME}
+
+def brickLinkListingEntry(order):
+    return {'order_id': order['order_id'], 'status': order['status'], 'date_ordered': order['date_ordered'], 'date_status_changed': order['date_status_changed']}
+
+def brickOwlListingEntry(order):
+    return {'order_id': order['order_id'], 'status': order['status'], 'order_time': order['order_time']}
+
+class RecordedOrders(dict):
+    # Marketplace orders we have as JSON (recorded, or built up front): {order id: (order, items)}.
+    def __init__(self, pairs, listingEntry) -> None:
+        super().__init__((str(o['order_id']), (o, items)) for o, items in pairs)
+        self.listingEntry = listingEntry
+
+    def listing(self, statuses=None):
+        return [self.listingEntry(o) for o, _ in self.values() if statuses is None or o['status'] in statuses]
+
+    def setStatus(self, orderId, status):
+        self[orderId][0]['status'] = status
+
+class SyntheticOrders(Mapping):
+    # A synthetic marketplace store: statuses[n] is the status of order n, or None if this marketplace
+    # has no order n. Orders are only built when something asks for one.
+    def __init__(self, build, summarize, idBase, statuses) -> None:
+        self.build = build              # build(n, status) -> (order, items)
+        self.summarize = summarize      # summarize(n, status) -> the order's listing entry
+        self.idBase = idBase
+        self.statuses = statuses
+        self.size = sum(s is not None for s in statuses)
+
+    def _index(self, orderId):
+        try:
+            n = int(orderId) - self.idBase
+        except (TypeError, ValueError):
+            return None
+        return n if 0 <= n < len(self.statuses) and self.statuses[n] is not None else None
+
+    def __getitem__(self, orderId):
+        n = self._index(orderId)
+        if n is None:
+            raise KeyError(orderId)
+        return self.build(n, self.statuses[n])
+
+    def __contains__(self, orderId):
+        return self._index(orderId) is not None
+
+    def __iter__(self):
+        return (str(self.idBase + n) for n, s in enumerate(self.statuses) if s is not None)
+
+    def __len__(self):
+        return self.size
+
+    def listing(self, statuses=None):
+        return [self.summarize(n, s) for n, s in enumerate(self.statuses) if s is not None and (statuses is None or s in statuses)]
+
+    def setStatus(self, orderId, status):
+        self.statuses[self._index(orderId)] = status
+
+def _marketplaceOrders(orders, listingEntry):
+    # Servers take a list of (order, items) pairs or a store that already works like one.
+    return orders if isinstance(orders, Mapping) else RecordedOrders(orders, listingEntry)
+
+class FakeBrickLinkServer(FakeServer):
+    # Serves the parts of https://api.bricklink.com/api/store/v1 that BrickLinkAPI uses.
+    # secrets is (consumer secret, token secret); without it, signatures aren't checked.
+    def __init__(self, orders, latency=0.0, throttle=None, failureRate=0.0, seed=0, secrets=None) -> None:
+        super().__init__(latency, throttle, failureRate=failureRate, seed=seed)
+        self.orders = _marketplaceOrders(orders, brickLinkListingEntry)
+        self.lock = threading.Lock()
+        self.secrets = secrets
+        self.nonces = set()
+        self.rejectedCount = 0
+
+    def authorize(self, method, url, headers):
+        if self.secrets is None:
+            return None
+        from oauthlib.common import Request
+        from oauthlib.oauth1.rfc5849 import signature
+        authorization = headers.get('Authorization') or ''
+        params = signature.collect_parameters(uri_query=urlsplit(url).query, headers={'Authorization': authorization}, exclude_oauth_signature=False)
+        oauth = dict(params)
+        request = Request(url, method)
+        request.params = [(k, v) for k, v in params if k != 'oauth_signature']
+        request.signature = oauth.get('oauth_signature', '')
+        with self.lock:
+            replayed = oauth.get('oauth_nonce') in self.nonces
+            self.nonces.add(oauth.get('oauth_nonce'))
+            ok = not replayed and 'oauth_nonce' in oauth and signature.verify_hmac_sha1(request, *self.secrets)
+            if not ok:
+                self.rejectedCount += 1
+        if ok:
+            return None
+        return 401, {'meta': {'code': 401, 'message': 'INVALID_SIGNATURE' if not replayed else 'NONCE_USED'}}
+
+    def route(self, method, path, query, body):
+        ok = {'code': 200, 'message': 'OK'}
+        if method == 'GET' and path == '/orders':
+            statuses = set(query['status'].split(',')) if query.get('status') else None
+            return 200, {'meta': ok, 'data': self.orders.listing(statuses)}
+        match = re.fullmatch(r'/orders/(\d+)(/items|/status)?', path)
+        if not match or match.group(1) not in self.orders:
+            return 404, {'meta': {'code': 404, 'message': 'RESOURCE_NOT_FOUND'}}
+        if method == 'GET':
+            order, items = self.orders[match.group(1)]
+            return 200, {'meta': ok, 'data': [items] if match.group(2) == '/items' else order}
+        if method == 'PUT':
+            update = json.loads(body or b'{}')
+            if match.group(2) == '/status' and update.get('field') == 'status':
+                with self.lock:
+                    self.orders.setStatus(match.group(1), update['value'])
+            return 200, {'meta': ok, 'data': {}}
+        return 405, {'meta': {'code': 405, 'message': 'METHOD_NOT_ALLOWED'}}
+
+class FakeBrickOwlServer(FakeServer):
+    # Serves the parts of https://api.brickowl.com/v1 that BrickOwlAPI uses.
+    def __init__(self, orders, latency=0.0, throttle=None, failureRate=0.0, seed=0) -> None:
+        super().__init__(latency, throttle, failureRate=failureRate, seed=seed)
+        self.orders = _marketplaceOrders(orders, brickOwlListingEntry)
+        self.statusNames = {str(code): name for name, code in STATUS_CODES.items() if code < 100}   # Brick Owl's status_ids.
+        self.tracking = {}      # order_id -> the tracking number we were sent.
+        self.lock = threading.Lock()
+
+    def route(self, method, path, query, body):
+        if method == 'GET' and path == '/order/list':
+            statuses = {self.statusNames.get(query['status'])} if 'status' in query else None
+            return 200, self.orders.listing(statuses)
+        if method == 'POST' and path in ('/order/set_status', '/order/tracking'):
+            form = {k: v[-1] for k, v in parse_qs(body.decode()).items()}
+            if form.get('order_id') not in self.orders:
+                return 404, {'error': {'status': 'Order not found'}}
+            with self.lock:
+                if path == '/order/set_status':
+                    self.orders.setStatus(form['order_id'], self.statusNames[form['status_id']])
+                else:
+                    self.tracking[form['order_id']] = form['tracking_id']
+            return 200, {'status': 'Success'}
+        if method == 'GET' and path in ('/order/view', '/order/items'):
+            if query.get('order_id') not in self.orders:
+                return 404, {'error': {'status': 'Order not found'}}
+            order, items = self.orders[query['order_id']]
+            return 200, order if path == '/order/view' else items
+        return 404, {'error': {'status': 'Not found'}}
+
+def syntheticShippoOrder(n, status='SHIPPED'):
+    # Even n are Brick Owl orders and odd n BrickLink ones, matching the synthetic marketplace stores.
+    source, orderNumber = ('brickowl', str(BRICKOWL_ID_BASE + n)) if n % 2 == 0 else ('bricklink', str(BRICKLINK_ID_BASE + n))
+    return {
+        'object_id': f'{n:032x}',
+        'object_created': SYNTHETIC_ORDER_DATE,
+        'order_number': orderNumber,
+        'order_status': status,
+        'placed_at': '2022-01-17T12:00:00Z',
+        'to_address': {'name': f'Test Buyer{n}', 'street1': f'{n} Brick St', 'city': 'Springfield', 'state': 'IL', 'zip': '12345', 'country': 'US'},
+        'line_items': [],
+        'weight': '4.25',
+        'weight_unit': 'oz',
+        'notes': f'source:{source}',
+        'transactions': [{'object_id': f't{n:031x}', 'tracking_number': f'9400{n:018d}'}] if status == 'SHIPPED' else [],
+    }
+
+class SyntheticShippoOrders:
+    # A synthetic Shippo account: statuses[n] is the status of order n, or None if Shippo has no order n.
+    # Works like a list of orders (len and slices) without building any until a page is asked for.
+    def __init__(self, statuses, numbers=None) -> None:
+        self.statuses = statuses
+        self.numbers = numbers if numbers is not None else array('l', (n for n, s in enumerate(statuses) if s is not None))
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def __getitem__(self, window):
+        return [syntheticShippoOrder(n, self.statuses[n]) for n in self.numbers[window]]
+
+    def find(self, objectId):
+        try:
+            n = int(objectId, 16)
+        except ValueError:
+            return None
+        return syntheticShippoOrder(n, self.statuses[n]) if n < len(self.statuses) and self.statuses[n] is not None else None
+
+    def filter(self, status=None, startDate=None):
+        # Every synthetic order was created on the same day, so only the status needs checking one by one.
+        if startDate and startDate[:19] > SYNTHETIC_ORDER_DATE[:19]:
+            return SyntheticShippoOrders(self.statuses, array('l'))
+        if status is None:
+            return self
+        return SyntheticShippoOrders(self.statuses, array('l', (n for n in self.numbers if self.statuses[n] == status)))
+
+class _Concat:
+    # Two list-like sequences read as one, for paging across orders created during a run and the corpus.
+    def __init__(self, first, second) -> None:
+        self.first = first
+        self.second = second
+
+    def __len__(self):
+        return len(self.first) + len(self.second)
+
+    def __getitem__(self, window):
+        start, stop, _ = window.indices(len(self))
+        split = len(self.first)
+        return self.first[start:min(stop, split)] + self.second[max(start - split, 0):max(stop - split, 0)]
+
+class FakeShippoServer(FakeServer):
+    # Serves the parts of https://api.goshippo.com/v1 that ShippoAPI uses.
+    # Listings are paged like Shippo's: 'count', 'next' and 'results', newest first.
+    # orders is a list of Shippo orders or a SyntheticShippoOrders.
+    # The first POST of an order number in `lose` creates the order but answers 503, as if the response
+    # was lost on the way back; the first one in `refuse` answers 503 without creating anything.
+    def __init__(self, orders, latency=0.0, maxPageSize=100, throttle=None, failureRate=0.0, seed=0, lose=(), refuse=()) -> None:
+        super().__init__(latency, throttle, failureRate=failureRate, seed=seed)
+        self.lose = set(lose)
+        self.refuse = set(refuse)
+        self.corpus = orders if isinstance(orders, SyntheticShippoOrders) else list(orders)
+        self.corpusById = None if isinstance(self.corpus, SyntheticShippoOrders) else {o['object_id']: o for o in self.corpus}
+        self.created = []       # Orders POSTed while we've been running, newest first.
+        self.createdById = {}
+        self.views = {}         # (status, start date) -> the filtered listing, so paging through it stays cheap.
+        self.maxPageSize = maxPageSize
+        self.lock = threading.Lock()
+
+    @property
+    def orders(self):
+        return _Concat(self.created, self.corpus)
+
+    def find(self, objectId):
+        if objectId in self.createdById:
+            return self.createdById[objectId]
+        if self.corpusById is not None:
+            return self.corpusById.get(objectId)
+        return self.corpus.find(objectId)
+
+    def _view(self, status, startDate):
+        def keep(o):
+            return (status is None or o['order_status'] == status) and (startDate is None or o['object_created'][:19] >= startDate[:19])
+        if status is None and startDate is None:
+            return self.orders
+        key = (status, startDate)
+        with self.lock:
+            if key not in self.views:
+                if isinstance(self.corpus, SyntheticShippoOrders):
+                    corpus = self.corpus.filter(status, startDate)
+                else:
+                    corpus = [o for o in self.corpus if keep(o)]
+                self.views[key] = _Concat([o for o in self.created if keep(o)], corpus)
+            return self.views[key]
+
+    def route(self, method, path, query, body):
+        if method == 'GET' and path == '/orders/':
+            page = int(query.get('page', 1))
+            size = min(int(query.get('results', 5)), self.maxPageSize)
+            orders = self._view(query.get('order_status[]'), query.get('start_date'))
+            results = orders[(page - 1) * size:page * size]
+            more = page * size < len(orders)
+            # Like Shippo's, the next link keeps the filters.
+            params = {'page': page + 1, 'results': size, **{k: query[k] for k in ('order_status[]', 'start_date') if k in query}}
+            nextUrl = f"{self.url}/orders/?{urlencode(params)}" if more else None
+            return 200, {'count': len(orders), 'next': nextUrl, 'previous': None, 'results': results}
+        if method == 'GET' and path.startswith('/orders/'):
+            order = self.find(path[len('/orders/'):])
+            return (200, order) if order else (404, {'detail': 'Not found.'})
+        if method == 'POST' and path == '/orders':
+            order = json.loads(body)
+            with self.lock:
+                if order.get('order_number') in self.refuse:
+                    self.refuse.discard(order['order_number'])
+                    return 503, {'detail': 'Service unavailable.'}
+                # Our ids start with 'f', so they never clash with a synthetic order's.
+                order['object_id'] = f'f{len(self.created):031x}'
+                order['object_created'] = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+                order['transactions'] = []
+                self.created.insert(0, order)
+                self.createdById[order['object_id']] = order
+                self.views = {}
+                if order.get('order_number') in self.lose:
+                    self.lose.discard(order['order_number'])
+                    return 503, {'detail': 'Service unavailable.'}
+            return 201, order
+        return 404, {'detail': 'Not found.'}
@@ -0,0 +1,198 @@
+# http_cache.py
+# Written by Joel Peckham | joelskyler@gmail.com
+# Last Updated : Oct 17, 2026
+# A response cache for the API wrappers' GET requests.
+# Each wrapper says which endpoints can be cached and for how long (order items
+# never change once paid for, order details only change when we change them).
+# Responses live in an in-memory LRU, optionally backed by a SQLite file so
+# they survive between cron runs. Stale entries with an ETag or Last-Modified
+# header are revalidated with a conditional request instead of refetched.
+# Every wrapper shares the one SQLite file, so each row carries its own expiry
+# (twice its TTL, to leave time for revalidating it) and a cache only ever
+# prunes rows that have expired, never by its own wrapper's TTLs.
+
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import requests
+from requests.structures import CaseInsensitiveDict
+
+class CachedResponse:
+    def __init__(self, url, status, headers, content, stored=None) -> None:
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.content = content
+        self.stored = stored if stored is not None else time.time()
+
+    @classmethod
+    def fromResponse(cls, res: requests.Response):
+        return cls(res.url, res.status_code, dict(res.headers), res.content)
+
+    def toResponse(self) -> requests.Response:
+        res = requests.Response()
+        res.url = self.url
+        res.status_code = self.status
+        res.headers = CaseInsensitiveDict(self.headers)
+        res._content = self.content
+        return res
+
+class MemoryCache:
+    def __init__(self, maxEntries=1024) -> None:
+        self.maxEntries = maxEntries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxEntries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+class DiskCache:
+    def __init__(self, path) -> None:
+        # The API wrappers call in from several threads, so share one connection behind a lock.
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.db:
+            self.db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, url TEXT, status INTEGER, headers TEXT, content BLOB, stored REAL, expires REAL)")
+            # Files from before rows had an expiry don't have the column yet; their rows are pruned below.
+            columns = [row[1] for row in self.db.execute("PRAGMA table_info(responses)")]
+            if 'expires' not in columns:
+                self.db.execute("ALTER TABLE responses ADD COLUMN expires REAL")
+            self.db.execute("DELETE FROM responses WHERE expires IS NULL OR expires < ?", (time.time(),))
+
+    def get(self, key):
+        with self.lock:
+            row = self.db.execute("SELECT url, status, headers, content, stored FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        url, status, headers, content, stored = row
+        return CachedResponse(url, status, json.loads(headers), content, stored)
+
+    def set(self, key, entry, expires):
+        # expires is the unix time after which the row can be pruned.
+        with self.lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO responses (key, url, status, headers, content, stored, expires) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            (key, entry.url, entry.status, json.dumps(entry.headers), entry.content, entry.stored, expires))
+
+    def delete(self, key):
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+class ResponseCache:
+    def __init__(self, ttls, maxEntries=1024, diskPath=None) -> None:
+        # ttls is a list of (regex, seconds); the first regex that matches a URL decides its TTL.
+        # URLs that match nothing, or have a query string of their own, are never cached.
+        self.ttls = [(re.compile(pattern), seconds) for pattern, seconds in ttls]
+        self.memory = MemoryCache(maxEntries)
+        self.disk = DiskCache(diskPath) if diskPath else None
+        self.counts = {'hits': 0, 'misses': 0, 'revalidated': 0, 'invalidated': 0}
+        self.countLock = threading.Lock()
+
+    def _count(self, name):
+        with self.countLock:
+            self.counts[name] += 1
+
+    def stats(self):
+        with self.countLock:
+            return dict(self.counts)
+
+    def ttlFor(self, url):
+        # A URL that carries its own query string (like a listing's 'next' link) is never cached.
+        if '?' in url:
+            return None
+        for pattern, seconds in self.ttls:
+            if pattern.search(url):
+                return seconds
+        return None
+
+    def key(self, url, params=None):
+        # Credentials (like Brick Owl's key param) must be left out of params by the caller.
+        if not params:
+            return url
+        return url + '?' + '&'.join(f'{k}={params[k]}' for k in sorted(params))
+
+    def _lookup(self, key):
+        entry = self.memory.get(key)
+        if entry is None and self.disk is not None:
+            entry = self.disk.get(key)
+            if entry is not None:
+                self.memory.set(key, entry)
+        return entry
+
+    def _store(self, key, ttl, entry):
+        self.memory.set(key, entry)
+        if self.disk is not None:
+            self.disk.set(key, entry, entry.stored + ttl * 2)
+
+    def _begin(self, url, params):
+        # Returns (key, ttl, cached response or None, stale entry or None, conditional headers or None).
+        ttl = self.ttlFor(url)
+        if ttl is None:
+            return None, None, None, None, None
+        key = self.key(url, params)
+        entry = self._lookup(key)
+        if entry is not None and time.time() - entry.stored < ttl:
+            self._count('hits')
+            return key, ttl, entry.toResponse(), None, None
+
+        conditional = {}
+        if entry is not None:
+            headers = CaseInsensitiveDict(entry.headers)
+            if 'ETag' in headers:
+                conditional['If-None-Match'] = headers['ETag']
+            if 'Last-Modified' in headers:
+                conditional['If-Modified-Since'] = headers['Last-Modified']
+        return key, ttl, None, entry, conditional or None
+
+    def _finish(self, key, ttl, entry, res):
+        if key is None:
+            return res
+        if res.status_code == 304 and entry is not None:
+            self._count('revalidated')
+            entry.stored = time.time()
+            self._store(key, ttl, entry)
+            return entry.toResponse()
+
+        self._count('misses')
+        if res.status_code == 200:
+            self._store(key, ttl, CachedResponse.fromResponse(res))
+        return res
+
+    def get(self, url, params, send) -> requests.Response:
+        # send(headers) makes the real request, with any extra headers we need for revalidation.
+        key, ttl, cached, entry, conditional = self._begin(url, params)
+        if cached is not None:
+            return cached
+        return self._finish(key, ttl, entry, send(conditional))
+
+    async def getAsync(self, url, params, send) -> requests.Response:
+        # Same as get, for the asyncio clients: send(headers) is a coroutine function.
+        key, ttl, cached, entry, conditional = self._begin(url, params)
+        if cached is not None:
+            return cached
+        return self._finish(key, ttl, entry, await send(conditional))
+
+    def invalidate(self, url, params=None):
+        # Call after a write so the next read sees the change.
+        key = self.key(url, params)
+        self.memory.delete(key)
+        if self.disk is not None:
+            self.disk.delete(key)
+        self._count('invalidated')
@@ -0,0 +1,182 @@
+# journal.py
+# Written by Joel Peckham | joelskyler@gmail.com
+# Last Updated : Oct 17, 2026
+# A write-ahead journal of the changes a sync run makes: creating orders in
+# Shippo, marking marketplace orders shipped, and pushing tracking numbers.
+# Every operation is written down (and fsynced) as 'planned' before it's done,
+# then recorded as 'done', 'failed' or 'dropped'. If a run dies partway, the next
+# one reads back whatever is still unfinished and finishes just that, from what
+# the journal remembered (the Shippo payload, the tracking number), without
+# re-listing or re-fetching anything. That closes the gap where an order was
+# marked shipped but the run died before its tracking number went up: the order
+# is no longer open, so reconciliation would never have found it again.
+# Completions are only fsynced in batches. Losing a few to a crash just means the
+# next run redoes them, which is safe: marking shipped and pushing tracking can be
+# repeated, and an unfinished create is looked for in Shippo before it's re-sent.
+# The journal is one JSON record per line, appended to. Once most of it is
+# finished records, it's rewritten with only the unfinished ones.
+
+import json
+import logging
+import os
+import threading
+import time
+
+JOURNAL_SYNC_EVERY = 256        # Completions written before we fsync them.
+JOURNAL_SYNC_INTERVAL = 1.0     # Seconds a completion can wait for an fsync.
+JOURNAL_COMPACT_AT = 10000      # Records in the file before it's worth compacting mid-run.
+# How long we keep trying to finish an operation before giving up on it. It's a time, not a count of
+# tries, since the daemon can get through dozens of runs an hour. A label can be bought days after
+# an order is marked shipped, and until then there's no tracking number to push.
+JOURNAL_GIVE_UP_AFTER = 14 * 24 * 60 * 60
+
+class Journal:
+    # With path=None the journal only lives in memory (for runs without one, like replay.py's).
+    def __init__(self, path, syncEvery=JOURNAL_SYNC_EVERY, syncInterval=JOURNAL_SYNC_INTERVAL, compactAt=JOURNAL_COMPACT_AT, giveUpAfter=JOURNAL_GIVE_UP_AFTER) -> None:
+        self.path = path
+        self.giveUpAfter = giveUpAfter
+        self.syncEvery = syncEvery
+        self.syncInterval = syncInterval
+        self.compactAt = compactAt
+        self.pending = {}           # (op, source, id) -> the planned record, with how many attempts have failed.
+        self.records = 0            # Records in the file.
+        self.unsynced = 0
+        self.lastSync = time.monotonic()
+        self.lock = threading.Lock()
+        self.file = None
+        if path is not None:
+            self._load()
+            self.file = open(path, 'a', encoding='utf-8')
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb+') as f:
+            data = f.read()
+            # A crash can leave half a record at the end. Cut it off, or the next record would be appended to it.
+            end = data.rfind(b'\n') + 1
+            if end < len(data):
+                logging.warning("Dropping a torn record at the end of %s.", self.path)
+                f.truncate(end)
+        for line in data[:end].splitlines():
+            try:
+                self._apply(json.loads(line))
+            except (ValueError, KeyError) as e:
+                logging.warning("Skipping a bad record in %s: %s", self.path, e)
+            self.records += 1
+
+    def _apply(self, record):
+        key = (record['op'], record['source'], record['id'])
+        state = record['state']
+        if state == 'planned':
+            self.pending[key] = record
+        elif state == 'failed':
+            if key in self.pending:
+                self.pending[key]['attempts'] = self.pending[key].get('attempts', 0) + 1
+        else:   # 'done' or 'dropped'
+            self.pending.pop(key, None)
+
+    def _write(self, records):
+        if self.file is not None:
+            self.file.write(''.join(json.dumps(r, separators=(',', ':')) + '\n' for r in records))
+        self.records += len(records)
+
+    def _sync(self):
+        if self.file is not None:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        self.unsynced = 0
+        self.lastSync = time.monotonic()
+
+    def plan(self, op, entries):
+        # Writes a 'planned' record for each entry (a dict with at least 'source' and 'id') and fsyncs once,
+        # so they're all on disk before the caller starts on any of them.
+        now = time.time()
+        records = [dict(entry, op=op, state='planned', at=now) for entry in entries]
+        if not records:
+            return
+        with self.lock:
+            for record in records:
+                self._apply(record)
+            self._write(records)
+            self._sync()
+
+    def _finish(self, op, source, orderId, state, **data):
+        record = dict(data, op=op, source=source, id=orderId, state=state, at=time.time())
+        with self.lock:
+            self._apply(record)
+            self._write([record])
+            self.unsynced += 1
+            if self.unsynced >= self.syncEvery or time.monotonic() - self.lastSync >= self.syncInterval:
+                self._sync()
+            if self.records >= self.compactAt and self.records > 4 * len(self.pending):
+                self._compact()
+
+    def done(self, op, source, orderId, **data):
+        self._finish(op, source, orderId, 'done', **data)
+
+    def failed(self, op, source, orderId, error=None):
+        # Still unfinished: the next run tries it again.
+        self._finish(op, source, orderId, 'failed', error=error)
+
+    def drop(self, op, source, orderId, reason=None):
+        # Not done, but nothing for the journal to finish either, e.g. the order is still open on
+        # the marketplace, so the next run's reconciliation will find it again anyway.
+        self._finish(op, source, orderId, 'dropped', reason=reason)
+
+    def unfinished(self, op):
+        with self.lock:
+            return [dict(r) for (recordOp, _, _), r in self.pending.items() if recordOp == op]
+
+    def expired(self, record):
+        # True once an unfinished record was planned longer than giveUpAfter seconds ago.
+        return time.time() - record['at'] >= self.giveUpAfter
+
+    def keys(self):
+        # (source, id) of every order with unfinished work.
+        with self.lock:
+            return {(source, orderId) for _, source, orderId in self.pending}
+
+    def sync(self):
+        with self.lock:
+            self._sync()
+
+    def _compact(self):
+        # Rewrite the journal with only the unfinished records, then swap it in.
+        if self.file is None:
+            self.records = len(self.pending)
+            return
+        self.file.flush()
+        temp = self.path + '.tmp'
+        with open(temp, 'w', encoding='utf-8') as f:
+            f.write(''.join(json.dumps(r, separators=(',', ':')) + '\n' for r in self.pending.values()))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, self.path)
+        # fsync the directory too, or the rename itself might not survive a crash.
+        directory = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+        self.file.close()
+        self.file = open(self.path, 'a', encoding='utf-8')
+        self.records = len(self.pending)
+        self.unsynced = 0
+        self.lastSync = time.monotonic()
+
+    def compact(self):
+        with self.lock:
+            self._compact()
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self._sync()
+                self.file.close()
+                self.file = None
+
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        self.close()
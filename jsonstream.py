@@ -0,0 +1,98 @@
+# jsonstream.py
+# Written by Joel Peckham | joelskyler@gmail.com
+# Last Updated : Oct 17, 2026
+# Incremental JSON parsing for the big order listings.
+# iterJsonArray takes the response body a chunk at a time and yields each element
+# of a JSON array as soon as it has been downloaded, so memory stays flat no
+# matter how many orders the store has ever had.
+
+import codecs
+import json
+
+CHUNK_SIZE = 64 * 1024      # Bytes to read from the response at a time.
+
+class _ChunkReader:
+    def __init__(self, chunks) -> None:
+        self.chunks = iter(chunks)
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.decodeValue = json.JSONDecoder().raw_decode
+        self.buf = ''
+        self.pos = 0
+        self.done = False
+
+    def more(self):
+        # Read the next chunk, dropping the part of the buffer we've already parsed.
+        if self.done:
+            return False
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            text = self.decoder.decode(b'', final=True)
+            self.done = True
+        else:
+            text = self.decoder.decode(chunk)
+        self.buf = self.buf[self.pos:] + text
+        self.pos = 0
+        return True
+
+    def peek(self):
+        # The next non-whitespace character, without consuming it ('' at the end of the body).
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.more():
+                return ''
+
+    def expect(self, chars):
+        c = self.peek()
+        if c == '' or c not in chars:
+            raise json.JSONDecodeError(f"Expected one of {chars!r}", self.buf, self.pos)
+        self.pos += 1
+        return c
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                obj, end = self.decodeValue(self.buf, self.pos)
+                # A value is always followed by whitespace or one of ',]}:'. If it isn't (yet), it may be a
+                # number cut off mid-chunk ("12" of "1234", "1.5" of "1.5e3"), so read more before trusting it.
+                if (end < len(self.buf) and self.buf[end] in ',]}: \t\r\n') or self.done:
+                    self.pos = end
+                    return obj
+            except json.JSONDecodeError:
+                if self.done:
+                    raise
+            self.more()
+
+def _iterArray(reader):
+    reader.expect('[')
+    if reader.peek() == ']':
+        reader.pos += 1
+        return
+    while True:
+        yield reader.value()
+        if reader.expect(',]') == ']':
+            return
+
+def iterJsonArray(chunks, key=None):
+    # chunks is an iterable of bytes (e.g. response.iter_content()).
+    # With no key the body must be an array; with a key, the body is an object and we stream the
+    # array stored under that key, e.g. BrickLink's {"meta": {...}, "data": [...]}.
+    reader = _ChunkReader(chunks)
+    if key is None:
+        yield from _iterArray(reader)
+        return
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+    while True:
+        name = reader.value()
+        reader.expect(':')
+        if name == key:
+            yield from _iterArray(reader)
+            return
+        reader.value()     # Skip anything else, like BrickLink's "meta".
+        if reader.expect(',}') == '}':
+            return
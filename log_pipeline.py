@@ -0,0 +1,249 @@
+# log_pipeline.py
+# Written by Joel Peckham | joelskyler@gmail.com
+# Last Updated : Oct 17, 2026
+# Where sync.py's and daemon.py's logs go.
+# Logging calls only put the record on a queue. A listener thread formats it
+# and writes it to the log file, so the sync never waits on the disk, and if the
+# queue is full the record is dropped (and the drop counted) rather than waiting.
+# Records are written one JSON object per line. Their messages are only formatted
+# on the listener thread, so log with %-style arguments
+# (logging.info('Got %d stubs.', n)), not f-strings, and don't log something
+# you're about to change.
+# The log file is rolled over at midnight or when it gets too big. The old file is
+# gzipped next to it, and archives past their age or count are deleted.
+# Big lists of orders go in as a Sample (a count per source and the first few),
+# and per-order lines can be tagged extra={'sample': key} to keep only the first
+# few and then one in every so many. The counts start over with every sync run
+# (resetSamples), so a long-running daemon still logs the first few of each run.
+
+import atexit
+import glob
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+LOG_QUEUE_SIZE = 10000                  # Records waiting for the listener before we start dropping them.
+LOG_MAX_BYTES = 100 * 2**20             # Roll the log over when it gets this big, even before midnight.
+LOG_KEEP_FOR = timedelta(days=14)       # Delete archives older than this...
+LOG_MAX_ARCHIVES = 60                   # ...or past this many.
+LOG_SAMPLE_SIZE = 5                     # Orders a Sample shows.
+LOG_SAMPLE_FIRST = 20                   # Records kept for each sample key before we start sampling.
+LOG_SAMPLE_EVERY = 100                  # Then one in every this many.
+
+class Sample:
+    # Stands in for a big list of orders (or stubs, or results) in a log message. Nothing is worked out
+    # until the record is formatted, on the listener thread.
+    def __init__(self, items, size=LOG_SAMPLE_SIZE) -> None:
+        self.items = items
+        self.size = size
+
+    def asDict(self):
+        return {
+            'count': len(self.items),
+            'bySource': dict(Counter(getattr(item, 'source', None) for item in self.items)),
+            'first': [repr(item) for item in self.items[:self.size]],
+        }
+
+    def __str__(self):
+        summary = self.asDict()
+        bySource = ', '.join(f'{source}: {count}' for source, count in summary['bySource'].items())
+        more = f', ... {summary["count"] - self.size} more' if summary['count'] > self.size else ''
+        return f"{summary['count']} ({bySource}) [{', '.join(summary['first'])}{more}]"
+
+class SampleFilter(logging.Filter):
+    # Keeps the first LOG_SAMPLE_FIRST records for each extra={'sample': key}, then one in every LOG_SAMPLE_EVERY.
+    # Records without a sample key always pass.
+    def __init__(self, first=LOG_SAMPLE_FIRST, every=LOG_SAMPLE_EVERY) -> None:
+        super().__init__()
+        self.first = first
+        self.every = every
+        self.seen = Counter()
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        key = getattr(record, 'sample', None)
+        if key is None:
+            return True
+        with self.lock:
+            self.seen[key] += 1
+            seen = self.seen[key]
+        if seen <= self.first or seen % self.every == 0:
+            record.sampled = seen   # How many of these there have been so far.
+            return True
+        return False
+
+    def reset(self):
+        with self.lock:
+            self.seen.clear()
+
+class JsonFormatter(logging.Formatter):
+    # One JSON object per record. Arguments that are Samples are also included as structured data.
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        args = record.args if isinstance(record.args, tuple) else ()
+        data = [arg.asDict() for arg in args if isinstance(arg, Sample)]
+        if data:
+            entry['data'] = data
+        if getattr(record, 'sampled', None):
+            entry['sample'] = {'key': record.sample, 'seen': record.sampled}
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    # Puts records on the queue as they are, so their messages are formatted on the listener thread
+    # (the stock QueueHandler formats them first, on ours). If the queue is full the record is dropped.
+    def __init__(self, logQueue) -> None:
+        super().__init__(logQueue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        if record.exc_info:
+            # Tracebacks hold on to every frame, so turn them into text now and let the frames go.
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            if self.dropped:
+                dropped, self.dropped = self.dropped, 0
+                self.queue.put_nowait(logging.makeLogRecord({'name': 'log_pipeline', 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                                                             'msg': 'Dropped %d log records while the queue was full.', 'args': (dropped,)}))
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class RotatingLogFile(logging.handlers.BaseRotatingHandler):
+    # Rolls the log over at midnight or once it's maxBytes, gzipping the old file to path.<time>.gz,
+    # and prunes the archives. otherFiles (like the cron log) are archived the same way once they're too big.
+    # Old logs matching legacyPattern (a glob) are deleted once they're older than keepFor.
+    # Only ever used from the listener thread, so the compressing never holds up the sync.
+    def __init__(self, path, maxBytes=LOG_MAX_BYTES, keepFor=LOG_KEEP_FOR, maxArchives=LOG_MAX_ARCHIVES, otherFiles=(), legacyPattern=None) -> None:
+        super().__init__(path, 'a', encoding='utf-8')
+        self.maxBytes = maxBytes
+        self.keepFor = keepFor
+        self.maxArchives = maxArchives
+        self.otherFiles = list(otherFiles)
+        self.legacyPattern = legacyPattern
+        self.checkedOthers = False
+        # A file left by an earlier run still rolls over at the end of the day it was started.
+        started = os.path.getmtime(path) if os.path.exists(path) and os.path.getsize(path) else time.time()
+        self.rolloverAt = self._nextMidnight(started)
+
+    @staticmethod
+    def _nextMidnight(when):
+        day = datetime.fromtimestamp(when).date() + timedelta(days=1)
+        return datetime(day.year, day.month, day.day).timestamp()
+
+    def shouldRollover(self, record):
+        if not self.checkedOthers:
+            self.checkedOthers = True
+            self._archiveOthers()
+            self._prune()
+        if time.time() >= self.rolloverAt:
+            return True
+        if self.stream is None:
+            self.stream = self._open()
+        return self.maxBytes > 0 and self.stream.tell() >= self.maxBytes
+
+    def _archive(self, path):
+        stamp = datetime.now().strftime('%Y-%m-%dT%H-%M-%S')
+        archive, n = f"{path}.{stamp}.gz", 1
+        while os.path.exists(archive):    # Rolled over twice in one second.
+            archive, n = f"{path}.{stamp}-{n}.gz", n + 1
+        with open(path, 'rb') as source, gzip.open(archive, 'wb') as target:
+            shutil.copyfileobj(source, target)
+        os.remove(path)
+
+    def _archiveOthers(self):
+        for path in self.otherFiles:
+            try:
+                if os.path.isfile(path) and os.path.getsize(path) >= self.maxBytes:
+                    self._archive(path)
+            except OSError as e:
+                logging.getLogger('log_pipeline').warning('Could not archive %s: %s', path, e)
+
+    def _prune(self):
+        cutoff = time.time() - self.keepFor.total_seconds()
+        for path in [self.baseFilename] + self.otherFiles:
+            archives = sorted(glob.glob(glob.escape(path) + '.*.gz'), reverse=True)   # Newest first.
+            for index, archive in enumerate(archives):
+                try:
+                    if index >= self.maxArchives or os.path.getmtime(archive) < cutoff:
+                        os.remove(archive)
+                except OSError:
+                    pass
+        for old in glob.glob(self.legacyPattern) if self.legacyPattern else ():
+            try:
+                if os.path.getmtime(old) < cutoff:
+                    os.remove(old)
+            except OSError:
+                pass
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        if os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename):
+            self._archive(self.baseFilename)
+        self._archiveOthers()
+        self._prune()
+        self.stream = self._open()
+        self.rolloverAt = self._nextMidnight(time.time())
+
+_listener = None
+
+def startLogging(path, level=logging.INFO, otherFiles=(), legacyPattern=None):
+    # Sends every log record through a queue to a listener thread that writes it to path.
+    # Calling it again replaces the old pipeline, after flushing it.
+    global _listener
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+        old.close()
+    stopLogging()
+    logQueue = queue.Queue(LOG_QUEUE_SIZE)
+    handler = NonBlockingQueueHandler(logQueue)
+    handler.addFilter(SampleFilter())
+    fileHandler = RotatingLogFile(path, otherFiles=otherFiles, legacyPattern=legacyPattern)
+    fileHandler.setFormatter(JsonFormatter())
+    _listener = logging.handlers.QueueListener(logQueue, fileHandler)
+    _listener.start()
+    root.addHandler(handler)
+    root.setLevel(level)
+    return _listener
+
+def resetSamples():
+    # Starts every sample key's count over, so the next records of each are kept again.
+    for handler in logging.getLogger().handlers:
+        for f in handler.filters:
+            if isinstance(f, SampleFilter):
+                f.reset()
+
+def stopLogging():
+    # Writes out everything still on the queue and closes the log file.
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+atexit.register(stopLogging)
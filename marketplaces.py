@@ -0,0 +1,202 @@
+# marketplaces.py
+# Written by Joel Peckham | joelskyler@gmail.com
+# Last Updated : Oct 17, 2026
+# The marketplaces we sync into Shippo, and how to turn their JSON into orders.
+# Each marketplace is a MarketplaceAdapter that says where every field lives in
+# its listing, order and item JSON, how to convert the values (like grams to
+# ounces), which of its statuses matter to the sync, and how to build its API
+# client. sync.py, reconcile.py and the Shippo wrapper only go through the
+# registry, so a new marketplace is one more registerAdapter call.
+# Orders are normalized a batch at a time: each field is pulled out of every
+# order in the batch and converted as one column, then the Orders are built.
+
+import re
+from order import Order, OrderStub, STATUS_CODES
+
+GRAMS_TO_OZ = 0.035274
+
+# Every Order field an adapter can map. Fields an adapter leaves out are None.
+ORDER_FIELDS = ('id', 'first_name', 'last_name', 'country_code', 'postal_code', 'street_1', 'street_2', 'city', 'state',
+                'status', 'status_code', 'created_at', 'status_changed', 'weight')
+ITEM_FIELDS = ('title', 'quantity', 'sku', 'weight')
+ADDRESS_FIELDS = ('first_name', 'last_name', 'country_code', 'postal_code', 'street_1', 'street_2', 'city', 'state')
+
+# Orders we add to Shippo say which marketplace they came from in their notes, e.g. 'source:bricklink'.
+SHIPPO_SOURCE_TAG = 'source:{}'
+_SOURCE_TAG = re.compile(r'(?:^|\s)source:([\w-]+)')
+# Orders added before we tagged them can only be told apart by the shape of the order number.
+# Sources in here that aren't registered marketplaces (like eBay) are never synced, just recognised.
+LEGACY_ORDER_NUMBERS = [
+    (re.compile(r'^\d{5}$'), 'ebay'),
+]
+
+def gramsToOz(value):
+    return str(float(value) * GRAMS_TO_OZ)
+
+def gramsToOzRounded(value):
+    return f'{float(value) * GRAMS_TO_OZ:.3f}'
+
+def _column(records, path):
+    # The value at path (a tuple of keys) in every record, or all None if the adapter has no path.
+    if path is None:
+        return [None] * len(records)
+    if len(path) == 1:
+        key = path[0]
+        return [r[key] for r in records]
+    values = []
+    for r in records:
+        for key in path:
+            r = r[key]
+        values.append(r)
+    return values
+
+def _convert(values, convert):
+    return [convert(v) for v in values] if convert else values
+
+class MarketplaceAdapter:
+    def __init__(self, name, listingFields, orderFields, itemFields, addStatuses, openStatuses, buildApi,
+                 orderConverters=None, itemConverters=None, itemConstants=None, legacyOrderNumber=None) -> None:
+        self.name = name
+        self.listingFields = listingFields          # 'id' and 'status' in each order of the listing.
+        self.orderFields = orderFields              # ORDER_FIELDS -> key path in the order details.
+        self.itemFields = itemFields                # ITEM_FIELDS -> key path in each item.
+        self.orderConverters = orderConverters or {}
+        self.itemConverters = itemConverters or {}
+        self.itemConstants = itemConstants or {}    # Extra fields every line item gets, like the weight unit.
+        self.addStatuses = frozenset(addStatuses)   # Ready to go into Shippo.
+        self.openStatuses = frozenset(openStatuses) # Not yet marked shipped.
+        self.buildApi = buildApi                    # buildApi(api_keys, cachePath) -> the API client.
+        self.legacyOrderNumber = re.compile(legacyOrderNumber) if legacyOrderNumber else None
+
+    def __repr__(self):
+        return f"MarketplaceAdapter({self.name})"
+
+    def listingStubs(self, records):
+        # Stubs for the orders in a listing. A generator, so streamed listings stay streamed.
+        idKey, = self.listingFields['id']
+        statusKey, = self.listingFields['status']
+        name = self.name
+        for r in records:
+            yield OrderStub(name, str(r[idKey]), r[statusKey])
+
+    def normalizeItems(self, itemLists):
+        # Turns a list of raw item lists (one per order) into Shippo line items. Every item in the
+        # batch is converted together, then split back up by order.
+        counts = [len(items) for items in itemLists]
+        flat = [item for items in itemLists for item in items]
+        columns = [_convert(_column(flat, self.itemFields.get(field)), self.itemConverters.get(field)) for field in ITEM_FIELDS]
+        lineItems = [dict(zip(ITEM_FIELDS, row), **self.itemConstants) for row in zip(*columns)]
+        result, start = [], 0
+        for count in counts:
+            result.append(lineItems[start:start + count])
+            start += count
+        return result
+
+    def normalizeOrders(self, orderDatas, itemLists=None):
+        # Builds an Order for every raw order in orderDatas. itemLists, if given, holds each order's raw items.
+        orderDatas = list(orderDatas)
+        columns = {field: _convert(_column(orderDatas, self.orderFields.get(field)), self.orderConverters.get(field)) for field in ORDER_FIELDS}
+        if columns['status_code'][:1] == [None]:
+            columns['status_code'] = [STATUS_CODES.get(s) for s in columns['status']]
+        items = self.normalizeItems(itemLists) if itemLists is not None else [None] * len(orderDatas)
+        addresses = [dict(zip(ADDRESS_FIELDS, row)) for row in zip(*(columns[field] for field in ADDRESS_FIELDS))]
+        return [Order(self.name, orderId, address, status, statusCode, created, statusChanged, weight, lineItems)
+                for orderId, address, status, statusCode, created, statusChanged, weight, lineItems
+                in zip(columns['id'], addresses, columns['status'], columns['status_code'], columns['created_at'],
+                       columns['status_changed'], columns['weight'], items)]
+
+ADAPTERS = {}
+
+def registerAdapter(adapter: MarketplaceAdapter):
+    ADAPTERS[adapter.name] = adapter
+    return adapter
+
+def getAdapter(name) -> MarketplaceAdapter:
+    return ADAPTERS[name]
+
+def marketplaceRules():
+    # The statuses reconcile() works from, for every registered marketplace.
+    return {name: {'add': a.addStatuses, 'open': a.openStatuses} for name, a in ADAPTERS.items()}
+
+def sourceForShippoOrder(orderData):
+    # Which marketplace a Shippo order came from: its source tag, or for untagged (older) orders,
+    # the shape of its order number.
+    match = _SOURCE_TAG.search(orderData.get('notes') or '')
+    if match:
+        return match.group(1)
+    orderNumber = orderData.get('order_number') or ''
+    for adapter in ADAPTERS.values():
+        if adapter.legacyOrderNumber and adapter.legacyOrderNumber.match(orderNumber):
+            return adapter.name
+    for pattern, source in LEGACY_ORDER_NUMBERS:
+        if pattern.match(orderNumber):
+            return source
+    return 'unknown'
+
+def _buildBrickOwlApi(api_keys, cachePath=None):
+    from brickowl_api import BrickOwlAPI, BRICKOWL_CACHE_TTLS
+    from http_cache import ResponseCache
+    return BrickOwlAPI(api_keys['brickowl'], cache=ResponseCache(BRICKOWL_CACHE_TTLS, diskPath=cachePath))
+
+def _buildBrickLinkApi(api_keys, cachePath=None):
+    # BrickLink uses OAuth1, so it needs a few more keys.
+    from bricklink_api import BrickLinkAPI, BRICKLINK_CACHE_TTLS
+    from http_cache import ResponseCache
+    return BrickLinkAPI(api_keys['bricklink_consumer_key'], api_keys['bricklink_consumer_secret'], api_keys['bricklink_token'], api_keys['bricklink_token_secret'],
+                        cache=ResponseCache(BRICKLINK_CACHE_TTLS, diskPath=cachePath))
+
+BRICKOWL = registerAdapter(MarketplaceAdapter(
+    'brickowl',
+    listingFields={'id': ('order_id',), 'status': ('status',)},
+    orderFields={
+        'id': ('order_id',),
+        'first_name': ('ship_first_name',),
+        'last_name': ('ship_last_name',),
+        'country_code': ('ship_country_code',),
+        'postal_code': ('ship_post_code',),
+        'street_1': ('ship_street_1',),
+        'street_2': ('ship_street_2',),
+        'city': ('ship_city',),
+        'state': ('ship_region',),
+        'status': ('status',),
+        'status_code': ('status_id',),
+        'created_at': ('order_time',),
+        'weight': ('weight',),
+    },
+    # order_time stays a unix timestamp; Order.created formats it the first time it's read.
+    orderConverters={'id': str, 'status_code': int, 'created_at': int},
+    itemFields={'title': ('name',), 'quantity': ('ordered_quantity',), 'sku': ('lot_id',), 'weight': ('weight',)},
+    itemConstants={'weight_unit': 'oz'},
+    addStatuses=['Processed'],
+    openStatuses=['Payment Received', 'Processing', 'Processed'],
+    buildApi=_buildBrickOwlApi,
+    legacyOrderNumber=r'^\d{7}$',
+))
+
+BRICKLINK = registerAdapter(MarketplaceAdapter(
+    'bricklink',
+    listingFields={'id': ('order_id',), 'status': ('status',)},
+    orderFields={
+        'id': ('order_id',),
+        'first_name': ('shipping', 'address', 'name', 'first'),
+        'last_name': ('shipping', 'address', 'name', 'last'),
+        'country_code': ('shipping', 'address', 'country_code'),
+        'postal_code': ('shipping', 'address', 'postal_code'),
+        'street_1': ('shipping', 'address', 'address1'),
+        'street_2': ('shipping', 'address', 'address2'),
+        'city': ('shipping', 'address', 'city'),
+        'state': ('shipping', 'address', 'state'),
+        'status': ('status',),
+        'created_at': ('date_ordered',),
+        'status_changed': ('date_status_changed',),
+        'weight': ('total_weight',),
+    },
+    orderConverters={'id': str, 'weight': gramsToOz},
+    itemFields={'title': ('item', 'name'), 'quantity': ('quantity',), 'sku': ('item', 'no'), 'weight': ('weight',)},
+    itemConverters={'weight': gramsToOzRounded},
+    itemConstants={'weight_unit': 'oz'},
+    addStatuses=['PACKED'],
+    openStatuses=['PAID', 'PACKED'],
+    buildApi=_buildBrickLinkApi,
+    legacyOrderNumber=r'^\d{8}$',
+))
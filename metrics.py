@@ -0,0 +1,205 @@
+# metrics.py
+# Written by Joel Peckham | joelskyler@gmail.com
+# Last Updated : Oct 17, 2026
+# Request and phase timing for the sync.
+# Every real HTTP request the API wrappers make (cache hits don't count) goes
+# through Metrics.timeRequest, which records latency, status codes, bytes and
+# 429 / Retry-After responses per endpoint. runSync times each of its phases.
+# The results can be written out as a JSON summary or in Prometheus' text format.
+
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Order ids in a path ('/orders/18332181', Shippo's 32 character object ids) become '{id}'
+# so that every order lands in the same endpoint.
+_ID_SEGMENT = re.compile(r'^(\d+|[0-9a-f]{32})$')
+
+def endpointFor(url):
+    path = urlsplit(url).path
+    return '/'.join('{id}' if _ID_SEGMENT.match(segment) else segment for segment in path.split('/'))
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)    # Observations in each bucket (not cumulative).
+        self.overflow = 0                   # Observations above the last bucket.
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.total += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                return
+        self.overflow += 1
+
+    def cumulative(self):
+        # (upper bound, observations at or below it) pairs, ending with +Inf, the way Prometheus wants them.
+        running = 0
+        pairs = []
+        for bound, count in zip(self.buckets, self.counts):
+            running += count
+            pairs.append((bound, running))
+        pairs.append(('+Inf', running + self.overflow))
+        return pairs
+
+class _EndpointStats:
+    def __init__(self) -> None:
+        self.latency = Histogram()
+        self.statuses = {}
+        self.bytes = 0
+        self.throttled = 0
+        self.retryAfter = 0.0   # Total seconds we were told to wait.
+
+class Metrics:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.endpoints = {}     # (service, method, endpoint) -> _EndpointStats
+            self.phases = {}        # phase -> seconds, for the most recent run
+            self.phaseTotals = {}   # phase -> seconds, across every run
+            self.started = time.time()
+
+    def observeRequest(self, service, method, url, status, seconds, nbytes, retryAfter=None):
+        key = (service, method, endpointFor(url))
+        with self.lock:
+            stats = self.endpoints.get(key)
+            if stats is None:
+                stats = self.endpoints[key] = _EndpointStats()
+            stats.latency.observe(seconds)
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+            stats.bytes += nbytes
+            if status == 429:
+                stats.throttled += 1
+                stats.retryAfter += retryAfter or 0.0
+
+    def timeRequest(self, service, method, url, send, stream=False):
+        # Makes the request with send() and records it. A streamed body hasn't been read yet,
+        # so for those we go by Content-Length (and time only up to the headers).
+        started = time.perf_counter()
+        res = send()
+        elapsed = time.perf_counter() - started
+        if stream:
+            nbytes = int(res.headers.get('Content-Length') or 0)
+        else:
+            nbytes = len(res.content or b'')
+        self.observeRequest(service, method, url, res.status_code, elapsed, nbytes, parseRetryAfter(res.headers.get('Retry-After')))
+        return res
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                self.phases[name] = elapsed
+                self.phaseTotals[name] = self.phaseTotals.get(name, 0.0) + elapsed
+
+    def summary(self):
+        with self.lock:
+            endpoints = []
+            for (service, method, endpoint), stats in sorted(self.endpoints.items()):
+                endpoints.append({
+                    'service': service,
+                    'method': method,
+                    'endpoint': endpoint,
+                    'requests': stats.latency.count,
+                    'seconds': round(stats.latency.total, 3),
+                    'mean_ms': round(stats.latency.total / stats.latency.count * 1000, 1) if stats.latency.count else 0,
+                    'latency_buckets': {str(bound): count for bound, count in stats.latency.cumulative()},
+                    'statuses': {str(status): count for status, count in sorted(stats.statuses.items())},
+                    'bytes': stats.bytes,
+                    'throttled': stats.throttled,
+                    'retry_after_seconds': stats.retryAfter,
+                })
+            return {
+                'since': self.started,
+                'phases': {name: round(seconds, 3) for name, seconds in self.phases.items()},
+                'endpoints': endpoints,
+            }
+
+    def toJson(self):
+        return json.dumps(self.summary(), indent=2)
+
+    def toPrometheus(self):
+        def labels(**values):
+            return '{' + ','.join(f'{k}="{v}"' for k, v in values.items()) + '}'
+        lines = []
+        with self.lock:
+            endpoints = sorted(self.endpoints.items())
+            lines += ['# HELP sync_http_request_duration_seconds Time spent on each API request.',
+                      '# TYPE sync_http_request_duration_seconds histogram']
+            for (service, method, endpoint), stats in endpoints:
+                for bound, count in stats.latency.cumulative():
+                    lines.append(f'sync_http_request_duration_seconds_bucket{labels(service=service, method=method, endpoint=endpoint, le=bound)} {count}')
+                lines.append(f'sync_http_request_duration_seconds_sum{labels(service=service, method=method, endpoint=endpoint)} {stats.latency.total}')
+                lines.append(f'sync_http_request_duration_seconds_count{labels(service=service, method=method, endpoint=endpoint)} {stats.latency.count}')
+            lines += ['# HELP sync_http_responses_total API responses by status code.',
+                      '# TYPE sync_http_responses_total counter']
+            for (service, method, endpoint), stats in endpoints:
+                for status, count in sorted(stats.statuses.items()):
+                    lines.append(f'sync_http_responses_total{labels(service=service, method=method, endpoint=endpoint, status=status)} {count}')
+            lines += ['# HELP sync_http_response_bytes_total Bytes received from the APIs.',
+                      '# TYPE sync_http_response_bytes_total counter']
+            for (service, method, endpoint), stats in endpoints:
+                lines.append(f'sync_http_response_bytes_total{labels(service=service, method=method, endpoint=endpoint)} {stats.bytes}')
+            lines += ['# HELP sync_http_throttled_total 429 responses from the APIs.',
+                      '# TYPE sync_http_throttled_total counter']
+            for (service, method, endpoint), stats in endpoints:
+                lines.append(f'sync_http_throttled_total{labels(service=service, method=method, endpoint=endpoint)} {stats.throttled}')
+            lines += ['# HELP sync_http_retry_after_seconds_total Seconds the APIs asked us to wait in Retry-After headers.',
+                      '# TYPE sync_http_retry_after_seconds_total counter']
+            for (service, method, endpoint), stats in endpoints:
+                lines.append(f'sync_http_retry_after_seconds_total{labels(service=service, method=method, endpoint=endpoint)} {stats.retryAfter}')
+            lines += ['# HELP sync_phase_last_seconds How long each phase of the last sync run took.',
+                      '# TYPE sync_phase_last_seconds gauge']
+            for name, seconds in sorted(self.phases.items()):
+                lines.append(f'sync_phase_last_seconds{labels(phase=name)} {seconds}')
+            lines += ['# HELP sync_phase_seconds_total Time spent in each phase across all runs.',
+                      '# TYPE sync_phase_seconds_total counter']
+            for name, seconds in sorted(self.phaseTotals.items()):
+                lines.append(f'sync_phase_seconds_total{labels(phase=name)} {seconds}')
+        return '\n'.join(lines) + '\n'
+
+    def writeJson(self, path):
+        _writeAtomically(path, self.toJson())
+
+    def writePrometheus(self, path):
+        _writeAtomically(path, self.toPrometheus())
+
+def _writeAtomically(path, text):
+    # Write to a temp file and rename, so a reader (like node_exporter's textfile collector) never sees half a file.
+    with open(path + '.tmp', 'w') as f:
+        f.write(text)
+    os.replace(path + '.tmp', path)
+
+def parseRetryAfter(value):
+    # Retry-After is either a number of seconds or an HTTP date.
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+# The wrappers record into this one unless they're given their own.
+DEFAULT_METRICS = Metrics()
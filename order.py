@@ -1,86 +1,84 @@
 # order.py
 # Written by Joel Peckham | joelskyler@gmail.com
-# Last Updated : Jan 17, 2022
+# Last Updated : Oct 17, 2026
 # This is a class that represents an order.
 
-from datetime import date, datetime as dt
+from datetime import datetime
+from sys import intern
+
+# Numeric codes for every status we see, so code that only compares statuses can use small ints.
+# Brick Owl's codes match its own status_id; the BrickLink and Shippo ones are just ours.
+STATUS_CODES = {
+    # Brick Owl
+    'Pending': 0, 'Payment Submitted': 1, 'Payment Received': 2, 'Processing': 3, 'Processed': 4,
+    'Shipped': 5, 'Received': 6, 'On Hold': 7, 'Cancelled': 8,
+    # BrickLink
+    'PENDING': 100, 'UPDATED': 101, 'PROCESSING': 102, 'READY': 103, 'PAID': 104, 'PACKED': 105,
+    'SHIPPED': 106, 'RECEIVED': 107, 'COMPLETED': 108, 'OCR': 109, 'NPB': 110, 'NPX': 111,
+    'NRS': 112, 'NSS': 113, 'CANCELLED': 114, 'PURGED': 115,
+    # Shippo ('SHIPPED' and 'CANCELLED' share BrickLink's codes)
+    'UNKNOWN': 200, 'AWAITPAY': 201, 'REFUNDED': 202, 'PARTIALLY_FULFILLED': 203,
+}
+
+def _intern(value):
+    # A run holds hundreds of thousands of stubs, but only a handful of distinct sources and statuses.
+    return intern(value) if type(value) is str else value
+
+def unixToLocalTime(value):
+    # Shippo's placed_at takes YYYY-MM-DD HH:MM[:ss[.uuuuuu]][TZ].
+    return datetime.fromtimestamp(int(value)).strftime('%Y-%m-%d %H:%M:%S')
 
 class Order:
-    def __init__(self, source, orderData, itemData = None):
-        self.source = source
-        builderFunctions = {
-            'brickowl': self.buildBrickOwlOrder,
-            'bricklink': self.buildBrickLinkOrder,
-            'shippo': self.buildShippoOrder
-        }
-        self.data = builderFunctions[source](orderData)
-        self.address = self.data['address']
-        self.naitiveID = self.data['id']
-        self.id = self.data['id']
-        self.shippoID = self.data['shippo_id']
-        self.status = self.data['status']
-        self.statusCode = self.data['status_code']
-        self.created = self.data['created_at']
-        self.statusChanged = self.data['status_changed']
-        self.weight = self.data['weight']
-        self.items = itemData
-    
-    def buildBrickOwlOrder(self, orderData):
-        # Create date string in YYYY-MM-DD HH:MM[:ss[.uuuuuu]][TZ] format from the unix timestamp.
-        dateString = dt.fromtimestamp(int(orderData['order_time'])).strftime('%Y-%m-%d %H:%M:%S')
-        return {
-            'id': str(orderData['order_id']),
-            'shippo_id': str(orderData['order_id']),
-            'address': {
-                'first_name': orderData['ship_first_name'],
-                'last_name': orderData['ship_last_name'],
-                'country_code': orderData['ship_country_code'],
-                'postal_code': orderData['ship_post_code'],
-                'street_1': orderData['ship_street_1'],
-                'street_2': orderData['ship_street_2'],
-                'city': orderData['ship_city'],
-                'state': orderData['ship_region'],
-            },
-            'status': orderData['status'],
-            'status_code': int(orderData['status_id']),
-            'status_changed': None,
-            'created_at': dateString,
-            'weight': orderData['weight']
-        }
-    def buildBrickLinkOrder(self, orderData):
-        gramsToOz = 0.035274
-        return {
-            'id': str(orderData['order_id']),
-            'shippo_id': str(orderData['order_id']),
-            'address': {
-                'first_name': orderData['shipping']['address']['name']['first'],
-                'last_name': orderData['shipping']['address']['name']['last'],
-                'country_code': orderData['shipping']['address']['country_code'],
-                'postal_code': orderData['shipping']['address']['postal_code'],
-                'street_1': orderData['shipping']['address']['address1'],
-                'street_2': orderData['shipping']['address']['address2'],
-                'city': orderData['shipping']['address']['city'],
-                'state': orderData['shipping']['address']['state'],
-            },
-            'status': orderData['status'],
-            'status_code': None,
-            'status_changed': orderData['date_status_changed'],
-            'created_at': orderData['date_ordered'],
-            'weight': str(float(orderData['total_weight']) * gramsToOz)
-        }
-    def buildShippoOrder(self, orderData):
-        pass
-    
+    # Slots instead of a __dict__; the raw per-source data isn't kept once the order is built.
+    # Orders are built from raw marketplace JSON by the adapters in marketplaces.py (normalizeOrders).
+    __slots__ = ('source', 'id', 'shippoID', 'address', 'status', 'statusCode', '_created', 'statusChanged', 'weight', 'items')
+
+    def __init__(self, source, order_id, address, status, statusCode = None, created = None, statusChanged = None, weight = None, items = None):
+        self.source = _intern(source)
+        self.id = order_id
+        self.shippoID = order_id
+        self.address = address
+        self.status = _intern(status)
+        self.statusCode = statusCode
+        self._created = created     # A date string, or a unix timestamp (int) that created formats when it's read.
+        self.statusChanged = statusChanged
+        self.weight = weight
+        self.items = items
+
+    @property
+    def naitiveID(self):
+        return self.id
+
+    @property
+    def created(self):
+        # Brick Owl gives a unix timestamp; only format it when someone actually asks for it.
+        if type(self._created) is int:
+            self._created = unixToLocalTime(self._created)
+        return self._created
+
     def __repr__(self) -> str:
         return f"Order({self.source}, {self.naitiveID}, {self.status}, {str(self.address)}, Weight: {self.weight})"
 
 class OrderStub:
-    def __init__(self, source, order_id, status, shippoObjectId = None):
-        self.source = source
+    # Stubs compare and hash on (source, id), so they can go straight into sets and dict keys.
+    __slots__ = ('source', 'id', 'status', 'shippoObjectId', 'trackingNumber')
+
+    def __init__(self, source, order_id, status, shippoObjectId = None, trackingNumber = None):
+        self.source = _intern(source)
         self.id = order_id
-        self.status = status
+        self.status = _intern(status)
         self.shippoObjectId = shippoObjectId
+        self.trackingNumber = trackingNumber    # Only Shippo stubs have one, once a label has been bought.
+    @property
+    def statusCode(self):
+        return STATUS_CODES.get(self.status)
+    def __eq__(self, other):
+        if not isinstance(other, OrderStub):
+            return NotImplemented
+        return self.source == other.source and self.id == other.id
+    def __hash__(self):
+        return hash((self.source, self.id))
     def __str__(self):
         return "Order Stub: " + str(self.id) + " " + str(self.status)
     def __repr__(self):
-        return "Order Stub: " + str(self.id) + " " + str(self.status)
\ No newline at end of file
+        return "Order Stub: " + str(self.id) + " " + str(self.status)
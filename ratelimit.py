@@ -0,0 +1,178 @@
+# ratelimit.py
+# Written by Joel Peckham | joelskyler@gmail.com
+# Last Updated : Oct 17, 2026
+# Rate limiting and retries shared by the API wrappers.
+# Each wrapper owns one RateLimiter (a thread-safe token bucket), so every thread
+# that talks to the same host shares that host's request budget. Callers reserve
+# their slot in turn, so a crowd of threads runs at the full rate without going
+# over it. If the host still answers 429, the limiter halves its rate, waits out
+# any Retry-After for everyone, then creeps back up as requests succeed.
+# sendWithRetry retries throttled requests, and for idempotent calls also server
+# errors and dropped connections, with exponential backoff and jitter.
+# The asyncio clients use the same limiters through acquireAsync and sendWithRetryAsync.
+# A daily quota is counted per UTC day. Each process starts counting from zero, so
+# sync.py carries the count over between runs in the state store (usage/restoreUsage).
+
+import asyncio
+import random
+import threading
+import time
+from metrics import parseRetryAfter
+
+RETRIES = 4             # Extra attempts after the first one.
+RETRY_BASE_DELAY = 0.5  # Seconds before the first retry; doubles every time after that.
+RETRY_MAX_DELAY = 60.0
+RETRY_STATUSES = (500, 502, 503, 504)
+
+class QuotaExceeded(Exception):
+    pass
+
+def _utcDay():
+    return time.strftime('%Y-%m-%d', time.gmtime())
+
+class RateLimiter:
+    def __init__(self, rate, burst=1, dailyLimit=None, minRate=None) -> None:
+        self.maxRate = float(rate)                          # Tokens added per second when all is well.
+        self.rate = self.maxRate
+        self.minRate = float(minRate or rate / 16)          # The slowest we'll back off to.
+        self.burst = float(burst)                           # Most tokens the bucket can hold.
+        self.dailyLimit = dailyLimit                        # Requests allowed per UTC day, if the host has a daily quota.
+        self.tokens = float(burst)
+        self.updated = time.monotonic()                     # Can be in the future while we wait out a Retry-After.
+        self.day = None                                     # The UTC day ('YYYY-MM-DD') usedToday counts.
+        self.usedToday = 0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def _countToday(self):
+        today = _utcDay()
+        if today != self.day:
+            self.day = today
+            self.usedToday = 0
+        if self.dailyLimit is not None and self.usedToday >= self.dailyLimit:
+            raise QuotaExceeded(f"Daily quota of {self.dailyLimit} requests used up")
+        self.usedToday += 1
+
+    def usage(self):
+        # (UTC day, requests made that day), or (None, 0) before the first request.
+        with self.lock:
+            return self.day, self.usedToday
+
+    def restoreUsage(self, day, used):
+        # Picks up the count an earlier process left for today, so the quota holds across processes.
+        with self.lock:
+            today = _utcDay()
+            if day != today:
+                return
+            if self.day != today:
+                self.day, self.usedToday = today, 0
+            self.usedToday = max(self.usedToday, used)
+
+    def reserve(self):
+        # Take a token and return how many seconds the caller must wait before using it. Going below zero
+        # reserves a token that hasn't arrived yet, so waiting callers are served in order and never all
+        # wake up at once.
+        with self.lock:
+            self._countToday()
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= 1
+            return max(0.0, self.updated - now) + max(0.0, -self.tokens) / self.rate
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquireAsync(self):
+        # Same as acquire, but only the calling task waits, not the whole event loop.
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def tryAcquire(self):
+        # Take a token only if one is free right now.
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self.updated > now or self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+    def throttled(self, retryAfter=None):
+        # The host said slow down: halve the rate and hold everyone until Retry-After has passed.
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.rate = max(self.minRate, self.rate / 2)
+            self.tokens = min(self.tokens, 0.0)
+            if retryAfter:
+                self.updated = max(self.updated, now + retryAfter)
+
+    def succeeded(self):
+        # Creep back towards the full rate after a throttle.
+        if self.rate < self.maxRate:
+            with self.lock:
+                self.rate = min(self.maxRate, self.rate + self.maxRate / 20)
+
+def backoff(attempt, base=RETRY_BASE_DELAY, cap=RETRY_MAX_DELAY):
+    # Full jitter: anywhere from nothing up to the exponential backoff for this attempt.
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+def _retryDelay(limiter, attempt, res, idempotent, retries):
+    # How long to wait before trying res's request again, or None if res is the answer.
+    # res is None when the attempt failed to connect (the caller re-raises if we say not to retry).
+    # 429 means the host didn't act on the request, so it's always safe to try again. Server errors and
+    # connection failures are only retried for idempotent calls, since the first attempt may have worked.
+    if res is None:
+        return backoff(attempt) if idempotent and attempt < retries else None
+    if res.status_code == 429:
+        limiter.throttled(parseRetryAfter(res.headers.get('Retry-After')))
+        # The limiter already holds every caller until Retry-After, so only add the jitter.
+        return backoff(attempt) if attempt < retries else None
+    if res.status_code in RETRY_STATUSES and idempotent and attempt < retries:
+        return max(backoff(attempt), parseRetryAfter(res.headers.get('Retry-After')) or 0.0)
+    limiter.succeeded()
+    return None
+
+def sendWithRetry(request, limiter, idempotent=True, retries=RETRIES):
+    # request() makes one attempt and returns a requests.Response.
+    attempt = 0
+    while True:
+        limiter.acquire()
+        try:
+            res = request()
+        except OSError:     # requests' ConnectionError and Timeout are OSErrors.
+            delay = _retryDelay(limiter, attempt, None, idempotent, retries)
+            if delay is None:
+                raise
+        else:
+            delay = _retryDelay(limiter, attempt, res, idempotent, retries)
+            if delay is None:
+                return res
+            res.close()
+        attempt += 1
+        time.sleep(delay)
+
+async def sendWithRetryAsync(request, limiter, idempotent=True, retries=RETRIES):
+    # Same as sendWithRetry, but request() is a coroutine function. Connection failures must be raised as OSErrors.
+    attempt = 0
+    while True:
+        await limiter.acquireAsync()
+        try:
+            res = await request()
+        except OSError:
+            delay = _retryDelay(limiter, attempt, None, idempotent, retries)
+            if delay is None:
+                raise
+        else:
+            delay = _retryDelay(limiter, attempt, res, idempotent, retries)
+            if delay is None:
+                return res
+        attempt += 1
+        await asyncio.sleep(delay)
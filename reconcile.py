@@ -0,0 +1,56 @@
+# reconcile.py
+# Written by Joel Peckham | joelskyler@gmail.com
+# Last Updated : Oct 17, 2026
+# This module works out what sync.py needs to do on each run.
+# Order stubs are indexed by (source, id) once per run so that finding the
+# orders to add to Shippo and the orders to mark as shipped are simple set
+# lookups instead of rescanning every list for every order.
+
+from order import OrderStub
+from marketplaces import marketplaceRules
+
+SHIPPO_SHIPPED_STATUS = 'SHIPPED'
+
+def stubKey(stub: OrderStub):
+    return (stub.source, stub.id)
+
+def indexStubs(stubs):
+    # Later stubs win, which matches how a listing reports the newest status last.
+    return {stubKey(s): s for s in stubs}
+
+class ReconcilePlan:
+    def __init__(self, toAdd, toMarkShipped, seen=None):
+        self.toAdd = toAdd                  # Marketplace stubs that are missing from Shippo.
+        self.toMarkShipped = toMarkShipped  # Shippo stubs whose marketplace order is still open.
+        self.seen = seen or {}              # How many marketplace stubs we looked at, by source.
+    def __repr__(self):
+        return f"ReconcilePlan(add: {len(self.toAdd)}, ship: {len(self.toMarkShipped)})"
+
+def reconcile(shippoStubs, marketplaceStubs, rules=None):
+    # Both listings are only walked once and can be generators.
+    # A listing can repeat a stub (Shippo's does when orders shift between pages), so the Shippo
+    # stubs are indexed by (source, id) first and each order is only ever planned once.
+    # rules maps each marketplace to the statuses that mean 'add to Shippo' and 'still open'
+    # ({'add': ..., 'open': ...}); by default they come from the registered marketplace adapters.
+    if rules is None:
+        rules = marketplaceRules()
+    shippoIndex = indexStubs(shippoStubs)
+
+    toAdd = []
+    queued = set()
+    openKeys = set()
+    seen = {}
+    for stub in marketplaceStubs:
+        seen[stub.source] = seen.get(stub.source, 0) + 1
+        rule = rules.get(stub.source)
+        if rule is None:
+            continue
+        key = stubKey(stub)
+        if stub.status in rule['open']:
+            openKeys.add(key)
+        if stub.status in rule['add'] and key not in shippoIndex and key not in queued:
+            queued.add(key)
+            toAdd.append(stub)
+
+    toMarkShipped = [s for s in shippoIndex.values() if s.source in rules and s.status == SHIPPO_SHIPPED_STATUS and stubKey(s) in openKeys]
+    return ReconcilePlan(toAdd, toMarkShipped, seen)
@@ -0,0 +1,233 @@
+# replay.py
+# Written by Joel Peckham | joelskyler@gmail.com
+# Last Updated : Oct 17, 2026
+# Runs the real sync (sync.runSync) against fake Shippo, BrickLink and Brick Owl
+# servers, so we can measure it without touching the live APIs.
+# The fakes serve a Corpus: either a synthetic store of any size, or orders
+# recorded from the live APIs with --record. They run in their own process, and
+# every sync run gets a fresh process too (like a cron tick), so the wall time
+# and peak memory we report belong to the sync alone.
+# Usage:
+#   python replay.py --orders 100000 [--latency 0.02] [--failure-rate 0.01] [--throttle 50] [--runs 2]
+#   python replay.py --corpus corpus.json
+#   python replay.py --record corpus.json [--keys api_keys.json] [--limit 500]
+# Recorded corpora hold real customer addresses. Keep them out of git.
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import resource
+import tempfile
+import time
+import fake_servers
+from metrics import Metrics
+from ratelimit import RateLimiter
+
+class Corpus:
+    # What the fake servers serve: each marketplace's orders and the Shippo account's orders.
+    def __init__(self, bricklink, brickowl, shippo, name='corpus') -> None:
+        self.bricklink = bricklink  # (order, items) pairs, or a fake_servers.SyntheticOrders
+        self.brickowl = brickowl
+        self.shippo = shippo        # Shippo orders, or a fake_servers.SyntheticShippoOrders
+        self.name = name
+
+    @classmethod
+    def synthetic(cls, count, seed=0):
+        # count orders split between the marketplaces. Most are long finished and already in Shippo;
+        # about 1% are ready to add to Shippo, and another 1% are shipped in Shippo but still open on
+        # the marketplace, so they need writing back.
+        rng = random.Random(seed)
+        bricklink, brickowl, shippo = [None] * count, [None] * count, [None] * count
+        for n in range(count):
+            if n % 2:
+                statuses, openStatus, addStatus, doneStatus = bricklink, 'PAID', 'PACKED', 'COMPLETED'
+            else:
+                statuses, openStatus, addStatus, doneStatus = brickowl, 'Payment Received', 'Processed', 'Shipped'
+            roll = rng.random()
+            if roll < 0.01:
+                statuses[n] = addStatus
+            elif roll < 0.02:
+                statuses[n] = openStatus
+                shippo[n] = 'SHIPPED'
+            else:
+                statuses[n] = doneStatus
+                shippo[n] = 'SHIPPED'
+        return cls(fake_servers.SyntheticOrders(fake_servers.syntheticBrickLinkOrder, fake_servers.syntheticBrickLinkSummary, fake_servers.BRICKLINK_ID_BASE, bricklink),
+                   fake_servers.SyntheticOrders(fake_servers.syntheticBrickOwlOrder, fake_servers.syntheticBrickOwlSummary, fake_servers.BRICKOWL_ID_BASE, brickowl),
+                   fake_servers.SyntheticShippoOrders(shippo),
+                   name=f'{count:,} synthetic orders')
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data['bricklink'], data['brickowl'], data['shippo'], name=os.path.basename(path))
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump({'bricklink': self.bricklink, 'brickowl': self.brickowl, 'shippo': self.shippo}, f)
+
+def recordCorpus(shippoApi, marketplaceApis, limit=None):
+    # Builds a Corpus from the live APIs: the raw JSON of every Shippo order and of (up to limit of)
+    # each marketplace's orders, with their items. Only reads, never writes.
+    shippo = []
+    data = shippoApi._getPage(f"{shippoApi.baseUrl}/orders/", {'results': 100})
+    while data is not None:
+        shippo.extend(data['results'])
+        data = shippoApi._getPage(data['next']) if data.get('next') else None
+    marketplaces = {}
+    for name, api in marketplaceApis.items():
+        stubs = list(api.iterAllOrders())[:limit]
+        marketplaces[name] = [(api._getOrderData(s.id), api._getItemData(s.id)) for s in stubs]
+        marketplaces[name] = [(order, items) for order, items in marketplaces[name] if order is not None]
+    return Corpus(marketplaces.get('bricklink', []), marketplaces.get('brickowl', []), shippo, name='recorded')
+
+def _serve(conn, corpus, options):
+    servers = {
+        'shippo': fake_servers.FakeShippoServer(corpus.shippo, options['latency'], options['pageSize'], options['throttle'], options['failureRate'], options['seed']),
+        'bricklink': fake_servers.FakeBrickLinkServer(corpus.bricklink, options['latency'], options['throttle'], options['failureRate'], options['seed']),
+        'brickowl': fake_servers.FakeBrickOwlServer(corpus.brickowl, options['latency'], options['throttle'], options['failureRate'], options['seed']),
+    }
+    for server in servers.values():
+        server.start()
+    conn.send({name: server.url for name, server in servers.items()})
+    while True:
+        message = conn.recv()
+        if message == 'counts':
+            conn.send({name: server.counts() for name, server in servers.items()})
+        elif message == 'stop':
+            for server in servers.values():
+                server.stop()
+            conn.send(None)
+            return
+
+class FakeApis:
+    # The three fake servers, running in a child process for as long as the with block lasts.
+    def __init__(self, corpus, latency=0.0, pageSize=100, throttle=None, failureRate=0.0, seed=0) -> None:
+        self.corpus = corpus
+        self.options = {'latency': latency, 'pageSize': pageSize, 'throttle': throttle, 'failureRate': failureRate, 'seed': seed}
+        self.urls = None
+
+    def __enter__(self):
+        # fork, so the (possibly huge) corpus is shared with the child instead of pickled.
+        context = multiprocessing.get_context('fork')
+        self.conn, childConn = context.Pipe()
+        self.process = context.Process(target=_serve, args=(childConn, self.corpus, self.options), daemon=True)
+        self.process.start()
+        self.urls = self.conn.recv()
+        return self
+
+    def counts(self):
+        self.conn.send('counts')
+        return self.conn.recv()
+
+    def __exit__(self, *exc):
+        self.conn.send('stop')
+        self.conn.recv()
+        self.process.join()
+
+def buildFakeApis(urls, metrics, rateLimited=False):
+    # API objects pointed at the fakes. Unless rateLimited, the limiters are opened right up,
+    # so we measure the sync rather than the real hosts' quotas.
+    os.environ.setdefault('OAUTHLIB_INSECURE_TRANSPORT', '1')   # The fakes speak plain http.
+    from shippo_api import ShippoAPI
+    from bricklink_api import BrickLinkAPI
+    from brickowl_api import BrickOwlAPI
+    def limiter():
+        return None if rateLimited else RateLimiter(100000, burst=1000)
+    shippoApi = ShippoAPI('token', baseUrl=urls['shippo'], limiter=limiter(), metrics=metrics)
+    marketplaceApis = {
+        'brickowl': BrickOwlAPI('key', baseUrl=urls['brickowl'], limiter=limiter(), metrics=metrics),
+        'bricklink': BrickLinkAPI('ck', 'cs', 't', 'ts', baseUrl=urls['bricklink'], limiter=limiter(), metrics=metrics),
+    }
+    return shippoApi, marketplaceApis
+
+def _inChild(fn):
+    # Runs fn() in a forked process and returns its result, so its peak memory is its own.
+    context = multiprocessing.get_context('fork')
+    conn, childConn = context.Pipe()
+    def run():
+        try:
+            childConn.send(('ok', fn()))
+        except BaseException as e:
+            childConn.send(('error', f'{type(e).__name__}: {e}'))
+    process = context.Process(target=run)
+    process.start()
+    status, value = conn.recv()
+    process.join()
+    if status == 'error':
+        raise RuntimeError(value)
+    return value
+
+def _syncOnce(urls, statePath, rateLimited):
+    import sync
+    from state_store import StateStore
+    from journal import Journal
+    metrics = Metrics()
+    shippoApi, marketplaceApis = buildFakeApis(urls, metrics, rateLimited)
+    started = time.perf_counter()
+    with StateStore(statePath) as store, Journal(statePath + '.journal') as journal:
+        plan = sync.runSync(shippoApi, marketplaceApis, store, metrics, journal)
+    return {
+        'seconds': time.perf_counter() - started,
+        'peakMiB': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,   # Linux reports KiB.
+        'toAdd': len(plan.toAdd),
+        'toMarkShipped': len(plan.toMarkShipped),
+        'phases': metrics.summary()['phases'],
+    }
+
+def replaySync(corpus, runs=2, latency=0.0, pageSize=100, throttle=None, failureRate=0.0, rateLimited=False, seed=0):
+    # Runs the sync `runs` times against the corpus, sharing one state store, and returns a dict per run
+    # with its wall time, peak memory, requests made to each fake, and what it found to do.
+    # The first run on a new store is a full sync; later ones are incremental.
+    results = []
+    with tempfile.TemporaryDirectory() as workDir, FakeApis(corpus, latency, pageSize, throttle, failureRate, seed) as fakes:
+        statePath = os.path.join(workDir, 'sync_state.db')
+        for run in range(runs):
+            before = fakes.counts()
+            result = _inChild(lambda: _syncOnce(fakes.urls, statePath, rateLimited))
+            after = fakes.counts()
+            result['run'] = 'full' if run == 0 else 'incremental'
+            result['requests'] = {name: {k: after[name][k] - before[name][k] for k in after[name]} for name in after}
+            results.append(result)
+    return results
+
+def printResults(corpus, results):
+    print(f"replay: {corpus.name}")
+    for result in results:
+        requests = sum(r['requests'] for r in result['requests'].values())
+        problems = sum(r['throttled'] + r['failed'] for r in result['requests'].values())
+        print(f"  {result['run']:<12} {result['seconds']:8.2f} s  {requests:>7} requests ({problems} throttled/failed)  "
+              f"peak {result['peakMiB']:7.1f} MiB  add {result['toAdd']:>5}  write back {result['toMarkShipped']:>5}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the sync against fake Shippo, BrickLink and Brick Owl servers.")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--orders', type=int, default=1000, help="Size of the synthetic store to serve.")
+    source.add_argument('--corpus', help="Serve a corpus saved with --record instead.")
+    source.add_argument('--record', help="Record a corpus from the live APIs to this file, then exit.")
+    parser.add_argument('--keys', default='api_keys.json', help="API keys for --record.")
+    parser.add_argument('--limit', type=int, default=None, help="Most orders to record per marketplace.")
+    parser.add_argument('--runs', type=int, default=2)
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds every fake request takes.")
+    parser.add_argument('--page-size', type=int, default=100, help="Largest page the fake Shippo returns.")
+    parser.add_argument('--throttle', type=float, default=None, help="Requests/s each fake allows before answering 429.")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="Share of fake requests answered with 503.")
+    parser.add_argument('--rate-limited', action='store_true', help="Use the wrappers' real rate limits.")
+    args = parser.parse_args()
+
+    if args.record:
+        import sync
+        shippoApi, marketplaceApis = sync.buildApis(sync.loadApiKeys(args.keys), cachePath=None)
+        corpus = recordCorpus(shippoApi, marketplaceApis, args.limit)
+        corpus.save(args.record)
+        print(f"Recorded {len(corpus.shippo)} Shippo, {len(corpus.bricklink)} BrickLink and {len(corpus.brickowl)} Brick Owl orders to {args.record}.")
+        return
+    corpus = Corpus.load(args.corpus) if args.corpus else Corpus.synthetic(args.orders)
+    results = replaySync(corpus, args.runs, args.latency, args.page_size, args.throttle, args.failure_rate, args.rate_limited)
+    printResults(corpus, results)
+
+if __name__ == "__main__":
+    main()
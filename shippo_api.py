@@ -1,82 +1,277 @@
 # shippo_api.py
 # Written by Joel Peckham | joelskyler@gmail.com
-# Last Updated : Jan 17, 2022
+# Last Updated : Oct 17, 2026
 # This class is a wrapper for the Shippo API.
 
 import requests, json
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from requests.adapters import HTTPAdapter
 from order import Order, OrderStub
+from marketplaces import sourceForShippoOrder, SHIPPO_SOURCE_TAG
+from ratelimit import RateLimiter, sendWithRetry
+from http_cache import ResponseCache
+from metrics import DEFAULT_METRICS
 import logging
 
+SHIPPO_URL = 'https://api.goshippo.com/v1'
+SHIPPO_REQUESTS_PER_SECOND = 10
+SHIPPO_MAX_WORKERS = 4
+SHIPPO_PAGE_SIZE = 100
+# When a batch can't tell whether Shippo created an order, it looks for it among the orders created since
+# the batch started, less this much in case Shippo's clock is behind ours.
+SHIPPO_CLOCK_SKEW = timedelta(minutes=5)
+SHIPPO_CACHE_TTLS = [
+    (r'/orders/[0-9a-f]{32}$', 10 * 60),    # A single order, by object id. Listings (/orders/) are never cached.
+]
+
+class ShippoListingFailed(Exception):
+    # A page of the order listing didn't come back, so the listing is incomplete.
+    pass
+
+def shippoOrderData(order:Order):
+    # The body Shippo wants for POST /orders.
+    return {
+        "to_address":{
+            "city": order.address['city'],
+            "country": order.address['country_code'],
+            "name": order.address['first_name'] + " " + order.address['last_name'],
+            "state": order.address['state'],
+            "street1": order.address['street_1'],
+            "street2": order.address['street_2'],
+            "zip": order.address['postal_code']
+        },
+        "order_number": str(order.naitiveID),
+        "order_status": "PAID",
+        "placed_at": order.created,
+        "weight": order.weight,
+        "weight_unit": "oz",
+        "line_items": order.items,
+        # Shippo orders have no metadata, so the source goes in the notes, where the listing reads it back.
+        "notes": SHIPPO_SOURCE_TAG.format(order.source),
+    }
+
+class AddOrderResult:
+    # status is 'created', 'failed' (Shippo turned the order down, so it's safe to try again on a later run)
+    # or 'unknown' (we couldn't find out whether Shippo created it, so it must not be sent again blindly).
+    def __init__(self, source, order_id):
+        self.source = source
+        self.id = order_id
+        self.status = 'unknown'
+        self.objectId = None
+        self.error = None
+
+    @property
+    def ok(self):
+        return self.status == 'created'
+
+    def __repr__(self):
+        return f"AddOrderResult({self.source}, {self.id}, {self.status}{', ' + self.error if self.error else ''})"
+
 class ShippoAPI:
-    def __init__(self, api_key) -> None:
+    def __init__(self, api_key, baseUrl=SHIPPO_URL, limiter=None, cache=None, metrics=None) -> None:
         self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_maxsize=SHIPPO_MAX_WORKERS * 2))
+        self.session.mount('http://', HTTPAdapter(pool_maxsize=SHIPPO_MAX_WORKERS * 2))
         self.session.headers.update({
             "Authorization": f"ShippoToken {api_key}"
         })
+        self.baseUrl = baseUrl
+        self.maxWorkers = SHIPPO_MAX_WORKERS   # How many requests we let run against this host at once.
+        self.limiter = limiter or RateLimiter(SHIPPO_REQUESTS_PER_SECOND, burst=SHIPPO_REQUESTS_PER_SECOND)
+        self.cache = cache or ResponseCache(SHIPPO_CACHE_TTLS)
+        self.metrics = metrics or DEFAULT_METRICS
     
-    def _get(self, url, params=None) -> requests.Response:
-        return self.session.get(url, params=params)
+    def _get(self, url, params=None, fresh=False) -> requests.Response:
+        # fresh skips the cache, for things we're waiting on to change (like a label being bought).
+        def send(headers):
+            return sendWithRetry(lambda: self.metrics.timeRequest('shippo', 'GET', url, lambda: self.session.get(url, params=params, headers=headers)), self.limiter)
+        return send(None) if fresh else self.cache.get(url, params, send)
     
     def _post(self, url, params=None, body=None) -> requests.Response:
-        return self.session.post(url, params=params, json=body)
+        return sendWithRetry(lambda: self.metrics.timeRequest('shippo', 'POST', url, lambda: self.session.post(url, params=params, json=body)), self.limiter, idempotent=False)
     
-    def parseSource(self, orderId):
-        print(orderId)
-        if len(orderId) == 5:
-            return 'ebay'
-        elif len(orderId) == 7:
-            return 'brickowl'
-        elif len(orderId) == 8:
-            return 'bricklink'
+    def parseSource(self, orderData):
+        # The marketplace is in the order's notes (see shippoOrderData), or for older orders, guessed from the order number.
+        return sourceForShippoOrder(orderData)
+
+    def parseTrackingNumber(self, orderData):
+        # The tracking number is on the order's latest transaction (label), if it has one.
+        transactions = orderData.get('transactions') or []
+        if transactions and isinstance(transactions[-1], dict):
+            return transactions[-1].get('tracking_number') or None
+        return None
+
+    def _parseOrders(self, data):
+        return (OrderStub(self.parseSource(o), o['order_number'], o['order_status'], o['object_id'], self.parseTrackingNumber(o)) for o in data['results'] if o.get('order_number'))
+
+    def _getPage(self, url, params=None):
+        res = self._get(url, params=params)
+        if res.status_code == 200:
+            return res.json()
         else:
-            return 'unknown'
-
-    def getAllOrders(self):
-        url = "https://api.goshippo.com/v1/orders/"
-        orderList = []
-        while url:
-            res = self.session.get(url)
-            if res.status_code == 200:
-                data = res.json()
-                print(data)
-                orderList.extend([OrderStub(self.parseSource(o['order_number']), o['order_number'], o['order_status'], o['object_id']) for o in data['results'] if o.get('order_number')])
-                url = data['next']
+            logging.warning("Shippo order listing failed: %s %s", res.status_code, res.text)
+            return None
+
+    def iterOrders(self, startDate=None, endDate=None, statuses=None, results=SHIPPO_PAGE_SIZE, max_workers=SHIPPO_MAX_WORKERS):
+        # Yields an OrderStub for every Shippo order, newest first, without holding the whole listing.
+        # startDate/endDate (aware datetimes) limit it to orders created in that window, and statuses
+        # (e.g. ['SHIPPED']) to orders in those states.
+        # Once the first page tells us how many orders there are, up to max_workers of the following
+        # pages are fetched at once while we yield the current one. Orders created mid-listing can shift
+        # an order onto the next page, so a stub may repeat; reconcile() keeps one per order.
+        # A page that fails (after retries) raises ShippoListingFailed rather than cutting the listing short:
+        # every order missing from it would look like it isn't in Shippo, and be added again.
+        url = f"{self.baseUrl}/orders/"
+        params = {'results': results}
+        if startDate:
+            params['start_date'] = startDate.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        if endDate:
+            params['end_date'] = endDate.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        if statuses:
+            params['order_status[]'] = list(statuses)
+
+        data = self._getPage(url, params=dict(params, page=1))
+        if data is None:
+            raise ShippoListingFailed("Shippo order listing failed on page 1")
+        yield from self._parseOrders(data)
+        if not data.get('next'):
+            return
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            if data.get('count') is not None and data['results']:
+                # Shippo caps the page size, so go by what it actually sent rather than what we asked for.
+                pageCount = -(-data['count'] // len(data['results']))
+                nextPage = 2
+                pending = deque()
+                while nextPage <= pageCount or pending:
+                    while nextPage <= pageCount and len(pending) < max_workers:
+                        pending.append(pool.submit(self._getPage, url, dict(params, page=nextPage)))
+                        nextPage += 1
+                    data = pending.popleft().result()
+                    if data is None:
+                        for future in pending:
+                            future.cancel()
+                        raise ShippoListingFailed(f"Shippo order listing failed on page {nextPage - len(pending) - 1}")
+                    yield from self._parseOrders(data)
             else:
-                print(res.status_code, res.text)
-                break
-        return orderList
+                # No count, so all we can do is follow the 'next' links, one page ahead.
+                # The 'next' link already carries the query string.
+                future = pool.submit(self._getPage, data['next'])
+                while future:
+                    data = future.result()
+                    if data is None:
+                        raise ShippoListingFailed("Shippo order listing failed partway through")
+                    future = pool.submit(self._getPage, data['next']) if data.get('next') else None
+                    yield from self._parseOrders(data)
+
+    def getAllOrders(self, startDate=None, endDate=None, statuses=None):
+        return list(self.iterOrders(startDate=startDate, endDate=endDate, statuses=statuses))
     
     def getOrder(self, objectId):
-        url = f"https://api.goshippo.com/v1/orders/{objectId}"
+        url = f"{self.baseUrl}/orders/{objectId}"
         return self._get(url).json()
 
+    def getTrackingNumbers(self, objectIds, max_workers=SHIPPO_MAX_WORKERS):
+        # Looks up the tracking numbers for a batch of orders at once. Returns {objectId: trackingNumber},
+        # leaving out any order that has no label yet or couldn't be fetched.
+        # Never from the cache: an order cached before its label was bought would keep saying it has none.
+        def fetch(objectId):
+            res = self._get(f"{self.baseUrl}/orders/{objectId}", fresh=True)
+            return self.parseTrackingNumber(res.json()) if res.status_code == 200 else None
+        objectIds = list(objectIds)
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            trackingNumbers = pool.map(fetch, objectIds)
+            return {objectId: number for objectId, number in zip(objectIds, trackingNumbers) if number}
+
     def addOrder(self,order:Order):
-        orderData = {
-            "to_address":{
-                "city": order.address['city'],
-                "country": order.address['country_code'],
-                "name": order.address['first_name'] + " " + order.address['last_name'],
-                "state": order.address['state'],
-                "street1": order.address['street_1'],
-                "street2": order.address['street_2'],
-                "zip": order.address['postal_code']
-            },
-            "order_number": str(order.naitiveID),
-            "order_status": "PAID",
-            "placed_at": order.created,
-            "weight": order.weight,
-            "weight_unit": "oz",
-            "line_items": order.items
-
-        }
-        res = self._post("https://api.goshippo.com/v1/orders", body=orderData)
-        logging.info(orderData)
+        orderData = shippoOrderData(order)
+        res = self._post(f"{self.baseUrl}/orders", body=orderData)
+        # Payloads are big and a backlog sends a lot of them, so only a sample is logged.
+        logging.info('Adding order %s to Shippo: %s', order.id, orderData, extra={'sample': 'shippo_payload'})
         if res.status_code == 201:
             return True
         else:
-            logging.info(res.status_code, res.text)
+            logging.warning("Failed to add order %s to Shippo: %s %s", order.id, res.status_code, res.text)
             return False
-        
+
+    def _addOne(self, result, orderData):
+        try:
+            res = self._post(f"{self.baseUrl}/orders", body=orderData)
+        except OSError as e:
+            # The request may or may not have reached Shippo.
+            result.status, result.error = 'unknown', str(e)
+            return result
+        if res.status_code == 201:
+            result.status, result.objectId, result.error = 'created', res.json().get('object_id'), None
+        elif res.status_code >= 500:
+            result.status, result.error = 'unknown', f'{res.status_code} {res.text[:200]}'
+        else:
+            result.status, result.error = 'failed', f'{res.status_code} {res.text[:200]}'
+        return result
+
+    def _findCreated(self, orderNumbers, since):
+        # {order_number: object_id} for the orders in orderNumbers that Shippo has created since `since`,
+        # or None if any page of the listing failed (a partial listing can't prove an order is missing).
+        # The window is only as long as the batch, so the listing is short and we just follow 'next'.
+        params = {'results': SHIPPO_PAGE_SIZE, 'start_date': since.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')}
+        found = {}
+        try:
+            data = self._getPage(f"{self.baseUrl}/orders/", params)
+            while data is not None:
+                for stub in self._parseOrders(data):
+                    if stub.id in orderNumbers:
+                        found[stub.id] = stub.shippoObjectId
+                if not data.get('next'):
+                    return found
+                data = self._getPage(data['next'])
+        except OSError as e:
+            logging.warning("Couldn't list Shippo orders to check for ones we already created: %s", e)
+        return None
+
+    def addOrders(self, orders, max_workers=SHIPPO_MAX_WORKERS):
+        # Adds a batch of Orders to Shippo and returns an AddOrderResult for each, in the same order.
+        return self.addOrderData([(o.source, o.id, shippoOrderData(o)) for o in orders], max_workers)
+
+    def addOrderData(self, entries, max_workers=SHIPPO_MAX_WORKERS, sentSince=None):
+        # Adds a batch of (source, order id, POST body) to Shippo and returns an AddOrderResult for each, in the same order.
+        # Each POST runs on a thread pool, within the rate limit.
+        # Creating an order isn't idempotent, so a POST whose outcome we can't know (timeout, 5xx) is never
+        # simply sent again: we list the orders Shippo created since the batch started and only re-send
+        # the ones that aren't there. The order number is the idempotency key; an order that appears twice
+        # in the batch is only sent once.
+        # If the batch may already have been sent (by a run that died) since sentSince, every order is
+        # looked for that way first, and only the missing ones are sent.
+        started = sentSince or datetime.now(timezone.utc)
+        results = [AddOrderResult(source, orderId) for source, orderId, _ in entries]
+        byNumber = {}
+        for (_, _, orderData), result in zip(entries, results):
+            byNumber.setdefault(str(orderData['order_number']), (orderData, []))[1].append(result)
+
+        def send(pending):
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                sent = list(pool.map(lambda number: self._addOne(byNumber[number][1][0], byNumber[number][0]), pending))
+            return [str(r.id) for r in sent if r.status == 'unknown']
+
+        unknown = list(byNumber) if sentSince else send(list(byNumber))
+        if unknown:
+            found = self._findCreated(set(unknown), started - SHIPPO_CLOCK_SKEW)
+            if found is not None:
+                for number in unknown:
+                    if number in found:
+                        result = byNumber[number][1][0]
+                        result.status, result.objectId, result.error = 'created', found[number], None
+                retry = [number for number in unknown if number not in found]
+                if retry:
+                    logging.info("Re-sending %d orders Shippo didn't create.", len(retry))
+                    send(retry)
+
+        # Duplicates in the batch share the outcome of the one we sent.
+        for _, sameOrder in byNumber.values():
+            for duplicate in sameOrder[1:]:
+                duplicate.status, duplicate.objectId, duplicate.error = sameOrder[0].status, sameOrder[0].objectId, sameOrder[0].error
+        return results
 
 if __name__ == "__main__":
     with open('api_keys.json') as f:
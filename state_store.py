@@ -0,0 +1,122 @@
+# state_store.py
+# Written by Joel Peckham | joelskyler@gmail.com
+# Last Updated : Oct 17, 2026
+# A small SQLite database that remembers what sync.py saw on earlier runs.
+# With it, a run only has to list orders that might have changed (open marketplace
+# orders and recent Shippo orders) instead of every order each site has ever had.
+
+import sqlite3
+import time
+from datetime import datetime, timezone
+from order import OrderStub
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    service TEXT NOT NULL,          -- Where the stub was listed: 'shippo', 'brickowl' or 'bricklink'.
+    source TEXT NOT NULL,           -- The marketplace the order belongs to.
+    id TEXT NOT NULL,
+    status TEXT,
+    shippo_object_id TEXT,
+    tracking_number TEXT,
+    last_seen REAL NOT NULL,
+    PRIMARY KEY (service, source, id)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+class StateStore:
+    def __init__(self, path) -> None:
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+        # Stores made before tracking numbers were recorded don't have the column yet.
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(orders)")]
+        if 'tracking_number' not in columns:
+            self.db.execute("ALTER TABLE orders ADD COLUMN tracking_number TEXT")
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        self.close()
+
+    def getMeta(self, key, default=None):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def setMeta(self, key, value):
+        with self.db:
+            self.db.execute("INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value", (key, str(value)))
+
+    def saveStubs(self, service, stubs):
+        # Upsert the stubs. A stub without a Shippo object id or tracking number never wipes out one we already know.
+        now = time.time()
+        with self.db:
+            self.db.executemany("""
+                INSERT INTO orders (service, source, id, status, shippo_object_id, tracking_number, last_seen) VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(service, source, id) DO UPDATE SET
+                    status = excluded.status,
+                    shippo_object_id = COALESCE(excluded.shippo_object_id, orders.shippo_object_id),
+                    tracking_number = COALESCE(excluded.tracking_number, orders.tracking_number),
+                    last_seen = excluded.last_seen
+            """, ((service, s.source, s.id, s.status, s.shippoObjectId, s.trackingNumber, now) for s in stubs))
+
+    def recordStubs(self, service, stubs, batchSize=10000):
+        # Passes the stubs straight through while saving them in batches, for listings we stream.
+        batch = []
+        for stub in stubs:
+            batch.append(stub)
+            yield stub
+            if len(batch) >= batchSize:
+                self.saveStubs(service, batch)
+                batch = []
+        self.saveStubs(service, batch)
+
+    def pruneStubs(self, service, status, before):
+        # Forget stubs in `status` that no listing has reported since `before` (a unix time).
+        with self.db:
+            return self.db.execute("DELETE FROM orders WHERE service = ? AND status = ? AND last_seen < ?", (service, status, before)).rowcount
+
+    def loadStubs(self, service):
+        rows = self.db.execute("SELECT source, id, status, shippo_object_id, tracking_number FROM orders WHERE service = ?", (service,))
+        return [OrderStub(source, orderId, status, objectId, trackingNumber) for source, orderId, status, objectId, trackingNumber in rows]
+
+    def countStubs(self, service):
+        return self.db.execute("SELECT COUNT(*) FROM orders WHERE service = ?", (service,)).fetchone()[0]
+
+    # The high-water mark is when the last successful run started (UTC). The next run
+    # lists the Shippo orders created since then; late status changes have their own lookback in sync.py.
+    def highWaterMark(self):
+        value = self.getMeta('high_water_mark')
+        return datetime.fromisoformat(value) if value else None
+
+    def setHighWaterMark(self, when: datetime):
+        self.setMeta('high_water_mark', when.astimezone(timezone.utc).isoformat())
+
+    # How many requests we made against a host's daily quota, and on which UTC day, so a cron run
+    # (a fresh process every time) doesn't start counting from zero.
+    def quotaUsed(self, name):
+        value = self.getMeta(f'quota_used:{name}')
+        if value is None:
+            return None, 0
+        day, used = value.split()
+        return day, int(used)
+
+    def setQuotaUsed(self, name, day, used):
+        self.setMeta(f'quota_used:{name}', f'{day} {used}')
+
+    def needsFullSync(self, interval):
+        # interval is a timedelta. A new (empty) store always starts with a full sync.
+        value = self.getMeta('last_full_sync')
+        if value is None or self.countStubs('shippo') == 0:
+            return True
+        return datetime.now(timezone.utc) - datetime.fromisoformat(value) >= interval
+
+    def markFullSync(self, when: datetime):
+        self.setMeta('last_full_sync', when.astimezone(timezone.utc).isoformat())
@@ -1,7 +1,8 @@
 # sync.py
 # Written by Joel Peckham | joelskyler@gmail.com
-# Last Updated : Jan 24, 2022
-# This program was designed to run as a daemon on an Ubuntu VPS.
+# Last Updated : Oct 17, 2026
+# This program was designed to run on an Ubuntu VPS, either once per cron tick
+# (python sync.py) or as a long-running daemon (python daemon.py).
 # The purpose of this program is to sync order information between
 # Shippo, BrickLink, and Brick Owl. As orders are created on either
 # Brick Owl or BrickLink, they must be added to Shippo. As order status
@@ -12,130 +13,267 @@ import json                             # We need this module to read and write
 import sys                              # We need this module to exit the program when an error occurs.
 import os                               # We need this module to check if the api_keys.json file exists.
 import logging                          # We need this module to log errors to a file.
-from datetime import datetime, timedelta           # We need this module to get the current date and time, and do some date math.
-from shippo_api import ShippoAPI        # We need this module to make Shippo API calls.
-from brickowl_api import BrickOwlAPI    # We need this module to make Brick Owl API calls.
-from bricklink_api import BrickLinkAPI  # We need this module to make Brick Link API calls.
+from log_pipeline import startLogging, resetSamples, Sample # We need this module to write the log without slowing the sync down.
+from itertools import chain             # We need this to stream the marketplace listings one after the other.
+from datetime import datetime, timedelta, timezone # We need this module to get the current date and time, and do some date math.
+from shippo_api import ShippoAPI, SHIPPO_CACHE_TTLS, SHIPPO_CLOCK_SKEW, shippoOrderData # We need this module to make Shippo API calls.
+from marketplaces import ADAPTERS, getAdapter # We need this module to know which marketplaces to sync (Brick Owl and BrickLink) and how.
+from http_cache import ResponseCache    # We need this module to cache order details between runs.
+from metrics import DEFAULT_METRICS     # We need this module to time API requests and each phase of the sync.
+from reconcile import reconcile, stubKey, SHIPPO_SHIPPED_STATUS # We need this module to work out which orders need to be added or marked shipped.
+from order import OrderStub             # We need this to record the orders we add to Shippo.
+from state_store import StateStore      # We need this module to remember what we saw on earlier runs.
+from writeback import writeBack, resumeWriteBack # We need this module to mark orders shipped on the marketplaces.
+from journal import Journal # We need this module to finish what a run that died left undone.
+from ratelimit import QuotaExceeded    # We need this to carry on when a marketplace's daily quota runs out.
 
-# First we'll configure the logger.
-currentDate = datetime.now().strftime('%Y-%m-%d')
-logging.basicConfig(filename=f'/home/joel/integration/{currentDate}_sync.log', level=logging.INFO, format='%(asctime)s %(message)s',filemode='a')
+# Every run lists the open marketplace orders and the Shippo orders created since the last run.
+# Shippo orders can be shipped a while after they're created, and Shippo can't list orders by when they
+# changed, so each run also lists the shipped orders among those created this far back.
+SHIPPO_LOOKBACK = timedelta(days=14)
+# Once a day we still list everything from every site, in case something slipped past the incremental runs.
+FULL_SYNC_INTERVAL = timedelta(hours=24)
 
+INTEGRATION_DIR = '/home/joel/integration/'
+API_KEYS_PATH = INTEGRATION_DIR + 'api_keys.json'
+STATE_PATH = INTEGRATION_DIR + 'sync_state.db'
+CACHE_PATH = INTEGRATION_DIR + 'http_cache.db'
+JOURNAL_PATH = INTEGRATION_DIR + 'sync_journal.jsonl'
+METRICS_PATH = INTEGRATION_DIR + 'last_run_metrics.json'
+LOG_PATH = INTEGRATION_DIR + 'sync.log'
+CRON_LOG_PATH = INTEGRATION_DIR + 'cronLog.txt'  # Where cron sends our stdout and stderr.
 
-logging.info("Starting sync.py")
+def configureLogging():
+    # Log to sync.log through log_pipeline, which rolls it over every day (or sooner if it gets big),
+    # gzips the old ones and deletes them after a couple of weeks. The cron log is archived the same way
+    # once it gets big, and the per-day logs we used to write are deleted once they're old enough.
+    startLogging(LOG_PATH, otherFiles=[CRON_LOG_PATH], legacyPattern=INTEGRATION_DIR + '*_sync.log')
 
-# The first thing to do is to check if the api_keys.json file exists.
-# If it doesn't, we need to exit the program.
-if not os.path.isfile('/home/joel/integration/api_keys.json'):
-    logging.error('api_keys.json file not found. Exiting program.')
-    sys.exit()
-# If the api_keys.json file exists, we need to read it.
-with open('api_keys.json', 'r') as f:
-    api_keys = json.load(f)
+def loadApiKeys(path=API_KEYS_PATH):
+    with open(path, 'r') as f:
+        return json.load(f)
 
-try: 
+def buildApis(api_keys, cachePath=CACHE_PATH):
     # Now that we have the API keys all sorted out, let's make objects for each API.
-    shippoApi = ShippoAPI(api_keys['shippo_live']) 
-    brickOwlApi = BrickOwlAPI(api_keys['brickowl'])
-    # Bricklink uses OAuth1, so we need to give it a few more parameters.
-    brickLinkApi = BrickLinkAPI(api_keys['bricklink_consumer_key'], api_keys['bricklink_consumer_secret'], api_keys['bricklink_token'], api_keys['bricklink_token_secret'])
-
-    # Now we'll get all the order stubs from each source.
-    shippoOrderStubs = shippoApi.getAllOrders()
-    brickOwlOrders = brickOwlApi.getAllOrders()
-    brickLinkOrders = brickLinkApi.getAllOrders()
-
-    logging.info(f"Got {len(shippoOrderStubs)} shippo order stubs.")
-    logging.info(f"Got {len(brickOwlOrders)} brickOwl order stubs.")
-    logging.info(f"Got {len(brickLinkOrders)} brickLink order stubs.")
-
-    # We'll filter through the brick owl orders and get the ones that have a status of 'Payment Received', 'Processing', or 'Processed'.
-    # We'll also make sure that the order is not already in the shippo orders list.
-    # Then, we'll add the order to the list of oders that need to be added to Shippo.
-    ordersToAddToShippo = []
-
-    for order in brickOwlOrders:
-        if order.status in ['Processed']:
-            if order.id not in [o.id for o in shippoOrderStubs]:
-                ordersToAddToShippo.append(order)
-    # Now we'll do the same thing for the brick link orders. But for brick link, we'll only add orders that have a status of 'PAID' or 'PACKED'.
-    for order in brickLinkOrders:
-        if order.status in ['PACKED']:
-            if order.id not in [o.id for o in shippoOrderStubs]:
-                ordersToAddToShippo.append(order)
-
-    logging.info(f'{len(ordersToAddToShippo)} orders need to be added to Shippo.')
-    logging.info(f'Adding: {ordersToAddToShippo}')
+    # Each one caches order details on disk, so a retried order doesn't download everything again next run.
+    # Every registered marketplace builds its own API object from the keys it needs.
+    shippoApi = ShippoAPI(api_keys['shippo_live'], cache=ResponseCache(SHIPPO_CACHE_TTLS, diskPath=cachePath))
+    marketplaceApis = {name: adapter.buildApi(api_keys, cachePath) for name, adapter in ADAPTERS.items()}
+    return shippoApi, marketplaceApis
+
+def recordAdds(addResults, store, journal):
+    # Remember what we added, so an incremental run never adds it again even before Shippo lists it back to us.
+    # Orders we couldn't confirm either way are remembered as 'UNKNOWN', so the next run doesn't add them
+    # a second time. The journal keeps them unfinished, so the next run looks for them in Shippo first.
+    # Orders Shippo turned down are dropped from the journal; they're still ready on the marketplace,
+    # so the next run's reconciliation tries them again.
+    ordersAddedToShippo = [r for r in addResults if r.ok]
+    ordersMaybeInShippo = [r for r in addResults if r.status == 'unknown']
+    store.saveStubs('shippo', [OrderStub(r.source, r.id, 'PAID', r.objectId) for r in ordersAddedToShippo])
+    store.saveStubs('shippo', [OrderStub(r.source, r.id, 'UNKNOWN') for r in ordersMaybeInShippo])
+    for result in addResults:
+        if result.ok:
+            journal.done('create', result.source, result.id, objectId=result.objectId)
+            continue
+        logging.warning('Failed to add %s order %s to Shippo (%s): %s', result.source, result.id, result.status, result.error)
+        if result.status == 'unknown':
+            journal.failed('create', result.source, result.id, result.error)
+        else:
+            journal.drop('create', result.source, result.id, result.error)
+    journal.sync()
+    return ordersAddedToShippo
+
+def resumeUnfinished(shippoApi, marketplaceApis, store, journal):
+    # Finishes whatever a run that died left unfinished in the journal, from what the journal remembered,
+    # and returns the (source, id) of every order it touched, so the rest of this run leaves them alone.
+    # Creates are looked for in Shippo before they're sent again; write-backs are simply done again.
+    touched = journal.keys()
+    if not touched:
+        return touched
+    logging.info('Resuming unfinished work on %d orders from the journal.', len(touched))
+    creates = []
+    for r in journal.unfinished('create'):
+        if journal.expired(r):
+            logging.error('Giving up on adding %s order %s to Shippo after %d tries.', r['source'], r['id'], r.get('attempts', 0))
+            journal.drop('create', r['source'], r['id'], 'gave up')
+        else:
+            creates.append(r)
+    if creates:
+        sentSince = datetime.fromtimestamp(min(r['at'] for r in creates), timezone.utc)
+        addResults = shippoApi.addOrderData([(r['source'], r['id'], r['order']) for r in creates], sentSince=sentSince)
+        logging.info('Resumed adding %d orders to Shippo: %d are there now.', len(creates), sum(r.ok for r in addResults))
+        recordAdds(addResults, store, journal)
+    results = resumeWriteBack(journal, shippoApi, marketplaceApis)
+    if results:
+        logging.info('Resumed writing back %d orders: %d finished.', len(results), sum(r.ok for r in results))
+    return touched
+
+def _untilQuotaRunsOut(name, listing):
+    # Once a marketplace's daily quota is used up, we stop listing it for this run. That only puts its
+    # unlisted orders off: nothing is added to Shippo or marked shipped for an order we didn't see.
+    try:
+        yield from listing
+    except QuotaExceeded:
+        logging.warning('The %s daily quota is used up; listing no more of its orders this run.', name)
+
+def runSync(shippoApi, marketplaceApis, store, metrics=DEFAULT_METRICS, journal=None):
+    # One pass of the sync. The API objects, the store and the journal are passed in so that the daemon can
+    # keep them (and their open connections) around between runs. Each phase is timed in metrics.
+    # marketplaceApis maps each marketplace's name (like 'bricklink') to its API object.
+    # Without a journal, a run that dies partway can't be resumed.
+    # Requests against a daily quota (BrickLink's) are counted in the store as well as the limiter,
+    # since a cron run, or a tenant, is a fresh process whose limiter starts from zero.
+    quotaLimiters = {name: api.limiter for name, api in [('shippo', shippoApi)] + list(marketplaceApis.items()) if api.limiter.dailyLimit is not None}
+    for name, limiter in quotaLimiters.items():
+        limiter.restoreUsage(*store.quotaUsed(name))
+    try:
+        return _runSync(shippoApi, marketplaceApis, store, metrics, journal)
+    finally:
+        for name, limiter in quotaLimiters.items():
+            day, used = limiter.usage()
+            if day is not None:
+                store.setQuotaUsed(name, day, used)
+
+def _runSync(shippoApi, marketplaceApis, store, metrics, journal):
+    journal = journal or Journal(None)
+    # Every run logs its first few write-backs and payloads again, however long the daemon has been up.
+    resetSamples()
+    runStarted = datetime.now(timezone.utc)
+    fullSync = store.needsFullSync(FULL_SYNC_INTERVAL)
+
+    # First, finish anything the last run started but didn't get to the end of.
+    with metrics.phase('resume'):
+        resumed = resumeUnfinished(shippoApi, marketplaceApis, store, journal)
+
+    # Now we'll get the order stubs from each source.
+    with metrics.phase('list_shippo'):
+        if fullSync:
+            # A full sync lists every order from every site, just like the first run ever did.
+            logging.info("Running a full sync.")
+            # If a page of the listing fails, this raises and the run stops before anything is decided:
+            # every order on the missing page would look like it isn't in Shippo, and be added again.
+            shippoOrderStubs = shippoApi.getAllOrders()
+            store.saveStubs('shippo', shippoOrderStubs)
+            # Orders an earlier run couldn't confirm, which Shippo doesn't have after all, can be added again.
+            store.pruneStubs('shippo', 'UNKNOWN', runStarted.timestamp())
+            marketplaceListings = {name: api.iterAllOrders() for name, api in marketplaceApis.items()}
+        else:
+            # An incremental sync asks Shippo for the orders created since the last run started (less a few
+            # minutes, in case Shippo's clock is behind ours), and for the orders shipped in the lookback window,
+            # which is all an older order can have changed to that matters here. Everything else comes from the
+            # store, which is local, so any order a run has seen counts as already in Shippo.
+            # The marketplaces only list open orders, since those are the only ones that can be added to Shippo
+            # or marked shipped.
+            createdSince = store.highWaterMark() - SHIPPO_CLOCK_SKEW
+            shippedSince = runStarted - SHIPPO_LOOKBACK
+            logging.info('Running an incremental sync of Shippo orders created since %s, and shipped since %s.', createdSince, shippedSince)
+            store.saveStubs('shippo', shippoApi.iterOrders(startDate=createdSince))
+            store.saveStubs('shippo', shippoApi.iterOrders(startDate=shippedSince, statuses=[SHIPPO_SHIPPED_STATUS]))
+            shippoOrderStubs = store.loadStubs('shippo')
+            marketplaceListings = {name: api.iterAllOrders(statuses=sorted(getAdapter(name).openStatuses)) for name, api in marketplaceApis.items()}
+
+    logging.info('Got %d shippo order stubs.', len(shippoOrderStubs))
+
+    # Now we'll work out what needs doing. The reconcile module indexes every stub by (source, id) once,
+    # so each check below is a set lookup instead of a scan of the whole Shippo list.
+    # Each marketplace's adapter says which statuses mean an order is ready for Shippo
+    # (Brick Owl orders once they are 'Processed', BrickLink orders once they are 'PACKED').
+    # Any order already in Shippo is skipped.
+    # The marketplace listings are streamed straight through the store and into the reconciliation,
+    # so we never hold a whole listing in memory and filtering starts while the download is still going.
+    marketplaceOrders = chain.from_iterable(store.recordStubs(name, _untilQuotaRunsOut(name, listing)) for name, listing in marketplaceListings.items())
+    with metrics.phase('list_marketplaces_and_reconcile'):
+        plan = reconcile(shippoOrderStubs, marketplaceOrders)
+
+    for name in marketplaceApis:
+        logging.info('Got %d %s order stubs.', plan.seen.get(name, 0), name)
+
+    # Orders we just resumed (or are still unsure about) were dealt with above.
+    ordersToAddToShippo = [o for o in plan.toAdd if stubKey(o) not in resumed]
+
+    # Lists of orders only go in the log as a Sample: how many from where, and the first few.
+    logging.info('%d orders need to be added to Shippo: %s', len(ordersToAddToShippo), Sample(ordersToAddToShippo))
 
     # Now we need to get order details for each order that needs to be added to Shippo.
     # The details will include the address and other important information.
+    # Each API fetches its orders (and their items) concurrently, within that marketplace's rate limit.
     ordersToAddToShippoWithDetails = []
-    for order in ordersToAddToShippo:
-        if order.source == 'brickowl':
-            orderDetails = brickOwlApi.getOrderDetails(order.id)
-            ordersToAddToShippoWithDetails.append(orderDetails)
-        elif order.source == 'bricklink':
-            orderDetails = brickLinkApi.getOrderDetails(order.id)
-            ordersToAddToShippoWithDetails.append(orderDetails)
-
-    logging.info(f'Got details for {len(ordersToAddToShippoWithDetails)} orders that need to be added to Shippo.')
-    logging.info(f'Adding: {ordersToAddToShippoWithDetails}')
+    with metrics.phase('fetch_details'):
+        for name, api in marketplaceApis.items():
+            ordersToAddToShippoWithDetails.extend(api.getOrderDetailsBatch([o.id for o in ordersToAddToShippo if o.source == name]))
+
+    logging.info('Got details for %d orders that need to be added to Shippo: %s', len(ordersToAddToShippoWithDetails), Sample(ordersToAddToShippoWithDetails))
     # Now we need to add the orders to Shippo.
 
-    ordersAddedToShippo = []
-    for order in ordersToAddToShippoWithDetails:
-        if shippoApi.addOrder(order): 
-            ordersAddedToShippo.append(order)
+    # They go in as one batch: each payload is built once, the requests run concurrently within Shippo's
+    # rate limit, and a request that might have worked is checked before it's ever sent again.
+    # Every payload is in the journal before the first request goes out, so if we die partway the next
+    # run can finish the batch without fetching any details again.
+    with metrics.phase('add_to_shippo'):
+        entries = [(o.source, o.id, shippoOrderData(o)) for o in ordersToAddToShippoWithDetails]
+        journal.plan('create', [{'source': source, 'id': orderId, 'order': orderData} for source, orderId, orderData in entries])
+        addResults = shippoApi.addOrderData(entries)
+    ordersAddedToShippo = recordAdds(addResults, store, journal)
 
-    logging.info(f'Added {len(ordersAddedToShippo)} orders to Shippo.')
-    logging.info(f'Added: {ordersAddedToShippo}')
+    logging.info('Added %d orders to Shippo: %s', len(ordersAddedToShippo), Sample(ordersAddedToShippo))
 
     # Now let's make sure that the orders are in the correct status.
-    # We'll start by getting all the orders from Shippo that have the status of "SHIPPED".
-    shippedShippoOrderStubs = [o for o in shippoOrderStubs if (o.source == "brickowl" or o.source == "bricklink") and o.status == "SHIPPED"]
-
-
-    logging.info(f'{len(shippedShippoOrderStubs)} orders are in the Shippo "SHIPPED" status.')
-    logging.info(f'Checking: {shippedShippoOrderStubs}')
-
-    for order in shippedShippoOrderStubs:
-        order_id = order.id
-        source = order.source
-        if source == 'brickowl':
-            if order_id in [o.id for o in brickOwlOrders if o.status in ['Payment Received', 'Processing', 'Processed']]:
-                if brickOwlApi.shipped(order_id):
-                    logging.info(f'Marked brickOwl order {order_id} as shipped.')
-                    shippoOrderDetails = shippoApi.getOrder(order.shippoObjectId)
-                    trackingNumber = shippoOrderDetails['transactions'][-1]['tracking_number']
-                    brickOwlApi.trackPackage(order.id, trackingNumber)
-                else:
-                    logging.info(f'Failed to mark brickOwl order {order_id} as shipped.')
-        elif source == 'bricklink':
-            if order_id in [o.id for o in brickLinkOrders if o.status in ['PAID', 'PACKED']]:
-                if brickLinkApi.shipped(order_id):
-                    logging.info(f'Marked brickLink order {order_id} as shipped.')
-                    shippoOrderDetails = shippoApi.getOrder(order.shippoObjectId)
-                    trackingNumber = shippoOrderDetails['transactions'][-1]['tracking_number']
-                    brickLinkApi.trackPackage(order.id, trackingNumber)
-                else:
-                    logging.info(f'Failed to mark brickLink order {order_id} as shipped.')
-
-    logging.info("Finished sync.py")
-    # Assuming this works, we're done for now!
-    
-    # If log files are older than 14 days, delete them
-    twoWeeksAgo = datetime.now() - timedelta(days=14)
-    lodDir = "/home/joel/integration/"
-    for file in os.listdir(lodDir):
-        if file.endswith(".log") and os.path.getmtime(lodDir + file) < twoWeeksAgo.timestamp():
-            os.remove(lodDir + file)
-            logging.info(f"Deleted {file}")
-
-    # If cronLog.txt is larger than 1GB, delete it
-    cronLog = "/home/joel/integration/cronLog.txt"
-    if os.path.getsize(cronLog) > 1000000000:
-        os.remove(cronLog)
-        logging.info(f"Deleted cronLog.txt")
-
-except Exception as e:
-    logging.error(f'Error: {e}')
\ No newline at end of file
+    # The plan already holds the Shippo orders that are "SHIPPED" while the marketplace order is still open
+    # ('Payment Received', 'Processing' or 'Processed' on Brick Owl, 'PAID' or 'PACKED' on BrickLink).
+    shippedShippoOrderStubs = [s for s in plan.toMarkShipped if stubKey(s) not in resumed]
+
+    logging.info('%d orders are in the Shippo "SHIPPED" status and still open on the marketplace: %s', len(shippedShippoOrderStubs), Sample(shippedShippoOrderStubs))
+
+    # Mark them shipped and push the tracking numbers. Every marketplace update runs concurrently
+    # (within that marketplace's limits) and failed calls are retried, so one bad order doesn't stop the rest.
+    with metrics.phase('write_back'):
+        results = writeBack(shippedShippoOrderStubs, shippoApi, marketplaceApis, journal)
+    for result in results:
+        if result.ok:
+            # Successes are sampled; every failure is logged.
+            logging.info('Marked %s order %s as shipped with tracking number %s.', result.source, result.id, result.trackingNumber, extra={'sample': 'write_back_ok'})
+        elif result.shipped:
+            logging.warning('Marked %s order %s as shipped, but failed to add tracking: %s', result.source, result.id, result.error)
+        else:
+            logging.warning('Failed to mark %s order %s as shipped: %s', result.source, result.id, result.error)
+    logging.info('Wrote back %d of %d shipped orders.', sum(r.ok for r in results), len(results))
+    for name, api in [('shippo', shippoApi)] + list(marketplaceApis.items()):
+        logging.info('%s response cache: %s', name, api.cache.stats())
+
+    # The run worked, so the next one can pick up from here.
+    store.setHighWaterMark(runStarted)
+    if fullSync:
+        store.markFullSync(runStarted)
+    # Everything finished is on disk in the journal by now; keep only what isn't.
+    journal.compact()
+    # Hand back what we worked out, for anyone (like replay.py) who wants to check it.
+    return plan
+
+def main():
+    # First we'll configure the logger.
+    configureLogging()
+    logging.info("Starting sync.py")
+
+    # The first thing to do is to check if the api_keys.json file exists.
+    # If it doesn't, we need to exit the program.
+    if not os.path.isfile(API_KEYS_PATH):
+        logging.error('api_keys.json file not found. Exiting program.')
+        sys.exit()
+    # If the api_keys.json file exists, we need to read it.
+    api_keys = loadApiKeys()
+
+    try:
+        shippoApi, marketplaceApis = buildApis(api_keys)
+        # The state store remembers the Shippo orders we've already seen, so most runs don't need to list them all again.
+        # The journal lets the next run finish what this one started, if it dies partway.
+        with StateStore(STATE_PATH) as store, Journal(JOURNAL_PATH) as journal:
+            runSync(shippoApi, marketplaceApis, store, journal=journal)
+        logging.info("Finished sync.py")
+        # Keep a summary of how long each request and phase took, for when a run seems slow.
+        DEFAULT_METRICS.writeJson(METRICS_PATH)
+        # Assuming this works, we're done for now! Old logs are rolled over and cleaned up by the log pipeline.
+    except Exception as e:
+        logging.exception('Error: %s', e)
+
+if __name__ == "__main__":
+    main()
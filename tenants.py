@@ -0,0 +1,167 @@
+# tenants.py
+# Written by Joel Peckham | joelskyler@gmail.com
+# Last Updated : Oct 17, 2026
+# Runs the sync for several stores (tenants) at once, each in its own process.
+# accounts.json lists the tenants:
+#   [{"name": "bigBoxOBricks", "dir": "/home/joel/integration/bigBoxOBricks/"},
+#    {"name": "another", "dir": "/home/joel/integration/another/", "keys": "/somewhere/else/api_keys.json"}]
+# Each tenant's dir holds its own api_keys.json (unless "keys" says otherwise),
+# state store, response cache, journal, metrics and log, just like the single
+# store setup keeps them in INTEGRATION_DIR. Every tenant runs in a fresh
+# process, so its sessions, rate limiters and metrics are its own, and one
+# tenant crashing (or running out of memory) can't take any of the others down.
+# Up to --workers tenants run at once. A tenant still running after --timeout is
+# killed so the ones behind it get their turn; its journal lets the next run
+# pick up where it stopped.
+# Usage (from cron, instead of sync.py):
+#   python tenants.py [--accounts accounts.json] [--workers 8] [--timeout 1800]
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import time
+from multiprocessing.connection import wait
+import sync
+from log_pipeline import startLogging, stopLogging
+
+ACCOUNTS_PATH = sync.INTEGRATION_DIR + 'accounts.json'
+TENANTS_LOG_PATH = sync.INTEGRATION_DIR + 'tenants.log'
+TENANTS_REPORT_PATH = sync.INTEGRATION_DIR + 'last_tenants_report.json'
+TENANT_TIMEOUT = 30 * 60        # Seconds a tenant's run may take before we kill it.
+
+class Tenant:
+    def __init__(self, name, directory, keysPath=None) -> None:
+        self.name = name
+        self.dir = directory
+        self.keysPath = keysPath or os.path.join(directory, os.path.basename(sync.API_KEYS_PATH))
+
+    def path(self, singleStorePath):
+        # Where this tenant keeps the file the single store setup keeps at singleStorePath.
+        return os.path.join(self.dir, os.path.basename(singleStorePath))
+
+    def __repr__(self):
+        return f"Tenant({self.name}, {self.dir})"
+
+class TenantResult:
+    def __init__(self, name) -> None:
+        self.name = name
+        self.ok = False
+        self.seconds = None
+        self.toAdd = None
+        self.toMarkShipped = None
+        self.error = None
+
+    def asDict(self):
+        return {'name': self.name, 'ok': self.ok, 'seconds': self.seconds, 'toAdd': self.toAdd, 'toMarkShipped': self.toMarkShipped, 'error': self.error}
+
+    def __repr__(self):
+        state = 'ok' if self.ok else f'failed ({self.error})'
+        return f"TenantResult({self.name}, {state})"
+
+def loadTenants(path=ACCOUNTS_PATH):
+    with open(path) as f:
+        accounts = json.load(f)
+    names = [a['name'] for a in accounts]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Tenant names in {path} must be unique.")
+    return [Tenant(a['name'], a['dir'], a.get('keys')) for a in accounts]
+
+def syncTenant(tenant):
+    # One run of the sync for one tenant, with everything it keeps in the tenant's dir.
+    # Runs in the tenant's own process, so DEFAULT_METRICS and the logging setup are this tenant's alone.
+    startLogging(tenant.path(sync.LOG_PATH), otherFiles=[tenant.path(sync.CRON_LOG_PATH)])
+    logging.info('Starting the sync for %s.', tenant.name)
+    shippoApi, marketplaceApis = sync.buildApis(sync.loadApiKeys(tenant.keysPath), cachePath=tenant.path(sync.CACHE_PATH))
+    with sync.StateStore(tenant.path(sync.STATE_PATH)) as store, sync.Journal(tenant.path(sync.JOURNAL_PATH)) as journal:
+        plan = sync.runSync(shippoApi, marketplaceApis, store, journal=journal)
+    sync.DEFAULT_METRICS.writeJson(tenant.path(sync.METRICS_PATH))
+    logging.info('Finished the sync for %s.', tenant.name)
+    return plan
+
+def _tenantProcess(tenant, conn):
+    result = TenantResult(tenant.name)
+    started = time.monotonic()
+    try:
+        plan = syncTenant(tenant)
+        result.ok, result.toAdd, result.toMarkShipped = True, len(plan.toAdd), len(plan.toMarkShipped)
+    except Exception as e:
+        logging.exception('The sync for %s failed: %s', tenant.name, e)
+        result.error = f'{type(e).__name__}: {e}'
+    finally:
+        stopLogging()
+    result.seconds = time.monotonic() - started
+    conn.send(result)
+    conn.close()
+
+def runTenants(tenants, workers=None, timeout=TENANT_TIMEOUT, target=_tenantProcess):
+    # Syncs every tenant, up to `workers` at a time, and returns a TenantResult for each, in the same order.
+    # Processes are spawned rather than forked, so none of them inherit this one's threads, sockets or locks.
+    # target(tenant, conn) runs in each process and sends back its TenantResult.
+    workers = workers or os.cpu_count()
+    context = multiprocessing.get_context('spawn')
+    waiting = list(tenants)
+    running = {}    # process sentinel -> (tenant, process, connection, when it started)
+    results = {}
+    while waiting or running:
+        while waiting and len(running) < workers:
+            tenant = waiting.pop(0)
+            conn, childConn = context.Pipe(duplex=False)
+            process = context.Process(target=target, args=(tenant, childConn), name=f'sync-{tenant.name}')
+            process.start()
+            childConn.close()
+            running[process.sentinel] = (tenant, process, conn, time.monotonic())
+            logging.info('Started the sync for %s (pid %d).', tenant.name, process.pid)
+        deadline = min(started + timeout for _, _, _, started in running.values())
+        finished = wait(list(running), timeout=max(0.0, deadline - time.monotonic()))
+        now = time.monotonic()
+        for sentinel in list(running):
+            tenant, process, conn, started = running[sentinel]
+            if sentinel not in finished and now < started + timeout:
+                continue
+            del running[sentinel]
+            if sentinel not in finished:
+                process.kill()
+            process.join()
+            try:
+                result = conn.recv()
+            except (EOFError, OSError):
+                # It crashed or was killed before it could send anything.
+                result = TenantResult(tenant.name)
+            conn.close()
+            if result.seconds is None:
+                result.seconds = now - started
+                result.error = f'timed out after {timeout:.0f} s' if sentinel not in finished else f'exited with code {process.exitcode}'
+            results[tenant.name] = result
+            logMethod = logging.info if result.ok else logging.error
+            logMethod('Sync for %s finished in %.1f s: %s', tenant.name, result.seconds, 'ok' if result.ok else result.error)
+    return [results[t.name] for t in tenants]
+
+def printReport(results, elapsed):
+    for r in results:
+        work = f'add {r.toAdd:>5}  write back {r.toMarkShipped:>5}' if r.ok else r.error
+        print(f"  {r.name:<24} {r.seconds:8.1f} s  {'ok' if r.ok else 'FAILED':<6}  {work}")
+    print(f"{sum(r.ok for r in results)} of {len(results)} tenants synced in {elapsed:.1f} s "
+          f"({sum(r.seconds for r in results) / elapsed if elapsed else 0:.1f}x faster than one at a time).")
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync every store in accounts.json, in parallel.")
+    parser.add_argument('--accounts', default=ACCOUNTS_PATH, help="the list of tenants")
+    parser.add_argument('--workers', type=int, default=None, help="most tenants to sync at once (default: one per CPU)")
+    parser.add_argument('--timeout', type=float, default=TENANT_TIMEOUT, help="seconds before a tenant's run is killed")
+    parser.add_argument('--report', default=TENANTS_REPORT_PATH, help="write per-tenant timings and errors here as JSON")
+    args = parser.parse_args()
+
+    startLogging(TENANTS_LOG_PATH)
+    tenants = loadTenants(args.accounts)
+    logging.info('Syncing %d tenants.', len(tenants))
+    started = time.monotonic()
+    results = runTenants(tenants, args.workers, args.timeout)
+    elapsed = time.monotonic() - started
+    with open(args.report, 'w') as f:
+        json.dump({'seconds': elapsed, 'tenants': [r.asDict() for r in results]}, f, indent=2)
+    printReport(results, elapsed)
+
+if __name__ == "__main__":
+    main()
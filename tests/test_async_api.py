@@ -0,0 +1,65 @@
+# test_async_api.py
+# Written by Joel Peckham | joelskyler@gmail.com
+# Last Updated : Oct 17, 2026
+# The asyncio clients against the fake servers, including BrickLink's OAuth1 signatures.
+
+import asyncio
+import pytest
+
+pytest.importorskip('aiohttp')
+import fake_servers
+from async_api import AsyncBrickLinkAPI, AsyncBrickOwlAPI, AsyncShippoAPI
+from ratelimit import RateLimiter
+from shippo_api import ShippoListingFailed
+
+def limiter():
+    return RateLimiter(1000, burst=100)
+
+def test_bricklink_signs_every_attempt():
+    orders = [fake_servers.syntheticBrickLinkOrder(n) for n in range(10)]
+    ids = [str(o['order_id']) for o, _ in orders]
+    async def run(server):
+        async with AsyncBrickLinkAPI('ck', 'cs', 't', 'ts', baseUrl=server.url, limiter=limiter()) as api:
+            return await api.getOrderDetailsBatch(ids), await api.getAllOrders(statuses=['PACKED']), await api.shipped(ids[0])
+    # Some requests fail and are retried; a retry that reused its signature's nonce would be turned away.
+    with fake_servers.FakeBrickLinkServer(orders, failureRate=0.2, seed=1, secrets=('cs', 'ts')) as server:
+        fetched, listing, shipped = asyncio.run(run(server))
+        assert server.failedCount > 0 and server.rejectedCount == 0
+    assert sorted(o.id for o in fetched) == ids and all(o.items for o in fetched)
+    assert len(listing) == 10 and shipped
+    assert server.orders[ids[0]][0]['status'] == 'SHIPPED'
+
+def test_bricklink_with_the_wrong_secret_is_turned_away():
+    orders = [fake_servers.syntheticBrickLinkOrder(0)]
+    async def run(server):
+        async with AsyncBrickLinkAPI('ck', 'wrong', 't', 'ts', baseUrl=server.url, limiter=limiter()) as api:
+            return await api.getOrderDetailsBatch([str(orders[0][0]['order_id'])])
+    with fake_servers.FakeBrickLinkServer(orders, secrets=('cs', 'ts')) as server:
+        assert asyncio.run(run(server)) == []
+        assert server.rejectedCount == 2    # The order and its items.
+
+def test_brickowl_details_and_write_back():
+    orders = [fake_servers.syntheticBrickOwlOrder(n) for n in range(10)]
+    ids = [str(o['order_id']) for o, _ in orders]
+    async def run(server):
+        async with AsyncBrickOwlAPI('key', baseUrl=server.url, limiter=limiter()) as api:
+            fetched = await api.getOrderDetailsBatch(ids)
+            await api.shipped(ids[0])
+            await api.trackPackage(ids[0], '9400111')
+            return fetched, await api.getAllOrders(statuses=['Processed'])
+    with fake_servers.FakeBrickOwlServer(orders) as server:
+        fetched, listing = asyncio.run(run(server))
+        assert server.tracking == {ids[0]: '9400111'}
+    assert sorted(o.id for o in fetched) == ids
+    assert sorted(s.id for s in listing) == ids[1:]
+
+def test_shippo_listing_follows_every_page_and_fails_loudly():
+    shippoOrders = [fake_servers.syntheticShippoOrder(n, 'PAID') for n in range(250)]
+    async def run(server):
+        async with AsyncShippoAPI('token', baseUrl=server.url, limiter=limiter()) as api:
+            return await api.getAllOrders()
+    with fake_servers.FakeShippoServer(shippoOrders, maxPageSize=100) as server:
+        assert len({s.id for s in asyncio.run(run(server))}) == 250
+    with fake_servers.FakeShippoServer(shippoOrders, maxPageSize=100, failureRate=1.0) as server:
+        with pytest.raises(ShippoListingFailed):
+            asyncio.run(run(server))
@@ -0,0 +1,37 @@
+# test_daemon.py
+# Written by Joel Peckham | joelskyler@gmail.com
+# Last Updated : Oct 17, 2026
+# The signal handler must only set flags; what it was asked to do is logged from the run loop.
+
+import logging
+import signal
+import time
+import pytest
+
+pytest.importorskip('requests')
+from daemon import SyncDaemon
+
+def test_signals_are_logged_outside_the_handler(caplog, tmp_path):
+    daemon = SyncDaemon(statePath=str(tmp_path / 'state.db'), journalPath=str(tmp_path / 'journal.jsonl'))
+    with caplog.at_level(logging.INFO):
+        daemon.handleSignal(signal.SIGHUP, None)
+        daemon.handleSignal(signal.SIGTERM, None)
+        assert caplog.records == []
+        assert daemon.reloadRequested and daemon.stopping
+        daemon.logSignals()
+    assert [r.getMessage() for r in caplog.records] == [
+        "Got SIGHUP, reloading config before the next run.",
+        f"Got signal {int(signal.SIGTERM)}, stopping after the current run.",
+    ]
+
+def test_a_signal_cuts_the_wait_short(tmp_path):
+    daemon = SyncDaemon(statePath=str(tmp_path / 'state.db'), journalPath=str(tmp_path / 'journal.jsonl'))
+    signal.signal(signal.SIGALRM, lambda signum, frame: daemon.handleSignal(signal.SIGTERM, frame))
+    try:
+        signal.setitimer(signal.ITIMER_REAL, 0.2)
+        started = time.monotonic()
+        daemon.sleep(30)
+        assert daemon.stopping and time.monotonic() - started < 2
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, signal.SIG_DFL)
@@ -0,0 +1,52 @@
+# test_http_cache.py
+# Written by Joel Peckham | joelskyler@gmail.com
+# Last Updated : Oct 17, 2026
+# Every wrapper's cache shares one SQLite file; none of them may prune the others' entries.
+
+import pytest
+
+requests = pytest.importorskip('requests')
+from http_cache import ResponseCache
+from brickowl_api import BRICKOWL_CACHE_TTLS
+from bricklink_api import BRICKLINK_CACHE_TTLS
+from shippo_api import SHIPPO_CACHE_TTLS
+
+ITEMS_URL = 'https://api.brickowl.com/v1/order/items'
+VIEW_URL = 'https://api.brickowl.com/v1/order/view'
+
+def response(body):
+    res = requests.Response()
+    res.status_code = 200
+    res._content = body
+    return res
+
+def allCaches(path):
+    # The way sync.buildApis builds them, Shippo's first.
+    return [ResponseCache(ttls, diskPath=path) for ttls in (SHIPPO_CACHE_TTLS, BRICKOWL_CACHE_TTLS, BRICKLINK_CACHE_TTLS)]
+
+def backdate(cache, seconds):
+    with cache.disk.db:
+        cache.disk.db.execute("UPDATE responses SET stored = stored - ?, expires = expires - ?", (seconds, seconds))
+
+def test_caches_on_one_file_keep_each_others_entries(tmp_path):
+    path = str(tmp_path / 'http_cache.db')
+    _, brickowl, _ = allCaches(path)
+    brickowl.get(ITEMS_URL, {'order_id': '1'}, lambda headers: response(b'[1]'))
+    backdate(brickowl, 60 * 60)     # Fetched by an earlier run, an hour ago.
+
+    _, brickowl, _ = allCaches(path)
+    fetched = []
+    res = brickowl.get(ITEMS_URL, {'order_id': '1'}, lambda headers: fetched.append(1) or response(b'[2]'))
+    assert res.content == b'[1]' and fetched == []
+    assert brickowl.stats()['hits'] == 1
+
+def test_expired_entries_are_pruned(tmp_path):
+    path = str(tmp_path / 'http_cache.db')
+    _, brickowl, _ = allCaches(path)
+    brickowl.get(VIEW_URL, {'order_id': '1'}, lambda headers: response(b'{}'))
+    brickowl.get(ITEMS_URL, {'order_id': '1'}, lambda headers: response(b'[]'))
+    backdate(brickowl, 60 * 60)     # Twice the 10 minute TTL of order views has passed, not of items.
+
+    allCaches(path)
+    keys = [row[0] for row in brickowl.disk.db.execute("SELECT key FROM responses")]
+    assert keys == [f'{ITEMS_URL}?order_id=1']
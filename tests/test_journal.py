@@ -0,0 +1,70 @@
+# test_journal.py
+# Written by Joel Peckham | joelskyler@gmail.com
+# Last Updated : Oct 17, 2026
+# An order marked shipped by a run that then died must still get its tracking number,
+# however many runs it takes for Shippo to have one.
+
+import multiprocessing
+import os
+import pytest
+
+pytest.importorskip('requests')
+import fake_servers
+from brickowl_api import BrickOwlAPI
+from journal import Journal
+from order import OrderStub
+from ratelimit import RateLimiter
+from shippo_api import ShippoAPI
+from writeback import writeBack, resumeWriteBack
+
+ORDER_ID = str(fake_servers.BRICKOWL_ID_BASE)
+OBJECT_ID = f'{0:032x}'
+
+@pytest.fixture
+def servers():
+    shippoOrder = fake_servers.syntheticShippoOrder(0, 'SHIPPED')
+    shippoOrder['transactions'] = []    # Marked shipped, but no label bought yet.
+    with fake_servers.FakeShippoServer([shippoOrder]) as shippo, \
+         fake_servers.FakeBrickOwlServer([fake_servers.syntheticBrickOwlOrder(0, 'Processed')]) as brickowl:
+        yield shippo, brickowl
+
+def apis(shippo, brickowl):
+    return (ShippoAPI('token', baseUrl=shippo.url, limiter=RateLimiter(1000, burst=100)),
+            {'brickowl': BrickOwlAPI('key', baseUrl=brickowl.url, limiter=RateLimiter(1000, burst=100))})
+
+def crashingRun(shippo, brickowl, path):
+    # Write back in a child that dies without closing anything, so unsynced completions are lost like in a real crash.
+    def run():
+        shippoApi, marketplaceApis = apis(shippo, brickowl)
+        writeBack([OrderStub('brickowl', ORDER_ID, 'SHIPPED', OBJECT_ID)], shippoApi, marketplaceApis, Journal(path))
+        os._exit(0)
+    process = multiprocessing.get_context('fork').Process(target=run)
+    process.start()
+    process.join()
+
+def test_tracking_is_pushed_once_shippo_has_it(servers, tmp_path):
+    shippo, brickowl = servers
+    path = str(tmp_path / 'journal.jsonl')
+    crashingRun(shippo, brickowl, path)
+    assert brickowl.orders[ORDER_ID][0]['status'] == 'Shipped'
+    # The order isn't open any more, so only the journal remembers it. Plenty of runs go by without a label.
+    for _ in range(20):
+        with Journal(path) as journal:
+            assert ('brickowl', ORDER_ID) in journal.keys()
+            resumeWriteBack(journal, *apis(shippo, brickowl))
+    assert ORDER_ID not in brickowl.tracking
+
+    shippo.find(OBJECT_ID)['transactions'] = [{'object_id': 't1', 'tracking_number': '9400111'}]
+    with Journal(path) as journal:
+        results = resumeWriteBack(journal, *apis(shippo, brickowl))
+        assert [r.ok for r in results] == [True]
+        assert journal.keys() == set()
+    assert brickowl.tracking[ORDER_ID] == '9400111'
+
+def test_gives_up_once_the_time_is_up(servers, tmp_path):
+    shippo, brickowl = servers
+    path = str(tmp_path / 'journal.jsonl')
+    crashingRun(shippo, brickowl, path)
+    with Journal(path, giveUpAfter=0) as journal:
+        assert resumeWriteBack(journal, *apis(shippo, brickowl)) == []
+        assert journal.keys() == set()
@@ -0,0 +1,34 @@
+# test_log_pipeline.py
+# Written by Joel Peckham | joelskyler@gmail.com
+# Last Updated : Oct 17, 2026
+# Sampled log lines start over with every run, so a long-lived daemon keeps logging them.
+
+import logging
+import log_pipeline
+from log_pipeline import SampleFilter
+
+def record(key):
+    r = logging.LogRecord('sync', logging.INFO, __file__, 0, 'Marked order shipped.', (), None)
+    r.sample = key
+    return r
+
+def test_samples_start_over_after_a_reset():
+    sampleFilter = SampleFilter(first=3, every=100)
+    assert [sampleFilter.filter(record('write_back_ok')) for _ in range(5)] == [True, True, True, False, False]
+    sampleFilter.reset()
+    assert [sampleFilter.filter(record('write_back_ok')) for _ in range(5)] == [True, True, True, False, False]
+
+def test_reset_samples_reaches_the_pipelines_filter(tmp_path):
+    log_pipeline.startLogging(str(tmp_path / 'sync.log'))
+    try:
+        [handler] = logging.getLogger().handlers
+        [sampleFilter] = handler.filters
+        for _ in range(log_pipeline.LOG_SAMPLE_FIRST + 1):
+            sampleFilter.filter(record('shippo_payload'))
+        log_pipeline.resetSamples()
+        assert sampleFilter.filter(record('shippo_payload'))
+        assert sampleFilter.seen['shippo_payload'] == 1
+    finally:
+        log_pipeline.stopLogging()
+        for handler in logging.getLogger().handlers[:]:
+            logging.getLogger().removeHandler(handler)
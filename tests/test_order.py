@@ -0,0 +1,15 @@
+# test_order.py
+# Written by Joel Peckham | joelskyler@gmail.com
+# Last Updated : Oct 17, 2026
+# Brick Owl order times are kept as unix timestamps until Order.created is read.
+
+import fake_servers
+from marketplaces import BRICKOWL
+from order import unixToLocalTime
+
+def test_brickowl_created_is_formatted_on_first_read():
+    order, items = fake_servers.syntheticBrickOwlOrder(0)
+    [normalized] = BRICKOWL.normalizeOrders([order], [items])
+    assert normalized._created == int(fake_servers.SYNTHETIC_ORDER_TIME)
+    assert normalized.created == unixToLocalTime(fake_servers.SYNTHETIC_ORDER_TIME)
+    assert normalized._created == normalized.created    # Formatted once, then kept.
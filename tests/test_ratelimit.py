@@ -0,0 +1,125 @@
+# test_ratelimit.py
+# Written by Joel Peckham | joelskyler@gmail.com
+# Last Updated : Oct 17, 2026
+# The rate limiter and retry rules, on their own and against fake servers that throttle and fail.
+
+import time
+import pytest
+import ratelimit
+from ratelimit import RateLimiter, _retryDelay
+
+class FakeResponse:
+    def __init__(self, status_code, retryAfter=None) -> None:
+        self.status_code = status_code
+        self.headers = {'Retry-After': str(retryAfter)} if retryAfter is not None else {}
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+def test_429_is_retried_even_when_not_idempotent():
+    limiter = RateLimiter(10, burst=10)
+    assert _retryDelay(limiter, 0, FakeResponse(429), idempotent=False, retries=4) is not None
+    assert limiter.rate == 5    # And the limiter backed off.
+
+def test_429_gives_up_after_the_last_retry():
+    assert _retryDelay(RateLimiter(10), 4, FakeResponse(429), idempotent=True, retries=4) is None
+
+def test_server_errors_are_only_retried_when_idempotent():
+    limiter = RateLimiter(10)
+    assert _retryDelay(limiter, 0, FakeResponse(503, retryAfter=2), idempotent=True, retries=4) >= 2
+    assert _retryDelay(limiter, 0, FakeResponse(503), idempotent=False, retries=4) is None
+    assert _retryDelay(limiter, 0, FakeResponse(400), idempotent=True, retries=4) is None
+
+def test_connection_errors_are_only_retried_when_idempotent():
+    assert _retryDelay(RateLimiter(10), 0, None, idempotent=True, retries=4) is not None
+    assert _retryDelay(RateLimiter(10), 0, None, idempotent=False, retries=4) is None
+
+def test_success_creeps_back_to_the_full_rate():
+    limiter = RateLimiter(20)
+    limiter.throttled()
+    assert limiter.rate == 10
+    for _ in range(20):
+        _retryDelay(limiter, 0, FakeResponse(200), idempotent=True, retries=4)
+    assert limiter.rate == 20
+
+def test_retry_after_holds_every_caller():
+    limiter = RateLimiter(100, burst=100)
+    limiter.throttled(retryAfter=1.5)
+    assert not limiter.tryAcquire()
+    assert limiter.reserve() >= 1.4
+
+def test_send_with_retry_stops_on_a_non_idempotent_server_error(monkeypatch):
+    monkeypatch.setattr(ratelimit.time, 'sleep', lambda seconds: None)
+    calls = []
+    def request():
+        calls.append(1)
+        return FakeResponse(503)
+    assert ratelimit.sendWithRetry(request, RateLimiter(1000, burst=100), idempotent=False).status_code == 503
+    assert len(calls) == 1
+    calls.clear()
+    res = ratelimit.sendWithRetry(request, RateLimiter(1000, burst=100), idempotent=True, retries=3)
+    assert res.status_code == 503 and len(calls) == 4
+
+def test_daily_quota():
+    limiter = RateLimiter(1000, burst=100, dailyLimit=3)
+    for _ in range(3):
+        limiter.reserve()
+    with pytest.raises(ratelimit.QuotaExceeded):
+        limiter.reserve()
+
+def test_daily_quota_carries_over_to_a_new_limiter():
+    first = RateLimiter(1000, burst=100, dailyLimit=3)
+    first.reserve()
+    first.reserve()
+    second = RateLimiter(1000, burst=100, dailyLimit=3)
+    second.restoreUsage(*first.usage())
+    second.reserve()
+    with pytest.raises(ratelimit.QuotaExceeded):
+        second.reserve()
+    # A count from another day doesn't carry over.
+    third = RateLimiter(1000, burst=100, dailyLimit=3)
+    third.restoreUsage('2000-01-01', 3)
+    third.reserve()
+
+# Against the fake servers, through the real API wrappers.
+
+@pytest.fixture
+def fakeServers():
+    pytest.importorskip('requests')
+    import fake_servers
+    return fake_servers
+
+def test_every_order_is_fetched_from_a_throttling_server(fakeServers):
+    from brickowl_api import BrickOwlAPI
+    quota, count = 20, 60
+    orders = [fakeServers.syntheticBrickOwlOrder(n) for n in range(count)]
+    ids = [str(o['order_id']) for o, _ in orders]
+    # A limiter set well over the quota, so the server has to push back.
+    with fakeServers.FakeBrickOwlServer(orders, throttle=quota) as server:
+        api = BrickOwlAPI('key', baseUrl=server.url, limiter=RateLimiter(quota * 4, burst=quota))
+        fetched = api.getOrderDetailsBatch(ids)
+        assert server.throttledCount > 0
+    assert sorted(o.id for o in fetched) == sorted(ids)
+    assert all(o.items for o in fetched)
+
+def test_post_is_not_resent_on_503(fakeServers):
+    from shippo_api import ShippoAPI
+    with fakeServers.FakeShippoServer([], failureRate=1.0) as server:
+        api = ShippoAPI('token', baseUrl=server.url, limiter=RateLimiter(1000, burst=100))
+        res = api._post(f'{server.url}/orders', body={'order_number': '1'})
+        assert res.status_code == 503
+        assert server.counts() == {'requests': 1, 'throttled': 0, 'failed': 1}
+
+def test_waits_out_retry_after(fakeServers):
+    from brickowl_api import BrickOwlAPI
+    orders = [fakeServers.syntheticBrickOwlOrder(n) for n in range(2)]
+    # One request a second, and a throttled client is told to wait a second.
+    with fakeServers.FakeBrickOwlServer(orders, throttle=1) as server:
+        api = BrickOwlAPI('key', baseUrl=server.url, limiter=RateLimiter(1000, burst=100))
+        started = time.monotonic()
+        assert api._getOrderData(str(orders[0][0]['order_id'])) is not None
+        assert api._getOrderData(str(orders[1][0]['order_id'])) is not None
+        elapsed = time.monotonic() - started
+        assert server.throttledCount == 1
+    assert elapsed >= 0.95
@@ -0,0 +1,19 @@
+# test_reconcile.py
+# Written by Joel Peckham | joelskyler@gmail.com
+# Last Updated : Oct 17, 2026
+# An order must be planned once, however many times a listing repeats it.
+
+from order import OrderStub
+from reconcile import reconcile
+
+def test_a_repeated_shippo_stub_is_marked_shipped_once():
+    shipped = OrderStub('brickowl', '1000000', 'SHIPPED', 'obj0', '9400111')
+    plan = reconcile([shipped, OrderStub('brickowl', '1000000', 'SHIPPED', 'obj0', '9400111')],
+                     [OrderStub('brickowl', '1000000', 'Processed')])
+    assert plan.toAdd == []
+    assert [(s.source, s.id) for s in plan.toMarkShipped] == [('brickowl', '1000000')]
+
+def test_a_repeated_marketplace_stub_is_added_once():
+    ready = OrderStub('bricklink', '10000001', 'PACKED')
+    plan = reconcile(iter([]), iter([ready, OrderStub('bricklink', '10000001', 'PACKED')]))
+    assert plan.toAdd == [ready] and plan.toMarkShipped == []
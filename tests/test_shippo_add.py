@@ -0,0 +1,59 @@
+# test_shippo_add.py
+# Written by Joel Peckham | joelskyler@gmail.com
+# Last Updated : Oct 17, 2026
+# Adding a batch to Shippo must leave exactly one Shippo order per order number,
+# whatever happened to the responses, and however many times a batch is resumed.
+
+from collections import Counter
+from datetime import datetime, timezone
+import pytest
+
+pytest.importorskip('requests')
+import fake_servers
+from ratelimit import RateLimiter
+from shippo_api import ShippoAPI
+
+NUMBERS = [str(2000 + n) for n in range(8)]
+
+def entries(numbers):
+    return [('brickowl', number, {'order_number': number, 'order_status': 'PAID', 'notes': 'source:brickowl'}) for number in numbers]
+
+def shippoOrderCounts(server):
+    return Counter(o['order_number'] for o in server.created)
+
+def api(server):
+    return ShippoAPI('token', baseUrl=server.url, limiter=RateLimiter(1000, burst=100))
+
+def test_lost_responses_are_looked_up_and_refused_orders_resent():
+    lost, refused = NUMBERS[:2], NUMBERS[2:4]
+    with fake_servers.FakeShippoServer([], lose=lost, refuse=refused) as server:
+        # The first order is in the batch twice; it must still only be sent once.
+        results = api(server).addOrderData(entries(NUMBERS + NUMBERS[:1]))
+        # One Shippo order each: the lost ones were found, not sent again, and the refused ones were re-sent.
+        assert shippoOrderCounts(server) == Counter(NUMBERS)
+        assert server.refuse == set() and server.lose == set()
+    assert [r.status for r in results] == ['created'] * (len(NUMBERS) + 1)
+    assert len({r.objectId for r in results}) == len(NUMBERS)
+    assert results[-1].objectId == results[0].objectId
+
+def test_orders_stay_unknown_when_shippo_cant_be_checked(monkeypatch):
+    with fake_servers.FakeShippoServer([], lose=NUMBERS[:1]) as server:
+        shippoApi = api(server)
+        monkeypatch.setattr(shippoApi, '_getPage', lambda url, params=None: None)
+        results = shippoApi.addOrderData(entries(NUMBERS[:2]))
+        # Without a listing to prove it's missing, the lost order is never sent again.
+        assert shippoOrderCounts(server) == Counter(NUMBERS[:2])
+    assert [r.status for r in results] == ['unknown', 'created']
+
+def test_resuming_a_batch_only_sends_what_is_missing():
+    with fake_servers.FakeShippoServer([]) as server:
+        sentSince = datetime.now(timezone.utc)
+        # A run that died after sending half the batch.
+        api(server).addOrderData(entries(NUMBERS[:4]))
+        results = api(server).addOrderData(entries(NUMBERS), sentSince=sentSince)
+        assert shippoOrderCounts(server) == Counter(NUMBERS)
+        # And resuming the same batch again sends nothing.
+        again = api(server).addOrderData(entries(NUMBERS), sentSince=sentSince)
+        assert shippoOrderCounts(server) == Counter(NUMBERS)
+    assert [r.status for r in results] == ['created'] * len(NUMBERS)
+    assert [r.objectId for r in again] == [r.objectId for r in results]
@@ -0,0 +1,43 @@
+# test_shippo_cache.py
+# Written by Joel Peckham | joelskyler@gmail.com
+# Last Updated : Oct 17, 2026
+# Shippo listings and tracking lookups must always come from Shippo, never the response cache.
+
+from datetime import datetime, timezone
+import pytest
+
+pytest.importorskip('requests')
+import fake_servers
+from http_cache import ResponseCache
+from ratelimit import RateLimiter
+from shippo_api import ShippoAPI, SHIPPO_CACHE_TTLS
+
+def shippoOrder(n, status='PAID', transactions=()):
+    return {'object_id': f'{n:032x}', 'object_created': fake_servers.SYNTHETIC_ORDER_DATE, 'order_number': str(1000000 + n),
+            'order_status': status, 'notes': 'source:brickowl', 'transactions': list(transactions)}
+
+def test_next_links_are_never_cached():
+    cache = ResponseCache(SHIPPO_CACHE_TTLS)
+    assert cache.ttlFor('https://api.goshippo.com/v1/orders/?page=2&results=100') is None
+    assert cache.ttlFor('https://api.goshippo.com/v1/orders/') is None
+    assert cache.ttlFor(f'https://api.goshippo.com/v1/orders/{7:032x}') == 600
+
+def test_find_created_never_reads_pages_from_the_cache():
+    # 250 orders is three pages, so _findCreated has to follow 'next' links.
+    with fake_servers.FakeShippoServer([shippoOrder(n) for n in range(250)], maxPageSize=100) as server:
+        api = ShippoAPI('token', baseUrl=server.url, limiter=RateLimiter(1000, burst=100))
+        since = datetime(2020, 1, 1, tzinfo=timezone.utc)
+        assert len(api._findCreated({str(1000000 + n) for n in range(250)}, since)) == 250
+        first = server.counts()['requests']
+        api._findCreated({'1000000'}, since)
+        assert server.counts()['requests'] == 2 * first
+        assert api.cache.stats()['hits'] == 0
+
+def test_tracking_numbers_are_not_served_from_the_cache():
+    with fake_servers.FakeShippoServer([shippoOrder(1, 'SHIPPED')]) as server:
+        api = ShippoAPI('token', baseUrl=server.url, limiter=RateLimiter(1000, burst=100))
+        objectId = f'{1:032x}'
+        assert api.getTrackingNumbers([objectId]) == {}
+        api.getOrder(objectId)  # Now it's in the cache, without a label.
+        server.find(objectId)['transactions'] = [{'tracking_number': '9400111'}]
+        assert api.getTrackingNumbers([objectId]) == {objectId: '9400111'}
@@ -0,0 +1,87 @@
+# test_sync.py
+# Written by Joel Peckham | joelskyler@gmail.com
+# Last Updated : Oct 17, 2026
+# What a sync run asks Shippo for, and what it does when Shippo doesn't answer.
+
+from datetime import timedelta
+import pytest
+
+pytest.importorskip('requests')
+import fake_servers
+import sync
+from brickowl_api import BrickOwlAPI
+from metrics import Metrics
+from ratelimit import RateLimiter
+from shippo_api import ShippoAPI, ShippoListingFailed, SHIPPO_CLOCK_SKEW
+from state_store import StateStore
+
+ORDERS = range(0, 500, 2)   # Even synthetic orders are Brick Owl ones.
+
+@pytest.fixture
+def servers():
+    with fake_servers.FakeShippoServer([fake_servers.syntheticShippoOrder(n, 'PAID') for n in ORDERS], maxPageSize=100) as shippo, \
+         fake_servers.FakeBrickOwlServer([fake_servers.syntheticBrickOwlOrder(n, 'Processed') for n in ORDERS]) as brickowl:
+        yield shippo, brickowl
+
+def apis(shippo, brickowl):
+    return (ShippoAPI('token', baseUrl=shippo.url, limiter=RateLimiter(1000, burst=100)),
+            {'brickowl': BrickOwlAPI('key', baseUrl=brickowl.url, limiter=RateLimiter(1000, burst=100))})
+
+def test_full_sync_stops_on_a_failed_page(servers, tmp_path, monkeypatch):
+    shippo, brickowl = servers
+    shippoApi, marketplaceApis = apis(shippo, brickowl)
+    getPage = shippoApi._getPage
+    monkeypatch.setattr(shippoApi, '_getPage', lambda url, params=None: None if (params or {}).get('page') == 2 else getPage(url, params))
+    with StateStore(str(tmp_path / 'state.db')) as store:
+        with pytest.raises(ShippoListingFailed):
+            sync.runSync(shippoApi, marketplaceApis, store, Metrics())
+        # Nothing was added again, and the next run is still a full sync.
+        assert shippo.created == []
+        assert store.needsFullSync(sync.FULL_SYNC_INTERVAL)
+    monkeypatch.undo()
+    with StateStore(str(tmp_path / 'state.db')) as store:
+        plan = sync.runSync(shippoApi, marketplaceApis, store, Metrics())
+    assert plan.toAdd == [] and shippo.created == []
+
+def test_incremental_sync_lists_new_orders_and_recent_shipments(servers, tmp_path, monkeypatch):
+    shippo, brickowl = servers
+    shippoApi, marketplaceApis = apis(shippo, brickowl)
+    with StateStore(str(tmp_path / 'state.db')) as store:
+        sync.runSync(shippoApi, marketplaceApis, store, Metrics())
+        mark = store.highWaterMark()
+        # An order from last week gets shipped. It's the only one in the lookback window.
+        order = shippo.find(f'{0:032x}')
+        order['order_status'] = 'SHIPPED'
+        order['object_created'] = (mark - timedelta(days=7)).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+        order['transactions'] = [{'object_id': 't0', 'tracking_number': '9400111'}]
+        listings = []
+        iterOrders = shippoApi.iterOrders
+        monkeypatch.setattr(shippoApi, 'iterOrders', lambda **kwargs: listings.append(kwargs) or iterOrders(**kwargs))
+        before = shippo.counts()['requests']
+        plan = sync.runSync(shippoApi, marketplaceApis, store, Metrics())
+    assert listings == [{'startDate': mark - SHIPPO_CLOCK_SKEW},
+                        {'startDate': listings[1]['startDate'], 'statuses': ['SHIPPED']}]
+    assert abs(mark - listings[1]['startDate'] - sync.SHIPPO_LOOKBACK) < timedelta(minutes=1)
+    # Two one-page listings (the tracking number comes with the shipped one), instead of every order from the last two weeks.
+    assert shippo.counts()['requests'] - before == 2
+    assert [s.id for s in plan.toMarkShipped] == [order['order_number']]
+    assert brickowl.tracking[order['order_number']] == '9400111'
+
+def test_bricklink_daily_quota_holds_across_runs(tmp_path, monkeypatch):
+    from bricklink_api import BrickLinkAPI
+    monkeypatch.setenv('OAUTHLIB_INSECURE_TRANSPORT', '1')
+    orders = [fake_servers.syntheticBrickLinkOrder(n) for n in range(1, 11, 2)]
+    with fake_servers.FakeShippoServer([]) as shippo, fake_servers.FakeBrickLinkServer(orders) as bricklink:
+        def run(store):
+            # A fresh API every run, like a cron run's, allowed the listing and five more requests a day.
+            marketplaceApis = {'bricklink': BrickLinkAPI('ck', 'cs', 't', 'ts', baseUrl=bricklink.url, limiter=RateLimiter(1000, burst=100, dailyLimit=6))}
+            return sync.runSync(ShippoAPI('token', baseUrl=shippo.url, limiter=RateLimiter(1000, burst=100)), marketplaceApis, store, Metrics())
+        with StateStore(str(tmp_path / 'state.db')) as store:
+            plan = run(store)
+            # The quota ran out partway through the details, so only some orders went in; the rest wait.
+            assert len(plan.toAdd) == 5 and len(shippo.created) <= 2
+            assert store.quotaUsed('bricklink')[1] == 6
+            before = bricklink.counts()['requests']
+            plan = run(store)
+        assert bricklink.counts()['requests'] == before
+        assert plan.toAdd == [] and len(shippo.created) <= 2
@@ -0,0 +1,35 @@
+# test_tenants.py
+# Written by Joel Peckham | joelskyler@gmail.com
+# Last Updated : Oct 17, 2026
+# One tenant crashing or hanging must not stop the others from getting a result.
+
+import os
+import time
+
+import tenants
+
+def _healthy(tenant, conn):
+    result = tenants.TenantResult(tenant.name)
+    result.ok, result.seconds, result.toAdd, result.toMarkShipped = True, 0.0, 0, 0
+    conn.send(result)
+    conn.close()
+
+def _crash(tenant, conn):
+    os._exit(137)
+
+def _hang(tenant, conn):
+    time.sleep(60)
+
+def _byName(tenant, conn):
+    {'ok': _healthy, 'crash': _crash, 'hang': _hang}[tenant.name](tenant, conn)
+
+def test_crashed_and_hung_tenants_get_failed_results(tmp_path):
+    accounts = [tenants.Tenant(name, str(tmp_path)) for name in ('crash', 'hang', 'ok')]
+    started = time.monotonic()
+    results = tenants.runTenants(accounts, workers=3, timeout=2, target=_byName)
+    assert time.monotonic() - started < 30
+    byName = {r.name: r for r in results}
+    assert [r.name for r in results] == ['crash', 'hang', 'ok']
+    assert byName['ok'].ok
+    assert not byName['crash'].ok and 'exited with code 137' in byName['crash'].error
+    assert not byName['hang'].ok and 'timed out' in byName['hang'].error
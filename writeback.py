@@ -0,0 +1,133 @@
+# writeback.py
+# Written by Joel Peckham | joelskyler@gmail.com
+# Last Updated : Oct 17, 2026
+# Pushes "shipped" and tracking numbers from Shippo back to the marketplaces.
+# Tracking numbers are gathered up front (from the Shippo listing, or in one
+# concurrent batch for the ones it didn't include), then every marketplace
+# update runs on that marketplace's own thread pool, so the slow host never
+# holds up the other one.
+# Each write-back is planned in the journal first, and every step recorded as it
+# finishes, so an order marked shipped by a run that then died still gets its
+# tracking number from the next run (resumeWriteBack).
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from journal import Journal
+from order import OrderStub
+
+# The wrappers already retry throttling and server errors, so this only covers
+# what they leave to us, like a 4xx or an error that outlasted their retries.
+WRITEBACK_RETRIES = 1           # Extra attempts per call after the first one fails.
+WRITEBACK_RETRY_DELAY = 1.0     # Seconds before the first retry, doubled each time.
+
+class WriteBackResult:
+    def __init__(self, source, order_id, trackingNumber=None):
+        self.source = source
+        self.id = order_id
+        self.trackingNumber = trackingNumber
+        self.shipped = False
+        self.tracked = False
+        self.error = None
+
+    @property
+    def ok(self):
+        return self.shipped and self.tracked
+
+    def __repr__(self):
+        state = 'ok' if self.ok else f'failed ({self.error})'
+        return f"WriteBackResult({self.source}, {self.id}, shipped: {self.shipped}, tracked: {self.tracked}, {state})"
+
+def _withRetry(call, retries=WRITEBACK_RETRIES, delay=WRITEBACK_RETRY_DELAY):
+    # The wrappers report failure either by returning False (BrickLink) or raising (Brick Owl).
+    # Returns (succeeded, last error message).
+    error = None
+    for attempt in range(retries + 1):
+        if attempt:
+            time.sleep(delay * 2 ** (attempt - 1))
+        try:
+            if call():
+                return True, None
+            error = 'request failed'
+        except Exception as e:
+            error = str(e)
+    return False, error
+
+def _writeBackOne(api, stub, trackingNumber, journal, alreadyShipped=False):
+    result = WriteBackResult(stub.source, stub.id, trackingNumber)
+    if alreadyShipped:
+        result.shipped = True
+    else:
+        result.shipped, result.error = _withRetry(lambda: api.shipped(stub.id))
+        if not result.shipped:
+            # The order is still open on the marketplace, so the next run's reconciliation finds it again.
+            journal.drop('ship', stub.source, stub.id, result.error)
+            journal.drop('track', stub.source, stub.id, 'not shipped')
+            return result
+        journal.done('ship', stub.source, stub.id)
+    if trackingNumber is None:
+        result.error = 'no tracking number in Shippo'
+        journal.failed('track', stub.source, stub.id, result.error)
+        return result
+    result.tracked, result.error = _withRetry(lambda: api.trackPackage(stub.id, trackingNumber))
+    if result.tracked:
+        journal.done('track', stub.source, stub.id)
+    else:
+        journal.failed('track', stub.source, stub.id, result.error)
+    return result
+
+def collectTrackingNumbers(stubs, shippoApi):
+    # Most stubs already carry their tracking number from the listing; look up the rest in one batch.
+    trackingNumbers = {s.shippoObjectId: s.trackingNumber for s in stubs if s.trackingNumber}
+    missing = [s.shippoObjectId for s in stubs if not s.trackingNumber and s.shippoObjectId]
+    if missing:
+        trackingNumbers.update(shippoApi.getTrackingNumbers(missing))
+    return trackingNumbers
+
+def _runWriteBacks(jobs, marketplaceApis, journal):
+    # jobs are (stub, tracking number, already shipped). Each marketplace gets its own thread pool.
+    pools = {source: ThreadPoolExecutor(max_workers=api.maxWorkers) for source, api in marketplaceApis.items()}
+    try:
+        futures = [pools[stub.source].submit(_writeBackOne, marketplaceApis[stub.source], stub, trackingNumber, journal, alreadyShipped)
+                   for stub, trackingNumber, alreadyShipped in jobs]
+        return [f.result() for f in futures]
+    finally:
+        for pool in pools.values():
+            pool.shutdown()
+
+def writeBack(shippedStubs, shippoApi, marketplaceApis, journal=None):
+    # shippedStubs are the Shippo stubs to mark shipped; marketplaceApis maps source -> API object.
+    # Returns a WriteBackResult for every stub we have an API for, in the same order.
+    journal = journal or Journal(None)
+    trackingNumbers = collectTrackingNumbers(shippedStubs, shippoApi)
+    stubs = []
+    for stub in shippedStubs:
+        if stub.source not in marketplaceApis:
+            logging.warning('No API for %s order %s, skipping write-back.', stub.source, stub.id)
+            continue
+        stubs.append(stub)
+    entries = [{'source': s.source, 'id': s.id, 'objectId': s.shippoObjectId, 'trackingNumber': trackingNumbers.get(s.shippoObjectId)} for s in stubs]
+    journal.plan('ship', entries)
+    journal.plan('track', entries)
+    return _runWriteBacks([(s, trackingNumbers.get(s.shippoObjectId), False) for s in stubs], marketplaceApis, journal)
+
+def resumeWriteBack(journal, shippoApi, marketplaceApis):
+    # Finishes the write-backs a run that died left in the journal: orders it may not have marked shipped,
+    # and orders it marked shipped without pushing their tracking numbers. Returns a WriteBackResult for each.
+    ships = journal.unfinished('ship')
+    shipping = {(r['source'], r['id']) for r in ships}
+    tracks = [r for r in journal.unfinished('track') if (r['source'], r['id']) not in shipping]
+    jobs = []
+    for records, alreadyShipped in ((ships, False), (tracks, True)):
+        for r in records:
+            if r['source'] not in marketplaceApis:
+                logging.warning("No API for %s order %s, leaving its write-back in the journal.", r['source'], r['id'])
+            elif journal.expired(r):
+                logging.error('Giving up on writing back %s order %s after %d tries.', r['source'], r['id'], r.get('attempts', 0))
+                journal.drop('ship', r['source'], r['id'], 'gave up')
+                journal.drop('track', r['source'], r['id'], 'gave up')
+            else:
+                jobs.append((OrderStub(r['source'], r['id'], 'SHIPPED', r.get('objectId'), r.get('trackingNumber')), alreadyShipped))
+    # Tracking numbers Shippo didn't have last time might be there now.
+    trackingNumbers = collectTrackingNumbers([stub for stub, _ in jobs], shippoApi)
+    return _runWriteBacks([(stub, trackingNumbers.get(stub.shippoObjectId), alreadyShipped) for stub, alreadyShipped in jobs], marketplaceApis, journal)